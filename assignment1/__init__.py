@@ -1,11 +1,18 @@
 import bpy
 import inspect
 
-from .genus import *
-from .boundaries import *
-from .volume import *
-from .components import *
-from .registration import *
+# Only the UI classes are imported here, everything else is loaded the first time it's used
+from .genus import MeshGenus
+from .boundaries import MeshBoundaryLoops, MeshSelectBoundaryLoop
+from .volume import MeshVolume
+from .components import MeshConnectedComponents, MeshSelectComponent, MeshSelectSmallComponents
+from .registration import ObjectICPRegistration, ObjectMultiViewRegistration
+from .analysis import (
+    MeshAnalysisResult, MeshAnalysisSettings, AnalyseSceneMeshes, WeldCoincidentVertices, SelectFailingMeshes,
+    AnalysisResultsList, SceneAnalysis, LiveTopology, start_live_topology, stop_live_topology,
+    stop_analysis
+)
+from .performance import ResetTimings, ProfileNextCall, ShowProfile, Performance, PROFILING_PROPERTY
 
 bl_info = {
     "name": "GDP Practical Assignment 1",
@@ -23,7 +30,23 @@ classes = [
     MeshGenus,
     MeshVolume,
     MeshConnectedComponents,
-    ObjectICPRegistration
+    MeshSelectComponent,
+    MeshSelectSmallComponents,
+    MeshSelectBoundaryLoop,
+    ObjectICPRegistration,
+    ObjectMultiViewRegistration,
+    MeshAnalysisResult,
+    MeshAnalysisSettings,
+    AnalyseSceneMeshes,
+    WeldCoincidentVertices,
+    SelectFailingMeshes,
+    AnalysisResultsList,
+    SceneAnalysis,
+    LiveTopology,
+    ResetTimings,
+    ProfileNextCall,
+    ShowProfile,
+    Performance,
 ]
 
 
@@ -39,8 +62,16 @@ def register():
             )
 
     bpy.types.VIEW3D_MT_object.append(ObjectICPRegistration.menu_func)
+    bpy.types.VIEW3D_MT_object.append(ObjectMultiViewRegistration.menu_func)
+    bpy.types.Scene.mesh_analysis = bpy.props.PointerProperty(type=MeshAnalysisSettings)
+    bpy.types.WindowManager.gdp_profiling = PROFILING_PROPERTY
+    start_live_topology()
 
 
 def unregister():
+    stop_live_topology()
+    stop_analysis()
+    del bpy.types.Scene.mesh_analysis
+    del bpy.types.WindowManager.gdp_profiling
     for c in classes:
         bpy.utils.unregister_class(c)
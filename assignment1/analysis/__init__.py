@@ -0,0 +1,484 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from ..lazy import lazy_exports
+
+import bpy
+from bpy.app.handlers import persistent
+
+# The analysis code needs numpy and scipy, which are slow to import, so it's only loaded once it's used
+__getattr__ = lazy_exports(__name__, ["snapshot", "topology", "validation", "incremental", "cache", "selection"])
+
+# Snapshots are analysed on worker threads, and the results are collected on the main thread by a timer.
+# The workers are started on first use, so they can be shut down when the add-on is disabled and started again
+_executor = None
+_pending = {}
+
+# The topology of the mesh being edited, updated from the previous edit rather than recomputed.
+# Edits only schedule an update, which runs once they pause, and the panel draws the last result
+_live_topology = {}
+_live_results = {}
+_LIVE_UPDATE_DELAY = 0.2
+
+CHECKS = [
+    ('OPEN', "Open", "Meshes with boundary loops"),
+    ('MULTIPLE_COMPONENTS', "Multiple Components", "Meshes made up of more than one connected component"),
+    ('UNEXPECTED_GENUS', "Unexpected Genus", "Meshes whose genus differs from the expected genus"),
+    ('INVALID', "Invalid", "Meshes with coincident vertices, non-manifold elements, degenerate or duplicate faces, "
+                           "or inconsistent winding (found when meshes are analysed with this check selected)"),
+]
+
+
+def fails_check(result, check: str, expected_genus: int) -> bool:
+    """
+    :param result: A `MeshAnalysisResult`.
+    :param check: One of the identifiers in `CHECKS`.
+    :param expected_genus: The genus every mesh should have, for the "UNEXPECTED_GENUS" check.
+    :return: True if the analysed mesh fails the check.
+    """
+    if result.error:
+        return True
+    if check == 'OPEN':
+        return result.boundary_loops > 0
+    elif check == 'MULTIPLE_COMPONENTS':
+        return result.components > 1
+    elif check == 'UNEXPECTED_GENUS':
+        return result.genus != expected_genus
+    elif check == 'INVALID':
+        return bool(result.problems)
+    return False
+
+
+class MeshAnalysisResult(bpy.types.PropertyGroup):
+    object: bpy.props.PointerProperty(name="Object", type=bpy.types.Object)
+    components: bpy.props.IntProperty(name="Components")
+    component_sizes: bpy.props.StringProperty(name="Component Sizes")
+    boundary_loops: bpy.props.IntProperty(name="Boundary Loops")
+    genus: bpy.props.IntProperty(name="Genus")
+    closed: bpy.props.BoolProperty(name="Closed")
+    volume: bpy.props.FloatProperty(name="Volume")
+    problems: bpy.props.StringProperty(name="Problems")
+    genus_reason: bpy.props.StringProperty(name="Genus Reason")
+    volume_reason: bpy.props.StringProperty(name="Volume Reason")
+    error: bpy.props.StringProperty(name="Error")
+
+
+class MeshAnalysisSettings(bpy.types.PropertyGroup):
+    results: bpy.props.CollectionProperty(type=MeshAnalysisResult)
+    active_index: bpy.props.IntProperty()
+    pending: bpy.props.IntProperty()
+    selected_only: bpy.props.BoolProperty(
+        name="Selected Only", description="Only analyse the selected meshes", default=False
+    )
+    check: bpy.props.EnumProperty(name="Check", description="Property every mesh should have", items=CHECKS)
+    expected_genus: bpy.props.IntProperty(name="Expected Genus", min=-1, default=0)
+    weld_distance: bpy.props.FloatProperty(
+        name="Weld Distance",
+        description="Treat vertices closer than this as one while analysing, e.g. for unwelded imports (0 to disable)",
+        min=0.0, default=0.0, precision=5, subtype='DISTANCE'
+    )
+    live_topology: bpy.props.BoolProperty(
+        name="Live Topology", description="Keep the topology of the mesh being edited up to date after each edit",
+        default=False, update=lambda settings, context: _forget_live_topology()
+    )
+
+
+def _store_result(settings: MeshAnalysisSettings, name: str, mesh_name: str, key: str, future) -> None:
+    item = settings.results.add()
+    item.name = name
+    item.object = bpy.data.objects.get(name)
+    try:
+        result = future.result()
+    except Exception as error:
+        item.error = str(error)
+        return
+
+    # Save the results with the mesh, so they don't need to be recomputed after reopening the file
+    from .cache import ANALYSIS_PROPERTY, store_result
+    mesh = bpy.data.meshes.get(mesh_name)
+    if mesh is not None and mesh.get(ANALYSIS_PROPERTY, {}).get("hash") != key:
+        store_result(mesh, key, result)
+
+    item.components = result["components"]
+    item.component_sizes = ", ".join(map(str, result["component_sizes"]))
+    item.boundary_loops = result["boundary_loops"]
+    item.genus = result["genus"]
+    item.closed = result["closed"]
+    item.volume = result["volume"]
+    item.problems = result["problems"]
+    item.genus_reason = result["genus_reason"]
+    item.volume_reason = result["volume_reason"]
+
+
+def _workers() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor()
+    return _executor
+
+
+def stop_analysis() -> None:
+    """Abandons analyses which haven't finished, and shuts down the worker threads."""
+    global _executor
+    if bpy.app.timers.is_registered(_collect_results):
+        bpy.app.timers.unregister(_collect_results)
+    _pending.clear()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _collect_results():
+    for scene_name in list(_pending):
+        scene = bpy.data.scenes.get(scene_name)
+        if scene is None:
+            del _pending[scene_name]
+            continue
+
+        # Collect finished analyses in order, so the table fills from the top
+        queue = _pending[scene_name]
+        while queue and queue[0][-1].done():
+            _store_result(scene.mesh_analysis, *queue.pop(0))
+        scene.mesh_analysis.pending = len(queue)
+        if not queue:
+            del _pending[scene_name]
+
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+    return 0.1 if _pending else None
+
+
+class AnalyseSceneMeshes(bpy.types.Operator):
+    bl_idname = "scene.analyse_meshes"
+    bl_label = "Analyse Meshes"
+    bl_description = "Compute components, boundary loops, genus and volume of every mesh in the background"
+
+    def execute(self, context):
+        from .snapshot import MeshSnapshot
+        from .topology import analyse_snapshot
+        from .cache import content_hash, load_result
+
+        settings = context.scene.mesh_analysis
+        candidates = context.selected_objects if settings.selected_only else context.view_layer.objects
+        objects = [obj for obj in candidates if obj.type == 'MESH']
+
+        # Full validation is only worth its cost when problems are being looked for, or welding may hide them
+        validate = settings.check == 'INVALID' or settings.weld_distance > 0
+
+        # Blender data can only be read on the main thread, so snapshot everything before handing off
+        queue, reused = [], 0
+        for obj in objects:
+            snapshot = MeshSnapshot.from_object(obj)
+            key = content_hash(snapshot, settings.weld_distance, validate)
+
+            # Meshes which haven't changed since they were last analysed (in any session) can be skipped
+            result = load_result(obj.data, key, obj.matrix_world)
+            if result is not None:
+                future = Future()
+                future.set_result(result)
+                reused += 1
+            else:
+                future = _workers().submit(analyse_snapshot, snapshot, settings.weld_distance, validate)
+            queue.append((obj.name, obj.data.name, key, future))
+
+        settings.results.clear()
+        settings.active_index = 0
+        settings.pending = len(queue)
+        _pending[context.scene.name] = queue
+        if not bpy.app.timers.is_registered(_collect_results):
+            bpy.app.timers.register(_collect_results)
+
+        self.report({'INFO'}, f"Analysing {len(queue) - reused} meshes ({reused} unchanged since their last analysis)")
+        return {'FINISHED'}
+
+
+class WeldCoincidentVertices(bpy.types.Operator):
+    bl_idname = "mesh.weld_coincident_vertices"
+    bl_label = "Weld Coincident Vertices"
+    bl_description = "Merge vertices closer than the weld distance in every selected mesh, e.g. after an unwelded import"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    distance: bpy.props.FloatProperty(
+        name="Distance", description="Vertices closer than this are merged",
+        min=0.0, default=0.0001, precision=5, subtype='DISTANCE'
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return any(obj.type == 'MESH' for obj in context.selected_objects)
+
+    def execute(self, context):
+        import bmesh
+        import numpy as np
+        from .snapshot import MeshSnapshot
+        from .validation import coincident_vertices
+
+        merged = 0
+        for obj in [obj for obj in context.selected_objects if obj.type == 'MESH']:
+            snapshot = MeshSnapshot.from_object(obj)
+            try:
+                targets = coincident_vertices(snapshot.vertices, self.distance)
+            except Exception as error:
+                self.report({'WARNING'}, f"Couldn't weld '{obj.name}': {error}")
+                continue
+            moved = np.flatnonzero(targets != np.arange(len(targets)))
+            if len(moved) == 0:
+                continue
+
+            # The matches are found in bulk, Blender's own weld keeps the mesh's attributes intact
+            in_edit_mode = obj.mode == 'EDIT'
+            mesh = bmesh.from_edit_mesh(obj.data) if in_edit_mode else bmesh.new()
+            if not in_edit_mode:
+                mesh.from_mesh(obj.data)
+            mesh.verts.ensure_lookup_table()
+            bmesh.ops.weld_verts(mesh, targetmap={mesh.verts[i]: mesh.verts[targets[i]] for i in moved})
+            if in_edit_mode:
+                bmesh.update_edit_mesh(obj.data)
+            else:
+                mesh.to_mesh(obj.data)
+                mesh.free()
+            merged += len(moved)
+
+        self.report({'INFO'}, f"Merged {merged} vertices")
+        return {'FINISHED'}
+
+
+class SelectFailingMeshes(bpy.types.Operator):
+    bl_idname = "scene.select_failing_meshes"
+    bl_label = "Select Failing"
+    bl_description = "Select the analysed meshes which fail the chosen check"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return len(context.scene.mesh_analysis.results) > 0
+
+    def execute(self, context):
+        settings = context.scene.mesh_analysis
+        failing = [
+            r.object for r in settings.results
+            if r.object is not None and fails_check(r, settings.check, settings.expected_genus)
+        ]
+
+        for obj in context.view_layer.objects:
+            obj.select_set(False)
+        for obj in failing:
+            if obj.name in context.view_layer.objects:
+                obj.select_set(True)
+        if failing:
+            context.view_layer.objects.active = failing[0]
+
+        self.report({'INFO'}, f"{len(failing)} meshes failed the check")
+        return {'FINISHED'}
+
+
+class AnalysisResultsList(bpy.types.UIList):
+    bl_idname = "MESH_UL_analysis_results"
+
+    sort_by: bpy.props.EnumProperty(
+        name="Sort By",
+        items=[
+            ('NAME', "Name", ""),
+            ('components', "Components", ""),
+            ('boundary_loops', "Boundary Loops", ""),
+            ('genus', "Genus", ""),
+            ('volume', "Volume", ""),
+        ]
+    )
+    failing_only: bpy.props.BoolProperty(
+        name="Failing Only", description="Only show meshes which fail the chosen check", default=False
+    )
+
+    def draw_item(self, context, layout, data, item, icon, active_data, active_property, index=0, flt_flag=0):
+        row = layout.row(align=True)
+        row.label(text=item.name, icon='ERROR' if item.error else 'OUTLINER_OB_MESH')
+        if item.error:
+            row.label(text=item.error)
+            return
+        if item.problems:
+            row.label(text="", icon='ERROR')
+        row.label(text=f"C: {item.components}")
+        row.label(text=f"L: {item.boundary_loops}")
+        row.label(text=f"G: {item.genus}")
+        row.label(text=f"V: {item.volume:.2f}" if item.closed else "V: open")
+
+    def draw_filter(self, context, layout):
+        row = layout.row(align=True)
+        row.prop(self, 'filter_name', text="")
+        row.prop(self, 'use_filter_sort_reverse', text="", icon='SORT_DESC')
+        row = layout.row(align=True)
+        row.prop(self, 'sort_by', text="")
+        row.prop(self, 'failing_only')
+
+    def filter_items(self, context, data, propname):
+        items = getattr(data, propname)
+        helpers = bpy.types.UI_UL_list
+
+        flags = helpers.filter_items_by_name(self.filter_name, self.bitflag_filter_item, items, "name")
+        if not flags:
+            flags = [self.bitflag_filter_item] * len(items)
+        if self.failing_only:
+            flags = [
+                flag if fails_check(item, data.check, data.expected_genus) else 0
+                for flag, item in zip(flags, items)
+            ]
+
+        if self.sort_by == 'NAME':
+            order = helpers.sort_items_by_name(items, "name")
+        else:
+            order = helpers.sort_items_helper(
+                [(i, getattr(item, self.sort_by)) for i, item in enumerate(items)], key=lambda pair: pair[1]
+            )
+        return flags, order
+
+
+class SceneAnalysis(bpy.types.Panel):
+    bl_idname = "VIEW3D_PT_SceneAnalysis"
+    bl_label = "Scene Analysis"
+
+    bl_category = "Practical 1"
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+
+    def draw(self, context):
+        layout = self.layout
+        settings = context.scene.mesh_analysis
+
+        row = layout.row(align=True)
+        row.operator(AnalyseSceneMeshes.bl_idname, icon='VIEWZOOM')
+        row.prop(settings, 'selected_only', text="", icon='RESTRICT_SELECT_OFF')
+        row = layout.row(align=True)
+        row.prop(settings, 'weld_distance')
+        weld = row.operator(WeldCoincidentVertices.bl_idname, text="", icon='AUTOMERGE_ON')
+        if settings.weld_distance > 0:
+            weld.distance = settings.weld_distance
+        if settings.pending:
+            layout.label(text=f"Analysing... ({settings.pending} remaining)")
+
+        layout.template_list(
+            AnalysisResultsList.bl_idname, "", settings, "results", settings, "active_index"
+        )
+
+        # Details of the highlighted mesh
+        if 0 <= settings.active_index < len(settings.results):
+            item = settings.results[settings.active_index]
+            if item.component_sizes:
+                layout.label(text=f"Component sizes: {item.component_sizes}")
+            if item.problems:
+                layout.label(text=f"Problems: {item.problems}", icon='ERROR')
+            if item.genus_reason:
+                layout.label(text=f"Genus: {item.genus_reason}")
+            if item.volume_reason:
+                layout.label(text=f"Volume: {item.volume_reason}")
+
+        box = layout.box()
+        box.prop(settings, 'check')
+        if settings.check == 'UNEXPECTED_GENUS':
+            box.prop(settings, 'expected_genus')
+        box.operator(SelectFailingMeshes.bl_idname, icon='RESTRICT_SELECT_OFF')
+
+
+def _update_live_topology():
+    import bmesh
+    from .snapshot import MeshSnapshot
+    from .incremental import IncrementalTopology
+
+    # Only the mesh being edited is tracked, each edit updates the topology found after the previous one
+    if not bpy.context.scene.mesh_analysis.live_topology:
+        return None
+    obj = bpy.context.active_object
+    if obj is None or obj.type != 'MESH' or obj.mode != 'EDIT':
+        return None
+    if obj.name not in _live_topology:
+        _live_topology.clear()
+        _live_results.clear()
+        _live_topology[obj.name] = IncrementalTopology()
+
+    # The edit mesh is read directly, since writing it back to the object would be reported as another edit
+    snapshot = MeshSnapshot.from_bmesh(bmesh.from_edit_mesh(obj.data), obj.name)
+    _live_results[obj.name] = _live_topology[obj.name].update(snapshot)
+
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+    return None
+
+
+def _schedule_live_update(delay: float = _LIVE_UPDATE_DELAY) -> None:
+    # Restarting the timer on every change keeps it from running until the edits pause
+    if bpy.app.timers.is_registered(_update_live_topology):
+        bpy.app.timers.unregister(_update_live_topology)
+    bpy.app.timers.register(_update_live_topology, first_interval=delay)
+
+
+@persistent
+def live_topology_changed(scene, depsgraph):
+    """Schedules an update of the live topology whenever the geometry of the mesh being edited changes."""
+    # Tracking is opt-in, so edits cost nothing extra unless the panel has turned it on
+    if not scene.mesh_analysis.live_topology:
+        return
+    obj = bpy.context.active_object
+    if obj is None or obj.type != 'MESH' or obj.mode != 'EDIT':
+        return
+    if any(update.is_updated_geometry and update.id.original == obj.data for update in depsgraph.updates):
+        _schedule_live_update()
+
+
+def start_live_topology() -> None:
+    """Starts tracking the topology of meshes in Edit Mode."""
+    if live_topology_changed not in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.append(live_topology_changed)
+
+
+def stop_live_topology() -> None:
+    """Stops tracking the topology of meshes in Edit Mode, and forgets what was tracked."""
+    if live_topology_changed in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(live_topology_changed)
+    _forget_live_topology()
+
+
+def _forget_live_topology() -> None:
+    if bpy.app.timers.is_registered(_update_live_topology):
+        bpy.app.timers.unregister(_update_live_topology)
+    _live_topology.clear()
+    _live_results.clear()
+
+
+class LiveTopology(bpy.types.Panel):
+    bl_idname = "VIEW3D_PT_LiveTopology"
+    bl_label = "Live Topology"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    bl_category = "Practical 1"
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'EDIT_MESH' and context.active_object is not None
+
+    def draw_header(self, context):
+        self.layout.prop(context.scene.mesh_analysis, 'live_topology', text="")
+
+    def draw(self, context):
+        # Drawing only shows the result of the last update, updates are run by a timer after each edit
+        layout = self.layout
+        if not context.scene.mesh_analysis.live_topology:
+            layout.label(text="Enable to update the topology after each edit")
+            return
+        result = _live_results.get(context.active_object.name)
+        if result is None:
+            if not bpy.app.timers.is_registered(_update_live_topology):
+                _schedule_live_update(0.0)
+            layout.label(text="Updating...", icon='TIME')
+            return
+
+        layout.label(text=f"Components: {result['components']}")
+        layout.label(text=f"Boundary loops: {result['boundary_loops']}")
+        layout.label(text=f"Genus: {result['genus']}")
+        row = layout.row()
+        row.enabled = False
+        row.label(text="Updated from the last edit" if result["incremental"] else "Recomputed", icon='INFO')
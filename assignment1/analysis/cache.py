@@ -0,0 +1,80 @@
+import hashlib
+
+import bpy
+import numpy as np
+
+from .snapshot import MeshSnapshot
+from .topology import transformed_volume
+
+# Name of the custom property used to store analysis results on mesh datablocks
+ANALYSIS_PROPERTY = "gdp_analysis"
+
+# Results which don't depend on the object's transformation, and so can be stored on the (shareable) mesh
+STORED_KEYS = [
+    "components", "component_sizes", "boundary_loops", "genus", "closed", "local_volume",
+    "problems", "genus_reason", "volume_reason",
+]
+
+
+def content_hash(snapshot: MeshSnapshot, weld_distance: float = 0.0, validate: bool = False) -> str:
+    """
+    Hashes the geometry and connectivity of a mesh.
+
+    The arrays are hashed as raw memory, so this runs at memory bandwidth rather than once per element.
+    Any change to vertex positions or to the mesh's topology produces a different hash.
+
+    :param snapshot: The mesh to hash (in object space, the world transformation is not included).
+    :param weld_distance: (optional) The weld distance the mesh is analysed with, which changes the results.
+    :param validate: (optional) Whether the mesh is validated as it's analysed, which adds to the results.
+    :return: A hexadecimal digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in [snapshot.vertices, snapshot.edges, snapshot.loop_vertices, snapshot.loop_starts, snapshot.loop_totals]:
+        digest.update(np.ascontiguousarray(array).view(np.uint8))
+        digest.update(np.int64(len(array)).tobytes())
+    if weld_distance > 0:
+        digest.update(np.float64(weld_distance).tobytes())
+    if validate:
+        digest.update(b"validated")
+    return digest.hexdigest()
+
+
+def load_result(mesh: bpy.types.Mesh, key: str, matrix_world=None) -> dict:
+    """
+    Looks up analysis results stored on a mesh datablock.
+
+    :param mesh: The mesh datablock.
+    :param key: The current content hash of the mesh (see `content_hash()`).
+    :param matrix_world: (optional) World transformation of the object, used to find the world-space volume.
+    :return: The stored results (in the format of `analyse_snapshot()`),
+             or None if nothing is stored or the mesh has changed since the results were stored.
+    """
+    stored = mesh.get(ANALYSIS_PROPERTY)
+    if stored is None or stored.get("hash") != key:
+        return None
+    result = {name: stored[name] for name in STORED_KEYS if name in stored}
+    if len(result) != len(STORED_KEYS):
+        return None
+
+    result["name"] = mesh.name
+    result["component_sizes"] = list(result["component_sizes"])
+    result["closed"] = bool(result["closed"])
+    result["volume"] = transformed_volume(
+        result["local_volume"], result["closed"], np.eye(4) if matrix_world is None else matrix_world
+    )
+    return result
+
+
+def store_result(mesh: bpy.types.Mesh, key: str, result: dict) -> bool:
+    """
+    Stores analysis results on a mesh datablock, so they're saved in the .blend file.
+
+    :param mesh: The mesh datablock.
+    :param key: The content hash of the mesh the results were computed for (see `content_hash()`).
+    :param result: Results produced by `analyse_snapshot()`.
+    :return: False if the mesh can't be modified (e.g. it's linked from a library).
+    """
+    if mesh.library is not None:
+        return False
+    mesh[ANALYSIS_PROPERTY] = {"hash": key, **{name: result[name] for name in STORED_KEYS}}
+    return True
@@ -0,0 +1,303 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from .snapshot import MeshSnapshot
+from .topology import boundary_loop_labels, edge_face_counts, genus
+from ..performance.profiling import profiled
+
+
+def _common_prefix(old: np.ndarray, new: np.ndarray, chunk: int = 1024) -> int:
+    # Number of equal rows at the start of both arrays, compared in growing chunks so an early difference stops the scan
+    common = min(len(old), len(new))
+    start = 0
+    while start < common:
+        stop = min(start + chunk, common)
+        differ = np.any((old[start:stop] != new[start:stop]).reshape(stop - start, -1), axis=1)
+        first = int(np.argmax(differ))
+        if differ[first]:
+            return start + first
+        start, chunk = stop, chunk * 2
+    return common
+
+
+def _changed_window(old: np.ndarray, new: np.ndarray) -> tuple[int, int, int]:
+    # The rows between the longest common prefix and suffix of two arrays, as (start, old stop, new stop).
+    # Rows after the window are the same in both, shifted if rows were inserted or removed (as when Blender
+    # compacts its arrays after a deletion), so a local edit gives a small window wherever it happens.
+    start = _common_prefix(old, new)
+    end = _common_prefix(old[start:][::-1], new[start:][::-1])
+    return start, len(old) - end, len(new) - end
+
+
+def _edge_keys(edges: np.ndarray, num_vertices: int) -> np.ndarray:
+    return np.min(edges, axis=1) * num_vertices + np.max(edges, axis=1)
+
+
+class IncrementalLabels:
+    """
+    Connected components of a graph over a mesh's vertices, kept up to date as edges are added and removed.
+
+    Components are stored as a union-find forest over labels: each vertex has a label, and each label
+    points (through `parent`) to the label representing its component.
+    Adding edges only merges labels. Removing edges relabels the vertices of the components they belonged to,
+    leaving every other component untouched.
+    """
+
+    def __init__(self, num_vertices: int, edges: np.ndarray, isolated: bool = True):
+        """
+        :param num_vertices: The number of vertices in the graph.
+        :param edges: The graph's edges, a [k, 2] matrix of vertex indices.
+        :param isolated: Whether vertices without edges count as components of their own.
+                         Otherwise they're left unlabelled (-1), as for boundary loops.
+        """
+        self.isolated = isolated
+        self.reset(num_vertices, edges)
+
+    def reset(self, num_vertices: int, edges: np.ndarray) -> None:
+        """Recomputes the components from scratch."""
+        self.labels = np.full(num_vertices, -1, dtype=np.int64)
+        self.parent = np.zeros(0, dtype=np.int64)
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.first = np.zeros(0, dtype=np.int64)
+        self._label(np.arange(num_vertices), edges)
+
+    def _add_labels(self, vertices: np.ndarray, local: np.ndarray, count: int) -> None:
+        offset = len(self.parent)
+        self.labels[vertices] = offset + local
+        self.parent = np.concatenate([self.parent, offset + np.arange(count)])
+        self.sizes = np.concatenate([self.sizes, np.bincount(local, minlength=count)])
+        first = np.full(count, np.iinfo(np.int64).max)
+        np.minimum.at(first, local, vertices)
+        self.first = np.concatenate([self.first, first])
+
+    def _label(self, vertices: np.ndarray, edges: np.ndarray) -> None:
+        # Labels a set of vertices from the edges between them
+        index = np.full(len(self.labels), -1, dtype=np.int64)
+        index[vertices] = np.arange(len(vertices))
+        local_edges = index[edges]
+        graph = coo_matrix(
+            (np.ones(len(local_edges)), (local_edges[:, 0], local_edges[:, 1])), shape=(len(vertices), len(vertices))
+        )
+        local = connected_components(graph, directed=False)[1]
+        if not self.isolated:
+            connected = np.zeros(len(vertices), dtype=bool)
+            connected[local_edges.ravel()] = True
+            vertices, local = vertices[connected], local[connected]
+        if len(vertices):
+            _, local = np.unique(local, return_inverse=True)
+            self._add_labels(vertices, local.ravel(), int(local.max(initial=-1)) + 1)
+
+    def _compress(self) -> np.ndarray:
+        # Points every label directly at its root
+        while True:
+            grandparent = self.parent[self.parent]
+            if np.array_equal(grandparent, self.parent):
+                return self.parent
+            self.parent = grandparent
+
+    def roots(self) -> np.ndarray:
+        """:return: The component of each vertex (the label of its root), or -1 for unlabelled vertices."""
+        parent = self._compress()
+        return np.where(self.labels >= 0, parent[np.maximum(self.labels, 0)], -1)
+
+    def update(self, num_vertices: int, edges: np.ndarray, added: np.ndarray, removed: np.ndarray) -> None:
+        """
+        Updates the components after the graph has changed.
+
+        :param num_vertices: The new number of vertices, no fewer than before (new vertices are appended).
+        :param edges: Every edge of the new graph, a [k, 2] matrix of vertex indices.
+        :param added: The edges which were added.
+        :param removed: The edges which were removed.
+        """
+        new_vertices = np.arange(len(self.labels), num_vertices)
+        self.labels = np.concatenate([self.labels, np.full(len(new_vertices), -1, dtype=np.int64)])
+        if self.isolated and len(new_vertices):
+            self._add_labels(new_vertices, np.arange(len(new_vertices)), len(new_vertices))
+
+        # The components losing edges may have split, so their vertices are labelled again from their remaining edges
+        if len(removed):
+            roots = self.roots()
+            affected = np.unique(roots[removed.ravel()])
+            affected = affected[affected >= 0]
+            region = np.isin(roots, affected)
+            self.sizes[affected] = 0
+            self.labels[region] = -1
+            self._label(np.flatnonzero(region), edges[region[edges[:, 0]] & region[edges[:, 1]]])
+
+        # New edges can only join components
+        if len(added):
+            unlabelled = np.unique(added.ravel()[self.labels[added.ravel()] < 0])
+            if len(unlabelled):
+                self._add_labels(unlabelled, np.arange(len(unlabelled)), len(unlabelled))
+            self._merge(self._compress()[self.labels[added]])
+
+    def _merge(self, pairs: np.ndarray) -> None:
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        if len(pairs) == 0:
+            return
+        involved, local = np.unique(pairs, return_inverse=True)
+        local = local.reshape([-1, 2])
+        graph = coo_matrix((np.ones(len(local)), (local[:, 0], local[:, 1])), shape=(len(involved), len(involved)))
+        groups = connected_components(graph, directed=False)[1]
+
+        # Each group of roots is merged into its lowest label
+        targets = np.full(groups.max() + 1, np.iinfo(np.int64).max)
+        np.minimum.at(targets, groups, involved)
+        targets = targets[groups]
+        sizes, first = self.sizes[involved], self.first[involved]
+        self.sizes[involved] = 0
+        np.add.at(self.sizes, targets, sizes)
+        np.minimum.at(self.first, targets, first)
+        self.parent[involved] = targets
+
+    @property
+    def count(self) -> int:
+        """The number of components."""
+        return int(np.count_nonzero((self.parent == np.arange(len(self.parent))) & (self.sizes > 0)))
+
+    def component_sizes(self) -> list[int]:
+        """
+        :return: The number of vertices in each component, in the order `mesh_connected_components()` lists them
+                 (by their lowest vertex index).
+        """
+        live = np.flatnonzero((self.parent == np.arange(len(self.parent))) & (self.sizes > 0))
+        return self.sizes[live[np.argsort(self.first[live])]].tolist()
+
+
+class IncrementalTopology:
+    """
+    Keeps the components, boundary loops and genus of a mesh up to date while it's being edited.
+
+    Each update finds the window of edges and corners which changed since the previous version of the mesh,
+    between the parts at the start and end which didn't. This holds up when Blender compacts its arrays
+    after a deletion (moving every later element down) or reuses freed slots: edges in the window are matched
+    by their vertices, and corners are compared through that matching.
+    Only the components and boundary loops touching a change are relabelled,
+    and face counts per edge are updated by the corners which changed.
+    Labels are kept by vertex index, so edits which remove vertices (and renumber the rest) fall back to
+    a full recomputation, as do edits changing more than a fraction of the mesh. Renumbering which keeps
+    the vertex count (e.g. sorting the vertices, or deleting some and adding as many) is caught by comparing
+    the positions of the vertices which were there before: moving a few is an edit like any other,
+    but when more than a fraction of them differ, everything is recomputed.
+    Boundary loops are tracked by the vertices they share, so while loops touch at a vertex
+    they're counted with `boundary_loop_labels()` instead.
+    """
+
+    def __init__(self, max_changes: float = 0.25):
+        """
+        :param max_changes: When more than this fraction of the mesh's edges or corners changed,
+                            everything is recomputed rather than updated.
+        """
+        self.max_changes = max_changes
+        self.snapshot = None
+
+    def _rebuild(self, snapshot: MeshSnapshot) -> None:
+        self.counts = edge_face_counts(snapshot)
+        self.components = IncrementalLabels(snapshot.num_vertices, snapshot.edges)
+        self.loops = IncrementalLabels(snapshot.num_vertices, snapshot.edges[self.counts == 1], isolated=False)
+
+    @profiled("analysis.incremental")
+    def update(self, snapshot: MeshSnapshot) -> dict:
+        """
+        Brings the topology up to date with a new version of the mesh.
+
+        :param snapshot: The mesh as it is now.
+        :return: A dictionary with the component count and sizes, boundary loop count and genus
+                 (as in `analyse_snapshot()`), and whether the update was incremental (`incremental`).
+        """
+        old = self.snapshot
+        incremental = (
+            old is not None and snapshot.num_vertices >= old.num_vertices
+            # Relabelling leaves unused labels behind, which are cleared out once they outnumber the vertices
+            and len(self.components.parent) + len(self.loops.parent) <= 4 * snapshot.num_vertices + 1024
+        )
+        if incremental:
+            incremental = self._apply(old, snapshot)
+        if not incremental:
+            self._rebuild(snapshot)
+        self.snapshot = snapshot
+
+        num_components, num_loops = self.components.count, self.loops.count
+        # Loops touching at a vertex are only told apart by following the faces around it
+        boundary = snapshot.edges[self.counts == 1]
+        if len(boundary) and np.bincount(boundary.ravel()).max() > 2:
+            num_loops = boundary_loop_labels(snapshot)[1]
+        return {
+            "components": num_components,
+            "component_sizes": self.components.component_sizes(),
+            "boundary_loops": num_loops,
+            "genus": genus(snapshot.num_vertices, snapshot.num_edges, snapshot.num_faces, num_components, num_loops),
+            "incremental": incremental,
+        }
+
+    def _too_many(self, window: tuple[int, int, int], total: int) -> bool:
+        start, old_stop, new_stop = window
+        return max(old_stop, new_stop) - start > self.max_changes * max(total, 1)
+
+    def _apply(self, old: MeshSnapshot, new: MeshSnapshot) -> bool:
+        # Returns False, changing nothing, when the edit is too large to be worth updating
+        # or the existing vertices may have been renumbered
+        if self._too_many(_changed_window(old.vertices, new.vertices[:old.num_vertices]), old.num_vertices):
+            return False
+        edge_window = _changed_window(old.edges, new.edges)
+        if self._too_many(edge_window, new.num_edges):
+            return False
+        start, old_stop, new_stop = edge_window
+
+        # Where each old edge is now (-1 for removed edges): edges before the window stay put, edges after it shift,
+        # and edges within it are found by their vertices
+        old_keys = _edge_keys(old.edges[start:old_stop], new.num_vertices)
+        new_keys = _edge_keys(new.edges[start:new_stop], new.num_vertices)
+        slots, found = np.zeros(len(old_keys), dtype=np.int64), np.zeros(len(old_keys), dtype=bool)
+        if len(new_keys):
+            order = np.argsort(new_keys)
+            slots = order[np.minimum(np.searchsorted(new_keys[order], old_keys), len(order) - 1)]
+            found = new_keys[slots] == old_keys
+        kept = np.zeros(new_stop - start, dtype=bool)
+        kept[slots[found]] = True
+        window_map = np.where(found, start + slots, -1)
+
+        # Corners are compared by the (current) index of their edge
+        if old_stop == new_stop and np.array_equal(window_map, np.arange(start, old_stop)):
+            mapped = old.loop_edges
+        else:
+            edge_map = np.concatenate([
+                np.arange(start), window_map, np.arange(old_stop, old.num_edges) + (new_stop - old_stop)
+            ])
+            mapped = edge_map[old.loop_edges]
+        corner_start, old_corner_stop, new_corner_stop = corner_window = _changed_window(mapped, new.loop_edges)
+        if self._too_many(corner_window, len(new.loop_edges)):
+            return False
+        if start == old_stop == new_stop and corner_start == old_corner_stop == new_corner_stop:
+            if new.num_vertices != old.num_vertices:
+                none = new.edges[:0]
+                self.components.update(new.num_vertices, new.edges, none, none)
+                self.loops.update(new.num_vertices, none, none, none)
+            return True
+
+        # Face counts carried over to where each edge is now, then changed by the corners which moved off or onto it
+        old_counts = self.counts
+        carried = np.zeros(new.num_edges, dtype=np.int64)
+        carried[:start] = old_counts[:start]
+        carried[new_stop:] = old_counts[old_stop:]
+        carried[window_map[found]] = old_counts[start:old_stop][found]
+        counts = carried.copy()
+        leaving = mapped[corner_start:old_corner_stop]
+        leaving = leaving[leaving >= 0]
+        arriving = new.loop_edges[corner_start:new_corner_stop]
+        np.subtract.at(counts, leaving, 1)
+        np.add.at(counts, arriving, 1)
+        self.counts = counts
+
+        removed = start + np.flatnonzero(~found)
+        added = start + np.flatnonzero(~kept)
+        self.components.update(new.num_vertices, new.edges, new.edges[added], old.edges[removed])
+
+        # Boundary edges change where an edge was removed or added, or its face count changed
+        touched = np.unique(np.concatenate([np.arange(start, new_stop), leaving, arriving]))
+        before, after = carried[touched] == 1, counts[touched] == 1
+        opened = new.edges[touched[after & ~before]]
+        closed = np.concatenate([old.edges[removed[old_counts[removed] == 1]], new.edges[touched[before & ~after]]])
+        self.loops.update(new.num_vertices, new.edges[counts == 1], opened, closed)
+        return True
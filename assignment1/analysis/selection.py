@@ -0,0 +1,55 @@
+import bpy
+import numpy as np
+
+from .snapshot import MeshSnapshot
+
+
+def select_vertices(obj: bpy.types.Object, mask: np.ndarray, extend: bool = False) -> int:
+    """
+    Replaces the vertex selection of a mesh object, writing each selection layer in a single call.
+
+    Edges and faces are selected when all of their vertices are, matching Blender's vertex selection mode.
+    Works in both object and edit mode.
+
+    :param obj: A mesh object.
+    :param mask: Boolean array with one entry per vertex, the vertices to select.
+    :param extend: Whether to keep the existing selection, rather than replacing it.
+    :return: The number of selected vertices.
+    """
+    in_edit_mode = obj.mode == 'EDIT'
+    if in_edit_mode:
+        # Edit mode keeps its own copy of the selection, which would overwrite ours
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    mesh = obj.data
+    snapshot = MeshSnapshot.from_mesh(mesh)
+    mask = np.asarray(mask, dtype=bool)
+    if extend:
+        current = np.zeros(len(mesh.vertices), dtype=bool)
+        mesh.vertices.foreach_get("select", current)
+        mask = mask | current
+
+    mesh.vertices.foreach_set("select", mask)
+    mesh.edges.foreach_set("select", np.all(mask[snapshot.edges], axis=1))
+    if snapshot.num_faces:
+        mesh.polygons.foreach_set(
+            "select", np.logical_and.reduceat(mask[snapshot.loop_vertices], snapshot.loop_starts)
+        )
+    mesh.update()
+
+    if in_edit_mode:
+        bpy.ops.object.mode_set(mode='EDIT')
+    return int(np.count_nonzero(mask))
+
+
+def select_labels(obj: bpy.types.Object, labels: np.ndarray, selected, extend: bool = False) -> int:
+    """
+    Selects every vertex whose label is in a chosen set of labels.
+
+    :param obj: A mesh object.
+    :param labels: Integer array with one label per vertex (e.g. from `component_labels()`).
+    :param selected: The label (or collection of labels) to select.
+    :param extend: Whether to keep the existing selection, rather than replacing it.
+    :return: The number of selected vertices.
+    """
+    return select_vertices(obj, np.isin(labels, selected), extend)
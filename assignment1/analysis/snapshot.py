@@ -0,0 +1,160 @@
+import bpy
+import bmesh
+import numpy as np
+
+from ..performance.profiling import profiled
+
+
+def _next_corners(loop_starts: np.ndarray, loop_totals: np.ndarray) -> np.ndarray:
+    following = np.arange(int(np.sum(loop_totals))) + 1
+    following[loop_starts + loop_totals - 1] = loop_starts
+    return following
+
+
+class MeshSnapshot:
+    """
+    A copy of a mesh's geometry and connectivity as numpy arrays.
+
+    Snapshots are read in bulk (with `foreach_get`) on the main thread,
+    after which they can be analysed anywhere, including on worker threads where Blender data must not be touched.
+
+    Polygons are stored the same way Blender stores them:
+    the corners of polygon i are `loop_vertices[loop_starts[i]:loop_starts[i] + loop_totals[i]]`,
+    and `loop_edges` holds the edge leaving each corner.
+    """
+
+    def __init__(
+        self,
+        vertices: np.ndarray,
+        edges: np.ndarray,
+        loop_vertices: np.ndarray,
+        loop_edges: np.ndarray,
+        loop_starts: np.ndarray,
+        loop_totals: np.ndarray,
+        matrix_world: np.ndarray = None,
+        name: str = "",
+    ):
+        self.vertices = vertices
+        self.edges = edges
+        self.loop_vertices = loop_vertices
+        self.loop_edges = loop_edges
+        self.loop_starts = loop_starts
+        self.loop_totals = loop_totals
+        self.matrix_world = np.eye(4) if matrix_world is None else np.asarray(matrix_world, dtype=np.float64)
+        self.name = name
+
+    @property
+    def num_vertices(self) -> int:
+        return len(self.vertices)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edges)
+
+    @property
+    def num_faces(self) -> int:
+        return len(self.loop_starts)
+
+    @property
+    def loop_faces(self) -> np.ndarray:
+        """The polygon each corner belongs to."""
+        return np.repeat(np.arange(self.num_faces), self.loop_totals)
+
+    @property
+    def next_corners(self) -> np.ndarray:
+        """The corner following each corner around its polygon."""
+        return _next_corners(self.loop_starts, self.loop_totals)
+
+    @classmethod
+    def from_polygons(
+        cls,
+        vertices: np.ndarray,
+        loop_vertices: np.ndarray,
+        loop_totals: np.ndarray,
+        matrix_world: np.ndarray = None,
+        name: str = "",
+        loose_edges: np.ndarray = None,
+    ) -> "MeshSnapshot":
+        """
+        Builds a snapshot from polygons alone, deriving the edges from their sides.
+
+        :param vertices: Vertex positions, an [n, 3] numpy matrix.
+        :param loop_vertices: The corners of every polygon, one after another.
+        :param loop_totals: The number of corners of each polygon.
+        :param matrix_world: (optional) World transformation of the mesh.
+        :param name: (optional) A name for the snapshot.
+        :param loose_edges: (optional) Edges which don't belong to any polygon, a [k, 2] matrix of vertex indices.
+        :return: A new MeshSnapshot, with edges sorted by their vertex indices.
+        """
+        loop_vertices = np.asarray(loop_vertices, dtype=np.int64)
+        loop_totals = np.asarray(loop_totals, dtype=np.int64)
+        loop_starts = np.cumsum(loop_totals) - loop_totals
+
+        sides = np.stack([loop_vertices, loop_vertices[_next_corners(loop_starts, loop_totals)]], axis=1)
+        if loose_edges is not None:
+            sides = np.concatenate([sides, np.asarray(loose_edges, dtype=np.int64).reshape([-1, 2])])
+        vertices = np.asarray(vertices, dtype=np.float64).reshape([-1, 3])
+        sides = np.sort(sides, axis=1)
+        keys, inverse = np.unique(sides[:, 0] * len(vertices) + sides[:, 1], return_inverse=True)
+        edges = np.stack([keys // len(vertices), keys % len(vertices)], axis=1)
+        return cls(
+            vertices, edges, loop_vertices, inverse.ravel()[:len(loop_vertices)], loop_starts, loop_totals,
+            matrix_world, name
+        )
+
+    @classmethod
+    @profiled("extract")
+    def from_mesh(cls, mesh: bpy.types.Mesh, matrix_world=None, name: str = None) -> "MeshSnapshot":
+        """
+        Reads a snapshot of a mesh datablock.
+
+        :param mesh: The mesh to read.
+        :param matrix_world: (optional) World transformation of the object using the mesh.
+        :param name: (optional) A name for the snapshot, defaults to the name of the mesh.
+        :return: A new MeshSnapshot.
+        """
+        vertices = np.zeros(len(mesh.vertices) * 3, dtype=np.float64)
+        mesh.vertices.foreach_get("co", vertices)
+        edges = np.zeros(len(mesh.edges) * 2, dtype=np.int64)
+        mesh.edges.foreach_get("vertices", edges)
+        loop_vertices = np.zeros(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get("vertex_index", loop_vertices)
+        loop_edges = np.zeros(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get("edge_index", loop_edges)
+        loop_starts = np.zeros(len(mesh.polygons), dtype=np.int64)
+        mesh.polygons.foreach_get("loop_start", loop_starts)
+        loop_totals = np.zeros(len(mesh.polygons), dtype=np.int64)
+        mesh.polygons.foreach_get("loop_total", loop_totals)
+        return cls(
+            vertices.reshape([-1, 3]), edges.reshape([-1, 2]),
+            loop_vertices, loop_edges, loop_starts, loop_totals,
+            matrix_world, mesh.name if name is None else name
+        )
+
+    @classmethod
+    def from_object(cls, obj: bpy.types.Object) -> "MeshSnapshot":
+        """
+        Reads a snapshot of a mesh object, including its world transformation.
+
+        :param obj: A mesh object.
+        :return: A new MeshSnapshot.
+        """
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()
+        return cls.from_mesh(obj.data, obj.matrix_world, obj.name)
+
+    @classmethod
+    def from_bmesh(cls, mesh: bmesh.types.BMesh, name: str = "") -> "MeshSnapshot":
+        """
+        Reads a snapshot of a BMesh.
+
+        :param mesh: The BMesh to read.
+        :param name: (optional) A name for the snapshot.
+        :return: A new MeshSnapshot.
+        """
+        data = bpy.data.meshes.new("tmp")
+        try:
+            mesh.to_mesh(data)
+            return cls.from_mesh(data, name=name)
+        finally:
+            bpy.data.meshes.remove(data)
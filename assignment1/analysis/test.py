@@ -0,0 +1,231 @@
+import unittest
+import bpy
+import numpy as np
+from .snapshot import MeshSnapshot
+from .topology import analyse_snapshot, component_labels, boundary_loop_labels
+from .validation import coincident_vertices, weld_snapshot, validate_snapshot
+from .incremental import IncrementalTopology
+from .cache import content_hash, load_result, store_result
+from .selection import select_labels
+from ..components.connected_components import mesh_connected_components
+from ..boundaries.boundary_loops import mesh_boundary_loops
+from data import primitives, meshes
+
+
+class TestAnalysis(unittest.TestCase):
+
+    def assertMatchesBMeshFunctions(self, mesh):
+        snapshot = MeshSnapshot.from_bmesh(mesh)
+
+        labels, num_components = component_labels(snapshot)
+        components = mesh_connected_components(mesh)
+        self.assertEqual(num_components, len(components))
+        for i, component in enumerate(components):
+            self.assertEqual({v.index for v in component}, set(map(int, (labels == i).nonzero()[0])))
+
+        labels, num_loops = boundary_loop_labels(snapshot)
+        loops = mesh_boundary_loops(mesh)
+        self.assertEqual(num_loops, len(loops))
+        self.assertEqual(
+            sorted(len(loop) for loop in loops), sorted(int((labels == i).sum()) for i in range(num_loops))
+        )
+
+    def test_matches_bmesh_functions(self):
+        for mesh in [primitives.CUBE, primitives.TORUS, meshes.DOUBLE_TORUS, meshes.BAGEL_CUT_TORUS,
+                     meshes.HALF_BAGEL_CUT_TORUS, meshes.HALF_TORUS, meshes.TWO_TORI]:
+            self.assertMatchesBMeshFunctions(mesh)
+
+    def test_double_toroid(self):
+        result = analyse_snapshot(MeshSnapshot.from_bmesh(meshes.DOUBLE_TORUS))
+        self.assertEqual(result["components"], 1)
+        self.assertEqual(result["boundary_loops"], 0)
+        self.assertEqual(result["genus"], 2, "The double toroid should have genus 2")
+        self.assertEqual(result["volume"], 2.3324, "The double toroid should have volume 2.3324")
+
+    def test_bagel_cut_torus(self):
+        result = analyse_snapshot(MeshSnapshot.from_bmesh(meshes.BAGEL_CUT_TORUS))
+        self.assertEqual(result["components"], 2)
+        self.assertEqual(result["boundary_loops"], 4)
+        self.assertFalse(result["closed"])
+        self.assertEqual(result["volume"], -1, "The bagel cut torus should have volume -1")
+
+    def test_two_tori(self):
+        result = analyse_snapshot(MeshSnapshot.from_bmesh(meshes.TWO_TORI))
+        self.assertEqual(result["components"], 2)
+        self.assertEqual(result["genus"], -1, "The two tori should have an undefined genus")
+        self.assertEqual(result["volume"], 2.3494, "The two tori should have volume 2.3494")
+
+    def test_touching_boundary_loops(self):
+        # A 4x4 grid of quads with two diagonal holes, which touch at one vertex
+        i, j = np.meshgrid(np.arange(4), np.arange(4), indexing='ij')
+        quads = np.stack([i * 5 + j, (i + 1) * 5 + j, (i + 1) * 5 + j + 1, i * 5 + j + 1], axis=-1).reshape([-1, 4])
+        quads = np.delete(quads, [1 * 4 + 1, 2 * 4 + 2], axis=0)
+        vertices = np.stack(np.meshgrid(np.arange(5), np.arange(5), [0], indexing='ij'), axis=-1).reshape([-1, 3])
+        snapshot = MeshSnapshot.from_polygons(vertices.astype(float), quads.ravel(), np.full(len(quads), 4))
+
+        labels, num_loops = boundary_loop_labels(snapshot)
+        self.assertEqual(num_loops, 3, "The outer boundary and each hole should be separate loops")
+        self.assertEqual(sorted(np.bincount(labels[labels >= 0]).tolist()), [4, 4, 16])
+
+    def test_weld_unwelded_import(self):
+        # Give every face its own copy of its vertices, as in an OBJ exported without shared vertices
+        snapshot = MeshSnapshot.from_bmesh(meshes.DOUBLE_TORUS)
+        unwelded = MeshSnapshot.from_polygons(
+            snapshot.vertices[snapshot.loop_vertices], np.arange(len(snapshot.loop_vertices)), snapshot.loop_totals
+        )
+        result = analyse_snapshot(unwelded, validate=True)
+        self.assertEqual(result["components"], snapshot.num_faces)
+        self.assertIn("coincident vertices", result["problems"])
+        self.assertIn("try welding", result["volume_reason"], "An open result should explain why")
+
+        welded, remap = weld_snapshot(unwelded, 1e-4)
+        self.assertEqual(welded.num_vertices, snapshot.num_vertices)
+        self.assertTrue(np.allclose(welded.vertices[remap], unwelded.vertices))
+        self.assertEqual(analyse_snapshot(unwelded)["problems"], "", "Problems are only looked for when validating")
+        self.assertIn("Not closed", analyse_snapshot(unwelded)["volume_reason"])
+        result = analyse_snapshot(unwelded, weld_distance=1e-4, validate=True)
+        self.assertEqual(result["components"], 1)
+        self.assertEqual(result["genus"], 2, "The welded double toroid should have genus 2")
+        self.assertEqual(result["volume"], 2.3324, "The welded double toroid should have volume 2.3324")
+        self.assertEqual(result["problems"], "")
+
+    def test_coincident_vertices(self):
+        rng = np.random.default_rng(0)
+        points = rng.random([500, 3])
+        points = np.concatenate([points, points[:100] + rng.normal(scale=1e-6, size=[100, 3])])
+        targets = coincident_vertices(points, 1e-4)
+        self.assertTrue(np.array_equal(targets[500:], np.arange(100)), "Copies should be merged into the originals")
+        self.assertTrue(np.array_equal(targets[:500], np.arange(500)))
+
+        # Meshes millions of times wider than the weld distance, such as scans in millimetres
+        large = points * 1e5
+        large[500:] = large[:100] + rng.normal(scale=1e-6, size=[100, 3])
+        targets = coincident_vertices(large, 1e-4)
+        self.assertTrue(np.array_equal(targets, np.concatenate([np.arange(500), np.arange(100)])))
+        result = analyse_snapshot(MeshSnapshot.from_polygons(large, [0, 1, 502], [3]), weld_distance=1e-4)
+        self.assertEqual(result["components"], 498, "The triangle and the 497 other vertices left after welding")
+
+    def test_validation(self):
+        snapshot = MeshSnapshot.from_bmesh(primitives.TORUS)
+        self.assertTrue(validate_snapshot(snapshot).is_valid, "The torus should have no problems")
+
+        # Flipping one face makes its edges run the same way as its neighbours'
+        loop_vertices = snapshot.loop_vertices.copy()
+        start, total = snapshot.loop_starts[0], snapshot.loop_totals[0]
+        loop_vertices[start:start + total] = loop_vertices[start:start + total][::-1]
+        flipped = MeshSnapshot.from_polygons(snapshot.vertices, loop_vertices, snapshot.loop_totals)
+        self.assertEqual(len(validate_snapshot(flipped).inconsistent_edges), total)
+
+        # A second copy of a face makes its edges non-manifold
+        face = snapshot.loop_vertices[start:start + total]
+        doubled = MeshSnapshot.from_polygons(
+            snapshot.vertices, np.concatenate([snapshot.loop_vertices, face]), np.append(snapshot.loop_totals, total)
+        )
+        validation = validate_snapshot(doubled)
+        self.assertEqual(list(validation.duplicate_faces), [snapshot.num_faces])
+        self.assertEqual(len(validation.non_manifold_edges), total)
+        self.assertFalse(validation.is_manifold)
+
+    def test_incremental_topology(self):
+        snapshot = MeshSnapshot.from_bmesh(meshes.TWO_TORI)
+        topology = IncrementalTopology()
+        self.assertFalse(topology.update(snapshot)["incremental"], "The first update should compute everything")
+
+        def edited(snapshot, num_faces, extra_vertices=0, extra_edges=(), extra_face=None):
+            # Removes faces from the end and appends new elements, leaving the indices of the rest unchanged
+            corners = snapshot.loop_starts[num_faces] if num_faces < snapshot.num_faces else len(snapshot.loop_vertices)
+            edges = np.concatenate([snapshot.edges, np.reshape(extra_edges, [-1, 2])]).astype(np.int64)
+            loop_vertices, loop_edges = snapshot.loop_vertices[:corners], snapshot.loop_edges[:corners]
+            loop_starts, loop_totals = snapshot.loop_starts[:num_faces], snapshot.loop_totals[:num_faces]
+            if extra_face is not None:
+                loop_vertices = np.append(loop_vertices, extra_face[0])
+                loop_edges = np.append(loop_edges, extra_face[1])
+                loop_starts, loop_totals = np.append(loop_starts, corners), np.append(loop_totals, len(extra_face[0]))
+            vertices = np.concatenate([snapshot.vertices, np.random.default_rng(0).random([extra_vertices, 3])])
+            return MeshSnapshot(vertices, edges, loop_vertices, loop_edges, loop_starts, loop_totals)
+
+        n, e = snapshot.num_vertices, snapshot.num_edges
+        for step, incremental in [
+            (edited(snapshot, snapshot.num_faces - 1), True),  # Delete a face, opening a hole
+            (edited(snapshot, snapshot.num_faces - 3), True),  # Delete two more
+            (edited(snapshot, snapshot.num_faces - 3, 3, [[n, n + 1], [n + 1, n + 2], [n + 2, n]],
+                    ([n, n + 1, n + 2], [e, e + 1, e + 2])), True),  # Add a separate triangle
+            (edited(snapshot, snapshot.num_faces - 3, 3, [[n, n + 1], [n + 1, n + 2], [n + 2, n], [n, 0]],
+                    ([n, n + 1, n + 2], [e, e + 1, e + 2])), True),  # Connect it to a torus with a loose edge
+            (snapshot, False),  # Undo everything, which removes vertices
+        ]:
+            result, expected = topology.update(step), analyse_snapshot(step)
+            self.assertEqual(result["incremental"], incremental)
+            for name in ["components", "component_sizes", "boundary_loops", "genus"]:
+                self.assertEqual(result[name], expected[name])
+
+        def without(snapshot, faces=(), edges=()):
+            # Deletes faces and edges like Edit Mode does, compacting the arrays so every later element moves down
+            keep = np.ones(snapshot.num_faces, dtype=bool)
+            keep[list(faces)] = False
+            corners = np.repeat(keep, snapshot.loop_totals)
+            kept_edges = np.setdiff1d(np.arange(snapshot.num_edges), edges)
+            edge_index = np.full(snapshot.num_edges, -1)
+            edge_index[kept_edges] = np.arange(len(kept_edges))
+            loop_totals = snapshot.loop_totals[keep]
+            return MeshSnapshot(
+                snapshot.vertices, snapshot.edges[kept_edges], snapshot.loop_vertices[corners],
+                edge_index[snapshot.loop_edges[corners]], np.cumsum(loop_totals) - loop_totals, loop_totals
+            )
+
+        # Delete a face in the middle of the mesh, then one of its edges along with the other face using it
+        face = snapshot.num_faces // 2
+        edge = snapshot.loop_edges[snapshot.loop_starts[face]]
+        opened = without(snapshot, [face])
+        cut = without(opened, np.unique(opened.loop_faces[opened.loop_edges == edge]), [edge])
+        for step in [opened, cut]:
+            result, expected = topology.update(step), analyse_snapshot(step)
+            self.assertTrue(result["incremental"], "Deleting from the middle should only update the changes")
+            for name in ["components", "component_sizes", "boundary_loops", "genus"]:
+                self.assertEqual(result[name], expected[name])
+
+        # Renumber the vertices (as Sort Mesh Elements does), which keeps their count but not their indices
+        order = np.random.default_rng(0).permutation(cut.num_vertices)
+        index = np.argsort(order)
+        shuffled = MeshSnapshot(
+            cut.vertices[order], index[cut.edges], index[cut.loop_vertices], cut.loop_edges,
+            cut.loop_starts, cut.loop_totals
+        )
+        result, expected = topology.update(shuffled), analyse_snapshot(shuffled)
+        self.assertFalse(result["incremental"], "Renumbered vertices shouldn't keep their old labels")
+        for name in ["components", "component_sizes", "boundary_loops", "genus"]:
+            self.assertEqual(result[name], expected[name])
+
+    def test_stored_results(self):
+        data = bpy.data.meshes.new("test_stored_results")
+        meshes.DOUBLE_TORUS.to_mesh(data)
+        snapshot = MeshSnapshot.from_mesh(data)
+        key = content_hash(snapshot)
+        self.assertEqual(key, content_hash(MeshSnapshot.from_mesh(data)), "Hashing should be deterministic")
+        self.assertIsNone(load_result(data, key), "Nothing should be stored yet")
+
+        result = analyse_snapshot(snapshot)
+        store_result(data, key, result)
+        stored = load_result(data, key)
+        for name in ["components", "component_sizes", "boundary_loops", "genus", "closed", "volume"]:
+            self.assertEqual(stored[name], result[name])
+
+        # Editing the mesh should invalidate the stored results
+        data.vertices[0].co.x += 0.1
+        self.assertNotEqual(content_hash(MeshSnapshot.from_mesh(data)), key)
+        self.assertIsNone(load_result(data, content_hash(MeshSnapshot.from_mesh(data))))
+        bpy.data.meshes.remove(data)
+
+    def test_select_component(self):
+        data = bpy.data.meshes.new("test_select_component")
+        meshes.TWO_TORI.to_mesh(data)
+        obj = bpy.data.objects.new("test_select_component", data)
+
+        labels, num_components = component_labels(MeshSnapshot.from_mesh(data))
+        for i in range(num_components):
+            self.assertEqual(select_labels(obj, labels, i), (labels == i).sum())
+            selected = [v.index for v in data.vertices if v.select]
+            self.assertEqual(selected, list((labels == i).nonzero()[0]), "Exactly one component should be selected")
+
+        bpy.data.objects.remove(obj)
+        bpy.data.meshes.remove(data)
@@ -0,0 +1,253 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from .snapshot import MeshSnapshot
+from ..performance.profiling import profiled
+
+
+def first_occurrence_labels(labels: np.ndarray) -> tuple[np.ndarray, int]:
+    """
+    Renumbers labels in order of their first appearance.
+
+    This makes array-based results list components in the same order as the BMesh-based functions,
+    which discover them by walking the mesh's elements in order.
+
+    :param labels: An array of integer labels.
+    :return: A pair (renumbered labels, number of distinct labels).
+    """
+    unique, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(unique), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(unique))
+    return rank[inverse.ravel()], len(unique)
+
+
+def _vertex_graph_labels(num_vertices: int, edges: np.ndarray) -> np.ndarray:
+    graph = coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(num_vertices, num_vertices))
+    return connected_components(graph, directed=False)[1]
+
+
+@profiled("analysis.components")
+def component_labels(snapshot: MeshSnapshot) -> tuple[np.ndarray, int]:
+    """
+    Finds the connected component of each vertex, equivalent to `mesh_connected_components()`.
+
+    :param snapshot: The mesh to analyse.
+    :return: A pair (per-vertex component labels, number of components).
+             Components are numbered in the same order that `mesh_connected_components()` lists them.
+    """
+    return first_occurrence_labels(_vertex_graph_labels(snapshot.num_vertices, snapshot.edges))
+
+
+def edge_face_counts(snapshot: MeshSnapshot) -> np.ndarray:
+    """
+    :param snapshot: The mesh to analyse.
+    :return: The number of faces using each edge.
+    """
+    return np.bincount(snapshot.loop_edges, minlength=snapshot.num_edges)
+
+
+def _fan_successors(snapshot: MeshSnapshot, counts: np.ndarray, corners: np.ndarray) -> np.ndarray:
+    # For each boundary corner (the single corner using a boundary edge), the boundary corner at the end of its edge
+    # on the far side of the fan of faces there: turn around that vertex, from face to neighbouring face,
+    # until reaching another boundary edge. Returns None if a fan can't be walked
+    # (non-manifold edges or inconsistent winding).
+    order = np.argsort(snapshot.loop_edges, kind='stable')
+    first = np.searchsorted(snapshot.loop_edges[order], snapshot.loop_edges)
+    twins = np.where(order[first] == np.arange(len(order)), order[np.minimum(first + 1, len(order) - 1)], order[first])
+    following = snapshot.next_corners
+
+    current = following[corners]
+    for _ in range(len(snapshot.loop_edges)):
+        walking = np.flatnonzero(counts[snapshot.loop_edges[current]] != 1)
+        if len(walking) == 0:
+            return current
+        edges, twin = snapshot.loop_edges[current[walking]], twins[current[walking]]
+        # With consistent winding the neighbouring face runs the shared edge the other way, starting at its far end
+        opposed = snapshot.loop_vertices[twin] != snapshot.loop_vertices[current[walking]]
+        if np.any(counts[edges] != 2) or not np.all(opposed):
+            return None
+        current[walking] = following[twin]
+    return None
+
+
+@profiled("analysis.loops")
+def boundary_loop_labels(snapshot: MeshSnapshot) -> tuple[np.ndarray, int]:
+    """
+    Finds the boundary loop of each edge, equivalent to `mesh_boundary_loops()`.
+
+    Boundary edges (those with exactly one face) are grouped into loops by the vertices they share.
+    Where two loops touch at a vertex (between two fans of faces, like two holes meeting at a corner),
+    each loop is followed from one fan into the other, so they're kept apart.
+    Vertices where more loops meet, or whose faces are non-manifold or inconsistently wound,
+    can't be untangled without the geometry, so the loops touching there are merged.
+
+    :param snapshot: The mesh to analyse.
+    :return: A pair (per-edge loop labels, number of loops).
+             Edges which aren't on the boundary have the label -1.
+             Loops are numbered in the same order that `mesh_boundary_loops()` lists them.
+    """
+    counts = edge_face_counts(snapshot)
+    boundary = counts == 1
+    labels = np.full(snapshot.num_edges, -1, dtype=np.int64)
+    if not np.any(boundary):
+        return labels, 0
+
+    boundary_edges = snapshot.edges[boundary]
+    if np.bincount(boundary_edges.ravel()).max() == 4:
+        corners = np.flatnonzero(boundary[snapshot.loop_edges])
+        successors = _fan_successors(snapshot, counts, corners)
+        if successors is not None:
+            # A loop arriving at a vertex through one fan of faces leaves it through the other
+            ends = snapshot.loop_vertices[successors]
+            pinched = np.flatnonzero(np.bincount(ends)[ends] == 2)
+            pinched = pinched[np.argsort(ends[pinched], kind='stable')]
+            successors[pinched] = successors[pinched.reshape([-1, 2])[:, ::-1].ravel()]
+
+            # Loops are the cycles of the successor relation, labelled through the edge of each corner
+            graph = coo_matrix(
+                (np.ones(len(corners)), (snapshot.loop_edges[corners], snapshot.loop_edges[successors])),
+                shape=(snapshot.num_edges, snapshot.num_edges)
+            )
+            edge_labels = connected_components(graph, directed=False)[1]
+            labels[boundary], count = first_occurrence_labels(edge_labels[boundary])
+            return labels, count
+
+    vertex_labels = _vertex_graph_labels(snapshot.num_vertices, boundary_edges)
+    labels[boundary], count = first_occurrence_labels(vertex_labels[boundary_edges[:, 0]])
+    return labels, count
+
+
+def is_closed(snapshot: MeshSnapshot) -> bool:
+    """
+    Checks whether every edge used by a face is shared by exactly two faces, as in `mesh_volume()`.
+
+    :param snapshot: The mesh to analyse.
+    :return: True if the mesh is closed.
+    """
+    counts = edge_face_counts(snapshot)
+    return bool(np.all(counts[counts > 0] == 2))
+
+
+def genus(num_vertices: int, num_edges: int, num_faces: int, num_components: int, num_loops: int) -> int:
+    """
+    Finds the genus of a mesh from its element counts, following the same rules as `mesh_genus()`.
+
+    :return: The genus, 0 for meshes with boundary loops, or -1 for meshes with several components.
+    """
+    if num_loops != 0:
+        return 0
+    if num_components > 1:
+        return -1
+    return (2 - (num_vertices - num_edges + num_faces)) // 2
+
+
+def fan_triangles(snapshot: MeshSnapshot) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits every polygon into a fan of triangles around its first corner.
+
+    :param snapshot: The mesh to triangulate.
+    :return: A pair (polygon of each triangle, [t, 3] matrix of the corners of each triangle).
+    """
+    # Every corner except the first and last of its polygon starts a triangle (first, corner, next corner)
+    faces = snapshot.loop_faces
+    starts = snapshot.loop_starts[faces]
+    offsets = np.arange(len(faces)) - starts
+    corners = np.flatnonzero((offsets >= 1) & (offsets <= snapshot.loop_totals[faces] - 2))
+    return faces[corners], np.stack([starts[corners], corners, corners + 1], axis=1)
+
+
+@profiled("analysis.volume")
+def signed_volume(snapshot: MeshSnapshot, world: bool = True) -> float:
+    """
+    Finds the signed volume enclosed by a mesh, by summing tetrahedra between the origin and each triangle.
+
+    Polygons are split into triangle fans around their first corner.
+
+    :param snapshot: The mesh to analyse.
+    :param world: Whether to apply the snapshot's world transformation first (so that scaling affects volume).
+    :return: The signed volume.
+    """
+    vertices = snapshot.vertices
+    if world:
+        vertices = vertices @ snapshot.matrix_world[:3, :3].T + snapshot.matrix_world[:3, 3]
+
+    _, triangles = fan_triangles(snapshot)
+    v0, v1, v2 = (vertices[snapshot.loop_vertices[triangles[:, i]]] for i in range(3))
+    return float(np.sum(v0 * np.cross(v1, v2)) / 6.0)
+
+
+def volume(snapshot: MeshSnapshot, world: bool = True) -> float:
+    """
+    Finds the volume of a mesh, following the same rules as `mesh_volume()`.
+
+    :param snapshot: The mesh to analyse.
+    :param world: Whether to apply the snapshot's world transformation first (so that scaling affects volume).
+    :return: The volume truncated to 4 decimal places, or -1 for open meshes.
+    """
+    if not is_closed(snapshot):
+        return -1
+    return int(abs(signed_volume(snapshot, world)) * 10000) / 10000.0
+
+
+def transformed_volume(local_volume: float, closed: bool, matrix_world) -> float:
+    """
+    Finds the world-space volume of a mesh from its object-space signed volume.
+
+    Volume scales with the determinant of the transformation, so an object-space result can be reused
+    for every object sharing a mesh, whatever their transformations.
+
+    :param local_volume: Signed volume of the mesh in object space (see `signed_volume()`).
+    :param closed: Whether the mesh is closed (see `is_closed()`).
+    :param matrix_world: The 4x4 world transformation of the object.
+    :return: The volume truncated to 4 decimal places, or -1 for open meshes.
+    """
+    if not closed:
+        return -1
+    determinant = np.linalg.det(np.asarray(matrix_world, dtype=np.float64)[:3, :3])
+    return int(abs(local_volume * determinant) * 10000) / 10000.0
+
+
+def analyse_snapshot(snapshot: MeshSnapshot, weld_distance: float = 0.0, validate: bool = False) -> dict:
+    """
+    Computes every Practical 1 property of a mesh using only array operations.
+
+    Unlike the BMesh-based functions, this is safe to call off the main thread.
+
+    :param snapshot: The mesh to analyse.
+    :param weld_distance: (optional) Vertices closer than this are treated as one (see `weld_snapshot()`),
+                          e.g. the duplicated seam vertices of an unwelded import. 0 analyses the mesh as it is.
+    :param validate: (optional) Whether to look for every kind of problem (see `validate_snapshot()`),
+                     rather than only those found along the way (open and non-manifold edges).
+    :return: A dictionary with the component count and sizes, boundary loop count, genus, closedness,
+             object-space signed volume (`local_volume`) and world-space volume,
+             along with the mesh's problems (empty unless validated) and the reasons its genus and volume
+             are missing or unreliable (`genus_reason` and `volume_reason`), each joined into one string.
+    """
+    from .validation import WELD_DISTANCE, weld_snapshot, validate_snapshot, rejection_reasons
+
+    if weld_distance > 0:
+        snapshot, _ = weld_snapshot(snapshot, weld_distance)
+    validation = None
+    if validate:
+        validation = validate_snapshot(snapshot, weld_distance if weld_distance > 0 else WELD_DISTANCE)
+
+    labels, num_components = component_labels(snapshot)
+    _, num_loops = boundary_loop_labels(snapshot)
+    counts = edge_face_counts(snapshot)
+    closed = bool(np.all(counts[counts > 0] == 2))
+    local_volume = signed_volume(snapshot, world=False)
+    reasons = rejection_reasons(num_components, num_loops, counts, validation)
+    return {
+        "name": snapshot.name,
+        "components": num_components,
+        "component_sizes": np.bincount(labels, minlength=num_components).tolist(),
+        "boundary_loops": num_loops,
+        "genus": genus(snapshot.num_vertices, snapshot.num_edges, snapshot.num_faces, num_components, num_loops),
+        "closed": closed,
+        "local_volume": local_volume,
+        "volume": transformed_volume(local_volume, closed, snapshot.matrix_world),
+        "problems": ", ".join(validation.problems()) if validation is not None else "",
+        "genus_reason": reasons["genus"],
+        "volume_reason": reasons["volume"],
+    }
@@ -0,0 +1,292 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from .snapshot import MeshSnapshot
+from .topology import edge_face_counts, fan_triangles
+from ..performance.profiling import profiled
+
+# Vertices closer than this (in object space) are reported as coincident, matching Blender's "Merge by Distance"
+WELD_DISTANCE = 1e-4
+
+
+def _close_pairs(vertices: np.ndarray, tolerance: float) -> tuple[np.ndarray, np.ndarray]:
+    # Each axis's grid coordinates are replaced by their rank among the occupied ones, so the keys stay small
+    # whatever the size of the mesh. Cells next to each other stay next to each other; cells which only become
+    # neighbours through the ranking are paired too, but are then rejected by distance like any other far pair.
+    cells = np.floor((vertices - vertices.min(axis=0)) / tolerance)
+    ranks = [np.unique(cells[:, axis], return_inverse=True)[1].ravel() + 1 for axis in range(3)]
+    sizes = [int(rank.max()) + 2 for rank in ranks]
+    if float(sizes[0]) * sizes[1] * sizes[2] >= 2.0 ** 62:
+        pairs = cKDTree(vertices).query_pairs(tolerance, output_type='ndarray')
+        return pairs[:, 0], pairs[:, 1]
+    strides = np.array([sizes[1] * sizes[2], sizes[2], 1], dtype=np.int64)
+    keys = ranks[0] * strides[0] + ranks[1] * strides[1] + ranks[2] * strides[2]
+
+    # Vertices sorted by cell, so the vertices of a cell are one contiguous run
+    n = len(vertices)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    cell_starts = np.flatnonzero(np.diff(sorted_keys, prepend=-1))
+    cell_keys = sorted_keys[cell_starts]
+    cell_counts = np.diff(cell_starts, append=n)
+
+    # Each pair of neighbouring cells is visited once, from the cell with the lower key
+    offsets = np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1]), axis=-1).reshape(-1, 3) @ strides
+    offsets = offsets[offsets >= 0]
+    neighbours = (cell_keys[:, None] + offsets).ravel()
+    slots = np.minimum(np.searchsorted(cell_keys, neighbours), len(cell_keys) - 1)
+    found = np.flatnonzero(cell_keys[slots] == neighbours)
+    a, b = found // len(offsets), slots[found]
+
+    # Every vertex of one cell is paired with every vertex of the other
+    sizes = cell_counts[a] * cell_counts[b]
+    within = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    columns = np.repeat(cell_counts[b], sizes)
+    i = order[np.repeat(cell_starts[a], sizes) + within // columns]
+    j = order[np.repeat(cell_starts[b], sizes) + within % columns]
+
+    close = np.repeat(a != b, sizes) | (i < j)
+    close[close] = np.sum((vertices[i[close]] - vertices[j[close]]) ** 2, axis=1) <= tolerance ** 2
+    return i[close], j[close]
+
+
+@profiled("analysis.weld")
+def coincident_vertices(vertices: np.ndarray, tolerance: float = WELD_DISTANCE) -> np.ndarray:
+    """
+    Finds the vertex each vertex would be merged into, when vertices closer than a tolerance are welded.
+
+    Vertices are hashed into a grid with cells as wide as the tolerance, so each vertex only needs to be compared
+    against the vertices in the 27 cells around it. Every step is a bulk array operation.
+    Welding is transitive: chains of vertices, each within the tolerance of the next, are merged into one.
+
+    :param vertices: Collection of n vertex positions, represented by an [n, 3] numpy matrix.
+    :param tolerance: Vertices this close together are merged.
+    :return: An array with the index of each vertex's target, the lowest index of the vertices it's merged with.
+             Vertices which aren't merged are their own target.
+    """
+    n = len(vertices)
+    if n == 0 or tolerance <= 0:
+        return np.arange(n)
+
+    i, j = _close_pairs(np.asarray(vertices, dtype=np.float64), tolerance)
+    if len(i) == 0:
+        return np.arange(n)
+
+    graph = coo_matrix((np.ones(len(i)), (i, j)), shape=(n, n))
+    num_clusters, labels = connected_components(graph, directed=False)
+    targets = np.full(num_clusters, n)
+    np.minimum.at(targets, labels, np.arange(n))
+    return targets[labels]
+
+
+def weld_snapshot(snapshot: MeshSnapshot, tolerance: float = WELD_DISTANCE) -> tuple[MeshSnapshot, np.ndarray]:
+    """
+    Merges coincident vertices of a mesh, see `coincident_vertices()`.
+
+    Polygon sides which collapse onto a single vertex are removed, along with polygons left with fewer than 3 corners.
+
+    :param snapshot: The mesh to weld.
+    :param tolerance: Vertices this close together are merged.
+    :return: A pair (welded mesh, index of each original vertex in the welded mesh).
+    """
+    targets = coincident_vertices(snapshot.vertices, tolerance)
+    kept = targets == np.arange(snapshot.num_vertices)
+    remap = (np.cumsum(kept) - 1)[targets]
+
+    loop_vertices = remap[snapshot.loop_vertices]
+    corners = loop_vertices != loop_vertices[snapshot.next_corners]
+    faces = snapshot.loop_faces
+    totals = np.bincount(faces[corners], minlength=snapshot.num_faces)
+    corners &= (totals >= 3)[faces]
+
+    loose = remap[snapshot.edges[edge_face_counts(snapshot) == 0]]
+    welded = MeshSnapshot.from_polygons(
+        snapshot.vertices[kept], loop_vertices[corners], totals[totals >= 3],
+        snapshot.matrix_world, snapshot.name, loose[loose[:, 0] != loose[:, 1]]
+    )
+    return welded, remap
+
+
+class MeshValidation:
+    """
+    Problems found in a mesh by `validate_snapshot()`, each stored as an array of the indices of the offending elements.
+    """
+
+    def __init__(
+        self,
+        coincident_vertices: np.ndarray,
+        bowtie_vertices: np.ndarray,
+        boundary_edges: np.ndarray,
+        non_manifold_edges: np.ndarray,
+        inconsistent_edges: np.ndarray,
+        degenerate_faces: np.ndarray,
+        duplicate_faces: np.ndarray,
+    ):
+        """
+        :param coincident_vertices: Vertices within the weld distance of a vertex with a lower index.
+        :param bowtie_vertices: Vertices where two or more separate fans of faces meet.
+        :param boundary_edges: Edges used by exactly one face.
+        :param non_manifold_edges: Edges used by more than two faces.
+        :param inconsistent_edges: Edges whose two faces traverse them in the same direction (flipped normals).
+        :param degenerate_faces: Faces with (almost) no area, or which use a vertex more than once.
+        :param duplicate_faces: Faces using the same vertices as a face with a lower index.
+        """
+        self.coincident_vertices = coincident_vertices
+        self.bowtie_vertices = bowtie_vertices
+        self.boundary_edges = boundary_edges
+        self.non_manifold_edges = non_manifold_edges
+        self.inconsistent_edges = inconsistent_edges
+        self.degenerate_faces = degenerate_faces
+        self.duplicate_faces = duplicate_faces
+
+    @property
+    def is_manifold(self) -> bool:
+        return len(self.non_manifold_edges) == 0 and len(self.bowtie_vertices) == 0
+
+    @property
+    def is_valid(self) -> bool:
+        """Whether the mesh has none of the problems (boundary edges aren't a problem)."""
+        return not self.problems()
+
+    def problems(self) -> list[str]:
+        """
+        :return: A short description of each kind of problem found, e.g. "3 non-manifold edges".
+        """
+        return _describe([
+            (self.coincident_vertices, "coincident vertices"),
+            (self.bowtie_vertices, "bowtie vertices"),
+            (self.non_manifold_edges, "non-manifold edges"),
+            (self.inconsistent_edges, "inconsistently wound edges"),
+            (self.degenerate_faces, "degenerate faces"),
+            (self.duplicate_faces, "duplicate faces"),
+        ])
+
+
+def _describe(problems: list) -> list[str]:
+    return [f"{len(indices)} {description}" for indices, description in problems if len(indices)]
+
+
+def _bowtie_vertices(snapshot: MeshSnapshot) -> np.ndarray:
+    # Corners around a vertex are linked when their faces share an edge at that vertex;
+    # each group of linked corners is one fan, and a manifold vertex has exactly one
+    num_corners = len(snapshot.loop_vertices)
+    previous = np.empty(num_corners, dtype=np.int64)
+    previous[snapshot.next_corners] = np.arange(num_corners)
+
+    # Each (edge, end) pair is a node, so corners only link through edges at their own vertex
+    leaving, entering = snapshot.loop_edges, snapshot.loop_edges[previous]
+    ends = [
+        2 * edges + (snapshot.edges[edges, 1] == snapshot.loop_vertices) for edges in [leaving, entering]
+    ]
+    nodes = num_corners + 2 * snapshot.num_edges
+    corners = np.tile(np.arange(num_corners), 2)
+    graph = coo_matrix(
+        (np.ones(2 * num_corners), (corners, num_corners + np.concatenate(ends))), shape=(nodes, nodes)
+    )
+    fans = connected_components(graph, directed=False)[1][:num_corners]
+
+    vertex_fans = np.sort(snapshot.loop_vertices * num_corners + fans)
+    vertex_fans = vertex_fans[np.diff(vertex_fans, prepend=-1) != 0] // num_corners
+    return np.flatnonzero(np.bincount(vertex_fans, minlength=snapshot.num_vertices) > 1)
+
+
+def _sorted_corners(snapshot: MeshSnapshot) -> np.ndarray:
+    # The corners' (face, vertex) keys in order, which keeps each face's corners together, sorted by vertex
+    return np.sort(snapshot.loop_faces * snapshot.num_vertices + snapshot.loop_vertices)
+
+
+def _degenerate_faces(snapshot: MeshSnapshot, sorted_corners: np.ndarray, tolerance: float) -> np.ndarray:
+    faces, triangles = fan_triangles(snapshot)
+    v0, v1, v2 = (snapshot.vertices[snapshot.loop_vertices[triangles[:, i]]] for i in range(3))
+    areas = np.bincount(
+        faces, weights=np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1) / 2, minlength=snapshot.num_faces
+    )
+
+    # Faces which use a vertex twice have the same (face, vertex) key twice in a row
+    repeated = np.zeros(snapshot.num_faces, dtype=bool)
+    repeated[sorted_corners[1:][np.diff(sorted_corners) == 0] // max(snapshot.num_vertices, 1)] = True
+    return np.flatnonzero((areas <= tolerance ** 2) | repeated)
+
+
+def _duplicate_faces(snapshot: MeshSnapshot, sorted_corners: np.ndarray) -> np.ndarray:
+    if snapshot.num_faces == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Each face's sorted vertices form one row of a table, so identical faces are identical rows
+    faces = snapshot.loop_faces
+    table = np.full([snapshot.num_faces, snapshot.loop_totals.max()], -1, dtype=np.int64)
+    table[faces, np.arange(len(faces)) - snapshot.loop_starts[faces]] = sorted_corners % snapshot.num_vertices
+    _, first, inverse = np.unique(table, axis=0, return_index=True, return_inverse=True)
+    return np.flatnonzero(first[inverse.ravel()] != np.arange(snapshot.num_faces))
+
+
+@profiled("analysis.validation")
+def validate_snapshot(snapshot: MeshSnapshot, tolerance: float = WELD_DISTANCE) -> MeshValidation:
+    """
+    Checks a mesh for the problems which make its topology (and so its components, boundary loops and genus) wrong.
+
+    Every check is a bulk array pass over the mesh's elements.
+
+    :param snapshot: The mesh to check.
+    :param tolerance: Vertices this close together are coincident, and faces smaller than its square are degenerate.
+    :return: A `MeshValidation` listing the offending elements.
+    """
+    targets = coincident_vertices(snapshot.vertices, tolerance)
+    counts = edge_face_counts(snapshot)
+    sorted_corners = _sorted_corners(snapshot)
+
+    # The two faces of a manifold edge should run along it in opposite directions
+    forward = snapshot.loop_vertices == snapshot.edges[snapshot.loop_edges, 0]
+    forward_counts = np.bincount(snapshot.loop_edges, weights=forward, minlength=snapshot.num_edges)
+
+    return MeshValidation(
+        coincident_vertices=np.flatnonzero(targets != np.arange(snapshot.num_vertices)),
+        bowtie_vertices=_bowtie_vertices(snapshot),
+        boundary_edges=np.flatnonzero(counts == 1),
+        non_manifold_edges=np.flatnonzero(counts > 2),
+        inconsistent_edges=np.flatnonzero((counts == 2) & (forward_counts != 1)),
+        degenerate_faces=_degenerate_faces(snapshot, sorted_corners, tolerance),
+        duplicate_faces=_duplicate_faces(snapshot, sorted_corners),
+    )
+
+
+def rejection_reasons(
+    num_components: int, num_loops: int, edge_counts: np.ndarray, validation: MeshValidation = None
+) -> dict:
+    """
+    Explains why the genus or volume of a mesh is missing (-1), or can't be trusted.
+
+    :param num_components: The number of connected components of the mesh.
+    :param num_loops: The number of boundary loops of the mesh.
+    :param edge_counts: The number of faces using each edge (see `edge_face_counts()`).
+    :param validation: (optional) The problems found in the mesh, see `validate_snapshot()`.
+                       Without it, only problems visible from the face counts are explained.
+    :return: A dictionary with a "genus" and a "volume" explanation, each empty if there's nothing to explain.
+    """
+    boundary_edges, non_manifold_edges = np.flatnonzero(edge_counts == 1), np.flatnonzero(edge_counts > 2)
+    bowtie_vertices = validation.bowtie_vertices if validation is not None else []
+    inconsistent_edges = validation.inconsistent_edges if validation is not None else []
+    hint = ""
+    if validation is not None and len(validation.coincident_vertices):
+        hint = f" ({len(validation.coincident_vertices)} coincident vertices, try welding)"
+    non_manifold = ", ".join(_describe([
+        (bowtie_vertices, "bowtie vertices"), (non_manifold_edges, "non-manifold edges")
+    ]))
+    open_edges = ", ".join(_describe([(boundary_edges, "boundary edges"), (non_manifold_edges, "non-manifold edges")]))
+
+    genus = ""
+    if num_loops > 0:
+        genus = f"Reported as 0 for a mesh with {num_loops} boundary loops{hint}"
+    elif num_components > 1:
+        genus = f"Undefined for a mesh with {num_components} components{hint}"
+    elif non_manifold:
+        genus = f"Not a manifold surface: {non_manifold}"
+
+    volume = ""
+    if open_edges:
+        volume = f"Not closed: {open_edges}{hint}"
+    elif len(inconsistent_edges):
+        volume = f"May be wrong: {len(inconsistent_edges)} edges have inconsistent winding"
+    return {"genus": genus, "volume": volume}
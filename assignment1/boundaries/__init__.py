@@ -1,10 +1,41 @@
 from .boundary_loops import *
-from .test import *
 
 import bpy
 import bmesh
 
 
+class MeshSelectBoundaryLoop(bpy.types.Operator):
+    bl_idname = "mesh.select_boundary_loop"
+    bl_label = "Select Boundary Loop"
+    bl_description = "Select the vertices of one boundary loop"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    index: bpy.props.IntProperty(name="Loop", description="Index of the boundary loop to select", min=0)
+    extend: bpy.props.BoolProperty(name="Extend", description="Keep the existing selection", default=False)
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'MESH'
+
+    def execute(self, context):
+        import numpy as np
+        from ..analysis import MeshSnapshot, boundary_loop_labels, select_labels
+
+        obj = context.active_object
+        snapshot = MeshSnapshot.from_object(obj)
+        edge_labels, count = boundary_loop_labels(snapshot)
+        if self.index >= count:
+            self.report({'WARNING'}, f"The mesh only has {count} boundary loops")
+            return {'CANCELLED'}
+
+        # Label each vertex by the loop of the boundary edges it belongs to
+        vertex_labels = np.full(snapshot.num_vertices, -1, dtype=np.int64)
+        boundary = edge_labels >= 0
+        vertex_labels[snapshot.edges[boundary].ravel()] = np.repeat(edge_labels[boundary], 2)
+        select_labels(obj, vertex_labels, self.index, self.extend)
+        return {'FINISHED'}
+
+
 class MeshBoundaryLoops(bpy.types.Panel):
     # TODO: Implement a panel which shows the number of boundary loops in the active mesh
     bl_idname = "VIEW3D_PT_MeshBoundaryLoops"
@@ -29,4 +60,6 @@ class MeshBoundaryLoops(bpy.types.Panel):
         
         # Optionally display details about each boundary loop
         for i, loop in enumerate(boundary_loops):
-            layout.label(text=f'Loop {i+1}: {len(loop)} edges')
\ No newline at end of file
+            row = layout.row()
+            row.label(text=f'Loop {i+1}: {len(loop)} edges')
+            row.operator(MeshSelectBoundaryLoop.bl_idname, text="", icon='RESTRICT_SELECT_OFF').index = i
@@ -1,6 +1,10 @@
 import bmesh
 from typing import List, Set
 
+from ..performance.profiling import profiled
+
+
+@profiled("loops")
 def mesh_boundary_loops(mesh: bmesh.types.BMesh) -> List[Set[bmesh.types.BMEdge]]:
     """
     Finds the boundary loops of a BMesh.
@@ -1,10 +1,60 @@
 from .connected_components import *
-from .test import *
 
 import bpy
 import bmesh
 
 
+class MeshSelectComponent(bpy.types.Operator):
+    bl_idname = "mesh.select_component"
+    bl_label = "Select Component"
+    bl_description = "Select the vertices of one connected component"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    index: bpy.props.IntProperty(name="Component", description="Index of the component to select", min=0)
+    extend: bpy.props.BoolProperty(name="Extend", description="Keep the existing selection", default=False)
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'MESH'
+
+    def execute(self, context):
+        from ..analysis import MeshSnapshot, component_labels, select_labels
+
+        obj = context.active_object
+        labels, count = component_labels(MeshSnapshot.from_object(obj))
+        if self.index >= count:
+            self.report({'WARNING'}, f"The mesh only has {count} components")
+            return {'CANCELLED'}
+        select_labels(obj, labels, self.index, self.extend)
+        return {'FINISHED'}
+
+
+class MeshSelectSmallComponents(bpy.types.Operator):
+    bl_idname = "mesh.select_small_components"
+    bl_label = "Select Small Components"
+    bl_description = "Select every connected component with fewer vertices than a threshold, e.g. scan debris"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    threshold: bpy.props.IntProperty(
+        name="Fewer Than", description="Components with fewer vertices than this are selected", min=1, default=100
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'MESH'
+
+    def execute(self, context):
+        import numpy as np
+        from ..analysis import MeshSnapshot, component_labels, select_labels
+
+        obj = context.active_object
+        labels, count = component_labels(MeshSnapshot.from_object(obj))
+        small = np.flatnonzero(np.bincount(labels, minlength=count) < self.threshold)
+        select_labels(obj, labels, small)
+        self.report({'INFO'}, f"Selected {len(small)} of {count} components")
+        return {'FINISHED'}
+
+
 class MeshConnectedComponents(bpy.types.Panel):
     # TODO: Add bpy boilerplate (ID name, label, category, etc.)
 
@@ -31,7 +81,11 @@ class MeshConnectedComponents(bpy.types.Panel):
         components = mesh_connected_components(bm)
         layout.label(text=f'Number of Components: {len(components)}')
         
-        # Bonus: Show details about each component
+        # Bonus: Show details about each component, with a button to select it
         for i, comp in enumerate(components):
-            layout.label(text=f'Component {i+1}: {len(comp)} vertices')
+            row = layout.row()
+            row.label(text=f'Component {i+1}: {len(comp)} vertices')
+            row.operator(MeshSelectComponent.bl_idname, text="", icon='RESTRICT_SELECT_OFF').index = i
+
+        layout.operator(MeshSelectSmallComponents.bl_idname)
         
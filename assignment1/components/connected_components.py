@@ -2,8 +2,11 @@ from collections import deque
 import bmesh
 from typing import Optional, List, Set
 
+from ..performance.profiling import profiled
+
 
 # !!! This function will be used for automatic grading, don't edit the signature !!!
+@profiled("components")
 def mesh_connected_components(mesh: bmesh.types.BMesh) -> List[Set[bmesh.types.BMVert]]:
     """
     Finds the connected components of the mesh.
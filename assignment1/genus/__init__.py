@@ -1,5 +1,4 @@
 from .genus import *
-from .test import *
 
 import bpy
 import bmesh
@@ -22,4 +21,13 @@ class MeshGenus(bpy.types.Panel):
         bm = bmesh.new()
         bm.from_mesh(context.active_object.data)
 
-        self.layout.label(text=f"Genus: {mesh_genus(bm)}")
+        genus = mesh_genus(bm)
+        self.layout.label(text=f"Genus: {genus}")
+
+        # -1 on its own doesn't say what's wrong with the mesh
+        if genus == -1:
+            from ..analysis.snapshot import MeshSnapshot
+            from ..analysis.topology import analyse_snapshot
+            reason = analyse_snapshot(MeshSnapshot.from_mesh(context.active_object.data))["genus_reason"]
+            if reason:
+                self.layout.label(text=reason, icon='INFO')
@@ -1,9 +1,11 @@
 import bmesh
 from assignment1.boundaries import boundary_loops, mesh_boundary_loops
 from assignment1.components import mesh_connected_components
+from ..performance.profiling import profiled
 
 
 # !!! This function will be used for automatic grading, don't edit the signature !!!
+@profiled("genus")
 def mesh_genus(mesh: bmesh.types.BMesh) -> int:
     """
     Finds the genus of a mesh.
@@ -25,11 +27,6 @@ def mesh_genus(mesh: bmesh.types.BMesh) -> int:
     E = len(mesh.edges)
     F = len(mesh.faces)
 
-    # Debug output to check counts
-    print(
-        f"Vertices: {V}, Edges: {E}, Faces: {F}, Loops: {num_loops}, Components: {num_components}"
-    )
-
     # Check if there is no boundary loop and no volume (implied by zero faces)
     if num_loops != 0:
         return 0
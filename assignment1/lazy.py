@@ -0,0 +1,27 @@
+import importlib
+
+
+def lazy_exports(package: str, modules: list[str]):
+    """
+    Makes the public names of a package's submodules available from the package itself,
+    importing each submodule only when one of its names is first used (see PEP 562).
+
+    This keeps slow imports (numpy, scipy) out of add-on registration,
+    while `package.name` and `from package import name` keep working as before.
+
+    Usage, in a package's `__init__.py`: `__getattr__ = lazy_exports(__name__, ["submodule", ...])`
+
+    :param package: The name of the package.
+    :param modules: Names of the submodules to search, in order.
+    :return: A module-level `__getattr__` function.
+    """
+
+    def __getattr__(name):
+        if not name.startswith("_"):
+            for module_name in modules:
+                module = importlib.import_module(f".{module_name}", package)
+                if hasattr(module, name):
+                    return getattr(module, name)
+        raise AttributeError(f"module '{package}' has no attribute '{name}'")
+
+    return __getattr__
@@ -0,0 +1,115 @@
+from . import profiling
+
+import bpy
+
+
+def _get_profiling(self) -> bool:
+    return profiling.is_enabled()
+
+
+def _set_profiling(self, value: bool) -> None:
+    profiling.set_enabled(value)
+
+
+# Kept on the window manager (rather than in the .blend file), and mirrors the state of the timing registry,
+# which may also have been switched on by the GDP_PROFILE environment variable
+PROFILING_PROPERTY = bpy.props.BoolProperty(
+    name="Record Timings", description="Time every analysis and registration stage (slightly slower when on)",
+    get=_get_profiling, set=_set_profiling
+)
+
+
+class ResetTimings(bpy.types.Operator):
+    bl_idname = "wm.gdp_reset_timings"
+    bl_label = "Reset"
+    bl_description = "Forget every recorded timing"
+
+    def execute(self, context):
+        profiling.reset()
+        return {'FINISHED'}
+
+
+# Blender doesn't keep its own copy of the strings in dynamic enum items, so they're kept alive here
+_stage_items = []
+
+
+def _capture_targets(self, context):
+    global _stage_items
+    stages = profiling.known_stages()
+    targets = sorted(set(stages) | {stage.split(".")[0] for stage in stages})
+    _stage_items = [('ANY', "Any Stage", "Profile the next instrumented call, whichever stage it belongs to")] + [
+        (target, target, f"Profile the next call to '{target}' (or a stage within it)") for target in targets
+    ]
+    return _stage_items
+
+
+class ProfileNextCall(bpy.types.Operator):
+    bl_idname = "wm.gdp_profile_next_call"
+    bl_label = "Profile Next Call"
+    bl_description = "Run the next call of a chosen stage under cProfile, and show the result in a text block"
+    bl_property = "stage"
+
+    stage: bpy.props.EnumProperty(name="Stage", items=_capture_targets)
+
+    def invoke(self, context, event):
+        context.window_manager.invoke_search_popup(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        profiling.capture_next_call("" if self.stage == 'ANY' else self.stage)
+        self.report({'INFO'}, f"The next call of '{self.stage}' will be profiled")
+        return {'FINISHED'}
+
+
+class ShowProfile(bpy.types.Operator):
+    bl_idname = "wm.gdp_show_profile"
+    bl_label = "Show Profile"
+    bl_description = "Write the last cProfile capture to the 'GDP Profile' text block"
+
+    @classmethod
+    def poll(cls, context):
+        return bool(profiling.last_profile)
+
+    def execute(self, context):
+        text = bpy.data.texts.get("GDP Profile") or bpy.data.texts.new("GDP Profile")
+        text.from_string(profiling.last_profile)
+        self.report({'INFO'}, "Profile written to the 'GDP Profile' text block")
+        return {'FINISHED'}
+
+
+class Performance(bpy.types.Panel):
+    bl_idname = "VIEW3D_PT_Performance"
+    bl_label = "Performance"
+
+    bl_category = "Practical 1"
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+
+        row = layout.row(align=True)
+        row.prop(context.window_manager, 'gdp_profiling')
+        row.operator(ResetTimings.bl_idname, text="", icon='TRASH')
+
+        stages = profiling.stages()
+        if not stages:
+            layout.label(text="No timings recorded" if profiling.is_enabled() else "Timing is off")
+        else:
+            box = layout.box()
+            column = box.column(align=True)
+            row = column.row()
+            for heading in ["Stage", "Calls", "Last (ms)", "Mean (ms)"]:
+                row.label(text=heading)
+            for stage, timings in stages:
+                row = column.row()
+                row.label(text=stage)
+                row.label(text=str(timings.calls))
+                row.label(text=f"{timings.last * 1000:.2f}")
+                row.label(text=f"{timings.mean * 1000:.2f}")
+        layout.separator()
+
+        row = layout.row(align=True)
+        row.operator(ProfileNextCall.bl_idname, icon='REC')
+        row.operator(ShowProfile.bl_idname, text="", icon='TEXT')
@@ -0,0 +1,195 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Setting this environment variable (to anything but "0") turns profiling on from the start,
+# e.g. `GDP_PROFILE=1 blender --python run.py`
+ENVIRONMENT_VARIABLE = "GDP_PROFILE"
+
+# Number of recent timings kept for each stage
+HISTORY_LENGTH = 20
+
+
+class StageTimings:
+    """
+    Timings recorded for one stage: a call count, the total time, and the most recent durations (in seconds).
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=HISTORY_LENGTH)
+
+    @property
+    def last(self) -> float:
+        return self.recent[-1] if self.recent else 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+_enabled = os.environ.get(ENVIRONMENT_VARIABLE, "0") not in ("", "0")
+# The stage whose next call is run under cProfile ("" for any stage), or None when nothing is to be captured
+_capture_stage = None
+_lock = threading.Lock()
+_stages = {}
+_declared = set()
+last_profile = ""
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(enabled: bool) -> None:
+    """
+    Turns timing on or off for every instrumented function.
+    While off, instrumented functions run as if they weren't instrumented, apart from one flag check.
+    """
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def capture_next_call(stage: str = "") -> None:
+    """
+    Runs the next instrumented call of a stage under `cProfile`, storing a summary in `last_profile`.
+    This works whether or not timing is enabled.
+
+    :param stage: (optional) Name of the stage to capture, which also matches the stages below it
+                  ("registration" captures a call to "registration.frame"). Any stage if empty.
+    """
+    global _capture_stage
+    with _lock:
+        _capture_stage = stage
+
+
+def _claim_capture(stage: str) -> bool:
+    # Exactly one call takes a capture, even when instrumented functions run on several threads
+    global _capture_stage
+    with _lock:
+        if _capture_stage is None or not (
+            _capture_stage == "" or stage == _capture_stage or stage.startswith(_capture_stage + ".")
+        ):
+            return False
+        _capture_stage = None
+        return True
+
+
+def known_stages() -> list[str]:
+    """
+    :return: The names of every stage which has been timed, or has an instrumented function loaded, sorted by name.
+    """
+    with _lock:
+        return sorted(_declared | set(_stages))
+
+
+def record(stage: str, duration: float) -> None:
+    """
+    Adds one timing to a stage. Safe to call from worker threads.
+
+    :param stage: Name of the stage, e.g. "registration.correspondence".
+    :param duration: Time taken, in seconds.
+    """
+    with _lock:
+        timings = _stages.get(stage)
+        if timings is None:
+            timings = _stages[stage] = StageTimings()
+        timings.calls += 1
+        timings.total += duration
+        timings.recent.append(duration)
+
+
+def stages() -> list[tuple[str, StageTimings]]:
+    """
+    :return: A list of (stage name, timings) pairs, sorted by name.
+    """
+    with _lock:
+        return sorted(_stages.items())
+
+
+def reset() -> None:
+    """Clears every recorded timing, and the last captured profile."""
+    global last_profile
+    with _lock:
+        _stages.clear()
+    last_profile = ""
+
+
+def _run_profiled(stage: str, function, *args, **kwargs):
+    global last_profile
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        return profile.runcall(function, *args, **kwargs)
+    finally:
+        record(stage, time.perf_counter() - start)
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(25)
+        last_profile = f"Profile of '{stage}'\n{summary.getvalue()}"
+
+
+@contextmanager
+def _timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+class _NotTimed:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NOT_TIMED = _NotTimed()
+
+
+def timed(stage: str):
+    """
+    Times a block of code, for use in a `with` statement:
+
+        with timed("registration.correspondence"):
+            ...
+
+    :param stage: Name of the stage the block belongs to.
+    :return: A context manager, which does nothing while profiling is disabled.
+    """
+    return _timed(stage) if _enabled else _NOT_TIMED
+
+
+def profiled(stage: str):
+    """
+    Decorator which times every call to a function, see `timed()`.
+    If `capture_next_call()` was used for its stage, the next call is also run under `cProfile`.
+
+    :param stage: Name of the stage the function belongs to.
+    """
+    _declared.add(stage)
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _capture_stage is not None and _claim_capture(stage):
+                return _run_profiled(stage, function, *args, **kwargs)
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
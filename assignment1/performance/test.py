@@ -0,0 +1,56 @@
+import unittest
+from . import profiling
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.was_enabled = profiling.is_enabled()
+        profiling.reset()
+
+    def tearDown(self):
+        profiling.set_enabled(self.was_enabled)
+        profiling.reset()
+
+    def test_disabled(self):
+        profiling.set_enabled(False)
+        with profiling.timed("test.block"):
+            pass
+        profiling.profiled("test.function")(lambda: None)()
+        self.assertEqual(profiling.stages(), [], "Nothing should be recorded while profiling is off")
+
+    def test_enabled(self):
+        profiling.set_enabled(True)
+        square = profiling.profiled("test.function")(lambda x: x * x)
+        for i in range(3):
+            self.assertEqual(square(i), i * i)
+        with profiling.timed("test.block"):
+            pass
+
+        stages = dict(profiling.stages())
+        self.assertEqual(stages["test.function"].calls, 3)
+        self.assertEqual(len(stages["test.function"].recent), 3)
+        self.assertEqual(stages["test.block"].calls, 1)
+        self.assertGreaterEqual(stages["test.function"].mean, 0)
+
+    def test_capture_next_call(self):
+        profiling.set_enabled(False)
+        profiling.capture_next_call()
+        function = profiling.profiled("test.captured")(lambda: sum(range(1000)))
+        self.assertEqual(function(), sum(range(1000)))
+        self.assertIn("test.captured", profiling.last_profile)
+
+        # Only one call is captured
+        profiling.reset()
+        function()
+        self.assertEqual(profiling.last_profile, "")
+
+        # Calls of other stages (such as a panel redrawing) leave a capture for a named stage alone
+        other = profiling.profiled("other.stage")(lambda: None)
+        captured = profiling.profiled("test.captured.part")(lambda: None)
+        profiling.capture_next_call("test.captured")
+        other()
+        self.assertEqual(profiling.last_profile, "")
+        captured()
+        self.assertIn("test.captured.part", profiling.last_profile)
+        self.assertIn("test.captured.part", profiling.known_stages())
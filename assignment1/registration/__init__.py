@@ -1,11 +1,18 @@
 import mathutils
 
-from .iterative_closest_point import *
-from .test import *
+from .options import *
+from ..lazy import lazy_exports
 
 import bpy
 import bmesh
 
+# The registration code needs numpy and scipy, which are slow to import, so it's only loaded once it's used
+__getattr__ = lazy_exports(__name__, [
+    "iterative_closest_point", "correspondence", "sampling", "robust", "animation", "deviation",
+    "global_registration", "multiview", "streaming", "assembly",
+    "benchmark"
+])
+
 
 class ObjectICPRegistration(bpy.types.Operator):
     bl_idname = "object.icp_rigid_registration"
@@ -42,6 +49,88 @@ class ObjectICPRegistration(bpy.types.Operator):
         ]
     )
 
+    rejection: bpy.props.EnumProperty(
+        name="Outlier Rejection", description="How point-pairs which don't correspond are handled",
+        items=REJECTION_STRATEGIES
+    )
+    overlap: bpy.props.FloatProperty(
+        name="Overlap", description="Fraction of point-pairs expected to overlap, only the closest are kept",
+        min=0.05, max=1.0, step=0.05, default=0.9
+    )
+    kernel_width: bpy.props.FloatProperty(
+        name="Kernel Width", description="Multiplier on the width of the robust kernel, smaller values are stricter",
+        min=0.1, max=10.0, step=0.1, default=1.0
+    )
+    global_initialization: bpy.props.BoolProperty(
+        name="Global Initialization",
+        description="Coarsely align the meshes by matching surface features first, so any initial pose can be used",
+        default=False
+    )
+    correspondence_backend: bpy.props.EnumProperty(
+        name="Correspondence Search", description="Nearest-neighbour search used to pair source and destination points",
+        items=CORRESPONDENCE_BACKENDS
+    )
+    max_distance: bpy.props.FloatProperty(
+        name="Max Distance", description="Point-pairs further apart than this are never matched (0 for no limit)",
+        min=0.0, step=0.01, default=0.0
+    )
+    sampling: bpy.props.EnumProperty(
+        name="Sampling", description="How points are drawn from the meshes for registration",
+        items=SAMPLING_STRATEGIES
+    )
+    use_seed: bpy.props.BoolProperty(
+        name="Fixed Seed", description="Use the same random samples every time, for reproducible results",
+        default=False
+    )
+    seed: bpy.props.IntProperty(
+        name="Seed", description="Seed for the random sampling",
+        min=0, default=0
+    )
+    region: bpy.props.EnumProperty(
+        name="Region", description="Which vertices of each mesh to use for registration",
+        items=REGIONS
+    )
+    source_group: bpy.props.StringProperty(
+        name="Source Group", description="Vertex group of the source mesh to register"
+    )
+    destination_group: bpy.props.StringProperty(
+        name="Destination Group", description="Vertex group of the destination mesh to register against"
+    )
+    bake_animation: bpy.props.BoolProperty(
+        name="Bake Animation", description="Keyframe the source's pose after each iteration of the registration",
+        default=False
+    )
+    frame_start: bpy.props.IntProperty(
+        name="Start Frame", description="Frame showing the source before registration",
+        default=1
+    )
+    frame_step: bpy.props.IntProperty(
+        name="Frame Step", description="Number of frames between iterations",
+        min=1, default=1
+    )
+    compute_deviation: bpy.props.BoolProperty(
+        name="Deviation Map",
+        description="Store each source vertex's distance from the destination as an attribute, shown in colour",
+        default=False
+    )
+    deviation_metric: bpy.props.EnumProperty(
+        name="Deviation Metric", description="How the distance from each source vertex to the destination is measured",
+        items=[
+            ('POINT_TO_POINT', "Point-to-Point", "Distance to the nearest destination vertex"),
+            ('POINT_TO_PLANE', "Point-to-Plane", "Distance to the tangent plane of the nearest destination vertex"),
+        ]
+    )
+
+    per_component: bpy.props.BoolProperty(
+        name="Per Component",
+        description="Register each connected part of the source to the matching part of the destination separately",
+        default=False
+    )
+    assembly_output: bpy.props.EnumProperty(
+        name="Part Output", description="How each part's transformation is applied",
+        items=ASSEMBLY_OUTPUTS
+    )
+
     # Output parameters
     status: bpy.props.StringProperty(
         name="Registration Status", default="Status not set"
@@ -67,6 +156,10 @@ class ObjectICPRegistration(bpy.types.Operator):
         return self.execute(context)
 
     def execute(self, context):
+        from .iterative_closest_point import iterative_closest_point_registration, net_transformation
+        from .sampling import vertex_mask
+        from .animation import bake_transformations
+        from .assembly import register_assembly
 
         source_object = context.view_layer.objects.active
         destination_object = context.window_manager.rigid_registration_destination
@@ -75,6 +168,35 @@ class ObjectICPRegistration(bpy.types.Operator):
         if destination_object is None:
             return {'FINISHED'}
 
+        # Changes made in Edit Mode aren't written to the mesh until we ask for them
+        for obj in (source_object, destination_object):
+            if obj.mode == 'EDIT':
+                obj.update_from_editmode()
+
+        # Assemblies are registered part by part, rather than as one rigid body
+        if self.per_component:
+            try:
+                pairs = register_assembly(
+                    source_object, destination_object, self.assembly_output,
+                    num_points=self.num_points, iterations=self.iterations, epsilon=self.epsilon,
+                    k=self.k, rejection=self.rejection, overlap=self.overlap, kernel_width=self.kernel_width,
+                    sampling=self.sampling, seed=self.seed if self.use_seed else None,
+                    correspondence_backend=self.correspondence_backend,
+                    max_distance=self.max_distance if self.max_distance > 0 else float('inf'),
+                    global_initialization=self.global_initialization,
+                    source_mask=vertex_mask(source_object, self.region, self.source_group),
+                    destination_mask=vertex_mask(destination_object, self.region, self.destination_group),
+                )
+            except Exception as error:
+                self.report({'WARNING'}, f"Per-component registration failed with error '{error}'")
+                return {'CANCELLED'}
+            self.status = f"Registered {len(pairs)} parts independently"
+
+            # Separated parts are new objects, so only offsets leave a single source to measure
+            if self.compute_deviation and self.assembly_output == 'OFFSETS':
+                self.report_deviation(source_object, destination_object)
+            return {'FINISHED'}
+
         # Produce BMesh types to work with
         source, destination = bmesh.new(), bmesh.new()
         source.from_mesh(source_object.data), destination.from_mesh(destination_object.data)
@@ -84,32 +206,64 @@ class ObjectICPRegistration(bpy.types.Operator):
 
         # Find a transformation for the source mesh
         try:
+            # Restrict registration to a region of interest (if one was chosen)
+            source_mask = vertex_mask(source_object, self.region, self.source_group)
+            destination_mask = vertex_mask(destination_object, self.region, self.destination_group)
+
             # We call your implementation here!
             transformations = iterative_closest_point_registration(
                 source, destination,
                 self.k, self.num_points,
                 self.iterations, self.epsilon,
                 self.distance_metric,
+                correspondence_backend=self.correspondence_backend,
+                max_distance=self.max_distance if self.max_distance > 0 else float('inf'),
+                sampling=self.sampling,
+                rejection=self.rejection, overlap=self.overlap, kernel_width=self.kernel_width,
+                seed=self.seed if self.use_seed else None,
+                global_initialization=self.global_initialization,
+                source_mask=source_mask, destination_mask=destination_mask,
                 # TODO: Any additional configuration options you add can be passed in here
             )
         except Exception as error:
             self.report({'WARNING'}, f"Rigid registration failed with error '{error}'")
             return {'CANCELLED'}
 
-        # Determine if convergence was reached
-        converged = len(transformations) < self.iterations
-        self.status = (f"Converged in {len(transformations)} iterations" if converged
+        # Determine if convergence was reached (global initialization isn't counted as an iteration)
+        num_iterations = len(transformations) - int(self.global_initialization)
+        converged = num_iterations < self.iterations
+        self.status = (f"Converged in {num_iterations} iterations" if converged
                        else f"Failed to converge after {self.iterations} iterations")
 
         # Apply the transformation to the source
         # This is done in world-space, leaving the mesh's coordinate space untouched
+        initial_matrix = source_object.matrix_world.copy()
         source_object.matrix_world = net_transformation(transformations) @ source_object.matrix_world
         source_object.data.update()
 
-        # BONUS: You could do more with this list of transformations; producing an animation for example!
+        # The list of transformations can also be baked into an animation of the registration
+        if self.bake_animation:
+            bake_transformations(source_object, transformations, initial_matrix, self.frame_start, self.frame_step)
+
+        # Measure where the source still disagrees with the destination
+        if self.compute_deviation:
+            self.report_deviation(source_object, destination_object)
 
         return {'FINISHED'}
 
+    def report_deviation(self, source_object, destination_object):
+        from .deviation import object_deviation, write_deviation_attributes, deviation_summary
+
+        try:
+            distances = object_deviation(source_object, destination_object, self.deviation_metric)
+            write_deviation_attributes(source_object.data, distances)
+        except Exception as error:
+            self.report({'WARNING'}, f"Deviation map failed with error '{error}'")
+            return
+        summary = deviation_summary(distances)
+        self.status += " (deviation " + ", ".join(f"{name}: {value:.4g}" for name, value in summary.items()) + ")"
+        self.report({'INFO'}, self.status)
+
     def draw(self, context):
         layout = self.layout
 
@@ -134,9 +288,65 @@ class ObjectICPRegistration(bpy.types.Operator):
         # Other hyperparameters
         box = layout.box()
         box.label(text="Hyperparameters")
-        box.prop(self, 'k')
+        box.prop(self, 'rejection', text="")
+        if self.rejection == 'MEDIAN':
+            box.prop(self, 'k')
+        elif self.rejection == 'TRIMMED':
+            box.prop(self, 'overlap')
+        else:
+            box.prop(self, 'kernel_width')
         box.prop(self, 'num_points')
+        box.prop(self, 'global_initialization')
         box.prop(self, 'distance_metric', text="")
+        box.prop(self, 'sampling', text="")
+        row = box.row(align=True)
+        row.prop(self, 'use_seed', text="")
+        row.prop(self, 'seed')
+        layout.separator()
+
+        # Correspondence search
+        box = layout.box()
+        box.label(text="Correspondence Search")
+        box.prop(self, 'correspondence_backend', text="")
+        box.prop(self, 'max_distance')
+        layout.separator()
+
+        # Region of interest
+        box = layout.box()
+        box.label(text="Region of Interest")
+        box.prop(self, 'region', text="")
+        if self.region == 'VERTEX_GROUP':
+            box.prop_search(self, 'source_group', context.view_layer.objects.active, 'vertex_groups')
+            if context.window_manager.rigid_registration_destination is not None:
+                box.prop_search(self, 'destination_group', context.window_manager.rigid_registration_destination,
+                                'vertex_groups')
+        layout.separator()
+
+        # Animation (parts are registered independently, so there's no single sequence of poses to bake)
+        box = layout.box()
+        box.enabled = not self.per_component
+        box.prop(self, 'bake_animation')
+        row = box.row(align=True)
+        row.prop(self, 'frame_start')
+        row.prop(self, 'frame_step')
+        row.enabled = self.bake_animation
+        layout.separator()
+
+        # Assemblies
+        box = layout.box()
+        box.prop(self, 'per_component')
+        row = box.row()
+        row.prop(self, 'assembly_output', text="")
+        row.enabled = self.per_component
+        layout.separator()
+
+        # Deviation map (separated parts leave no single source to measure)
+        box = layout.box()
+        box.enabled = not (self.per_component and self.assembly_output == 'SEPARATE')
+        box.prop(self, 'compute_deviation')
+        row = box.row()
+        row.prop(self, 'deviation_metric', text="")
+        row.enabled = self.compute_deviation
         layout.separator()
 
         # TODO: If you add more features to your ICP implementation, you can provide UI to configure them
@@ -147,3 +357,97 @@ class ObjectICPRegistration(bpy.types.Operator):
     def menu_func(menu, context):
         menu.layout.operator(ObjectICPRegistration.bl_idname)
 
+
+class ObjectMultiViewRegistration(bpy.types.Operator):
+    bl_idname = "object.icp_multiview_registration"
+    bl_label = "Multi-View Registration with ICP"
+    bl_description = "Register the selected scans to each other at once, keeping the active object in place"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    iterations: bpy.props.IntProperty(
+        name="Iterations", description="Maximum number of iterations for each pair of scans",
+        min=1, max=100, default=30
+    )
+    epsilon: bpy.props.FloatProperty(
+        name="ε", description="Minimum step, below which a pair of scans is considered converged",
+        min=0.0, step=0.001, max=0.05, default=0.0001, precision=4
+    )
+    k: bpy.props.FloatProperty(
+        name="k", description="Point-pairs greater than k times the median distance apart are disregarded",
+        min=0.1, step=0.01, max=5.0, default=2.0
+    )
+    num_points: bpy.props.IntProperty(
+        name="# of Points", description="Number of points to sample from each scan",
+        min=1, step=1, default=1000
+    )
+    neighbours: bpy.props.IntProperty(
+        name="Neighbours", description="Number of following scans (in name order) each scan overlaps",
+        min=1, default=1
+    )
+    closed_loop: bpy.props.BoolProperty(
+        name="Closed Loop", description="The last scans overlap the first (e.g. a full turn of a turntable)",
+        default=True
+    )
+
+    # Output parameters
+    status: bpy.props.StringProperty(
+        name="Registration Status", default="Status not set"
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return len([obj for obj in context.selected_objects if obj.type == 'MESH']) > 1
+
+    def execute(self, context):
+        from .sampling import SurfaceSampler
+        from .multiview import multiview_registration, neighbour_pairs
+
+        # Scans are expected to be named in the order they were captured
+        scans = sorted((obj for obj in context.selected_objects if obj.type == 'MESH'), key=lambda obj: obj.name)
+        anchor = scans.index(context.active_object) if context.active_object in scans else 0
+
+        try:
+            for obj in scans:
+                if obj.mode == 'EDIT':
+                    obj.update_from_editmode()
+            samplers = [SurfaceSampler.from_mesh(obj.data, obj.matrix_world) for obj in scans]
+            pairs = neighbour_pairs(len(scans), self.neighbours, self.closed_loop)
+            corrections = multiview_registration(
+                samplers, pairs, self.num_points, self.iterations, self.epsilon, anchor, k=self.k
+            )
+        except Exception as error:
+            self.report({'WARNING'}, f"Multi-view registration failed with error '{error}'")
+            return {'CANCELLED'}
+
+        for obj, correction in zip(scans, corrections):
+            obj.matrix_world = mathutils.Matrix(correction.tolist()) @ obj.matrix_world
+
+        self.status = f"Registered {len(scans)} scans using {len(pairs)} overlapping pairs"
+        return {'FINISHED'}
+
+    def draw(self, context):
+        layout = self.layout
+
+        row = layout.row(align=True)
+        row.prop(self, 'iterations')
+        row.separator()
+        row.prop(self, 'epsilon')
+        layout.separator()
+
+        box = layout.box()
+        box.label(text="Hyperparameters")
+        box.prop(self, 'k')
+        box.prop(self, 'num_points')
+        layout.separator()
+
+        box = layout.box()
+        box.label(text="Overlapping Scans")
+        box.prop(self, 'neighbours')
+        box.prop(self, 'closed_loop')
+        layout.separator()
+
+        layout.prop(self, 'status', text="Status", emboss=False)
+
+    @staticmethod
+    def menu_func(menu, context):
+        menu.layout.operator(ObjectMultiViewRegistration.bl_idname)
@@ -0,0 +1,128 @@
+import bpy
+import mathutils
+import numpy as np
+
+# Value of the 'LINEAR' item of `bpy.types.Keyframe.interpolation`, for use with foreach_set
+LINEAR_INTERPOLATION = 1
+
+
+def cumulative_transformations(transformations: list, initial) -> np.ndarray:
+    """
+    Finds the pose of an object after each step of a registration.
+
+    :param transformations: A list of 4x4 transformation matrices (numpy or mathutils), applied in sequence.
+    :param initial: The 4x4 world matrix of the object before registration.
+    :return: A [len(transformations) + 1, 4, 4] numpy stack, starting with the initial matrix.
+    """
+    poses = [np.asarray(initial, dtype=np.float64)]
+    for t in transformations:
+        poses.append(np.asarray(t, dtype=np.float64) @ poses[-1])
+    return np.stack(poses)
+
+
+def matrix_to_quaternions(rotations: np.ndarray) -> np.ndarray:
+    """
+    Converts a stack of rotation matrices to quaternions, without any sudden sign flips between neighbours.
+
+    :param rotations: A [B, 3, 3] stack of rotation matrices.
+    :return: A [B, 4] matrix of (w, x, y, z) quaternions.
+    """
+    # Shepperd's method: each row of `candidates` is 4 * q_i * q for one component q_i, built from the diagonal
+    # and the sums and differences of opposite entries. Dividing by the largest q_i keeps it well conditioned,
+    # even near half turns, where w and the antisymmetric differences are close to 0
+    m = rotations
+    diagonal = np.stack([
+        1 + m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2],
+        1 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2],
+        1 - m[:, 0, 0] + m[:, 1, 1] - m[:, 2, 2],
+        1 - m[:, 0, 0] - m[:, 1, 1] + m[:, 2, 2],
+    ], axis=1)
+    wx, wy, wz = m[:, 2, 1] - m[:, 1, 2], m[:, 0, 2] - m[:, 2, 0], m[:, 1, 0] - m[:, 0, 1]
+    xy, xz, yz = m[:, 0, 1] + m[:, 1, 0], m[:, 0, 2] + m[:, 2, 0], m[:, 1, 2] + m[:, 2, 1]
+    candidates = np.stack([
+        np.stack([diagonal[:, 0], wx, wy, wz], axis=1),
+        np.stack([wx, diagonal[:, 1], xy, xz], axis=1),
+        np.stack([wy, xy, diagonal[:, 2], yz], axis=1),
+        np.stack([wz, xz, yz, diagonal[:, 3]], axis=1),
+    ], axis=1)
+    q = candidates[np.arange(len(m)), np.argmax(diagonal, axis=1)]
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+
+    # q and -q are the same rotation, choose whichever is closest to the previous key so interpolation is smooth
+    flips = np.where(np.sum(q[1:] * q[:-1], axis=1) < 0, -1, 1)
+    q[1:] *= np.cumprod(flips)[:, None]
+    return q
+
+
+def _write_fcurve(action: bpy.types.Action, data_path: str, index: int, frames: np.ndarray, values: np.ndarray):
+    fcurve = action.fcurves.find(data_path, index=index)
+    if fcurve is None:
+        fcurve = action.fcurves.new(data_path, index=index, action_group="Object Transforms")
+    fcurve.keyframe_points.clear()
+
+    # All keyframes are written in one go, rather than once per frame with `keyframe_insert()`
+    fcurve.keyframe_points.add(len(frames))
+    fcurve.keyframe_points.foreach_set("co", np.stack([frames, values], axis=1).astype(np.float32).ravel())
+    fcurve.keyframe_points.foreach_set("interpolation", np.full(len(frames), LINEAR_INTERPOLATION, dtype=np.int32))
+    fcurve.update()
+
+
+def bake_transformations(
+    obj: bpy.types.Object,
+    transformations: list,
+    initial=None,
+    frame_start: int = 1,
+    frame_step: int = 1,
+) -> int:
+    """
+    Bakes the pose of an object after each step of a registration as keyframes, producing an animation.
+
+    Any existing keyframes on the object's location, rotation and scale channels are replaced.
+
+    :param obj: The object which was registered.
+    :param transformations: The world-space transformations applied to the object, in sequence
+                            (as returned by `iterative_closest_point_registration()`).
+    :param initial: (optional) The world matrix of the object before registration, defaults to its current one.
+    :param frame_start: The frame showing the object before registration.
+    :param frame_step: The number of frames between each step of the registration.
+    :return: The number of frames which were keyed.
+    """
+    world = cumulative_transformations(transformations, obj.matrix_world if initial is None else initial)
+
+    # Keyframes are written in the parent's space
+    basis = world
+    if obj.parent is not None:
+        parent = np.asarray(obj.parent.matrix_world @ obj.matrix_parent_inverse, dtype=np.float64)
+        basis = np.linalg.inv(parent) @ world
+
+    locations = basis[:, :3, 3]
+    scales = np.linalg.norm(basis[:, :3, :3], axis=1)
+    rotations = basis[:, :3, :3] / scales[:, None, :]
+    frames = frame_start + frame_step * np.arange(len(basis), dtype=np.float64)
+
+    if obj.rotation_mode == 'QUATERNION':
+        rotation_path, rotation_values = "rotation_quaternion", matrix_to_quaternions(rotations)
+    elif obj.rotation_mode == 'AXIS_ANGLE':
+        rotation_path, rotation_values = "rotation_axis_angle", np.array([
+            (angle, *axis) for axis, angle in
+            (mathutils.Quaternion(q).to_axis_angle() for q in matrix_to_quaternions(rotations))
+        ])
+    else:
+        # Each euler is chosen to be compatible with the last, to avoid sudden jumps of 360 degrees
+        eulers, previous = [], None
+        for r in rotations:
+            previous = mathutils.Matrix(r.tolist()).to_euler(obj.rotation_mode, *([previous] if previous else []))
+            eulers.append(previous[:])
+        rotation_path, rotation_values = "rotation_euler", np.array(eulers)
+
+    if obj.animation_data is None:
+        obj.animation_data_create()
+    if obj.animation_data.action is None:
+        obj.animation_data.action = bpy.data.actions.new(name=f"{obj.name}Action")
+    action = obj.animation_data.action
+
+    for data_path, values in [("location", locations), (rotation_path, rotation_values), ("scale", scales)]:
+        for i in range(values.shape[1]):
+            _write_fcurve(action, data_path, i, frames, values[:, i])
+
+    return len(frames)
@@ -0,0 +1,345 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import bmesh
+import bpy
+import mathutils
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from .correspondence import build_index
+from .global_registration import global_registration_transformation
+from .iterative_closest_point import point_cloud_registration
+from .sampling import SurfaceSampler
+from ..analysis.snapshot import MeshSnapshot
+from ..analysis.topology import component_labels
+from ..performance.profiling import profiled
+
+
+def _group_by_label(labels: np.ndarray, num_labels: int) -> tuple[np.ndarray, np.ndarray]:
+    # Indices sorted by label (keeping their order within a label), and where each label's run starts and ends,
+    # so every group is a slice of one sort rather than a pass over everything
+    order = np.argsort(labels, kind='stable')
+    return order, np.searchsorted(labels[order], np.arange(num_labels + 1))
+
+
+def _local_indices(order: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    # The index of each element within its own group
+    local = np.empty(len(order), dtype=np.int64)
+    local[order] = np.arange(len(order)) - np.repeat(bounds[:-1], np.diff(bounds))
+    return local
+
+
+def component_properties(
+    vertices: np.ndarray, triangles: np.ndarray, labels: np.ndarray, num_components: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the surface area and (area-weighted) centroid of each connected component of a mesh.
+
+    :param vertices: Collection of n vertex positions, represented by an [n, 3] numpy matrix.
+    :param triangles: Collection of m triangles, represented by an [m, 3] matrix of vertex indices.
+    :param labels: The component of each vertex (see `component_labels()`).
+    :param num_components: The number of components.
+    :return: A pair ([num_components] areas, [num_components, 3] centroids).
+             Components without any faces have no area, and the mean of their vertices as a centroid.
+    """
+    v0, v1, v2 = (vertices[triangles[:, i]] for i in range(3))
+    areas = np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1) / 2
+    face_labels = labels[triangles[:, 0]]
+
+    component_areas = np.bincount(face_labels, weights=areas, minlength=num_components)
+    weighted = (v0 + v1 + v2) / 3 * areas[:, None]
+    centroids = np.stack([
+        np.bincount(face_labels, weights=weighted[:, i], minlength=num_components) for i in range(3)
+    ], axis=1) / np.maximum(component_areas, 1e-30)[:, None]
+
+    # Fall back to the vertex mean for components with no area
+    counts = np.bincount(labels, minlength=num_components)
+    means = np.stack([
+        np.bincount(labels, weights=vertices[:, i], minlength=num_components) for i in range(3)
+    ], axis=1) / np.maximum(counts, 1)[:, None]
+    flat = component_areas <= 0
+    centroids[flat] = means[flat]
+    return component_areas, centroids
+
+
+def pair_components(
+    source_areas: np.ndarray,
+    source_centroids: np.ndarray,
+    destination_areas: np.ndarray,
+    destination_centroids: np.ndarray,
+) -> list[tuple[int, int]]:
+    """
+    Matches the parts of two assemblies, so that each part is paired with the most similar part of the other.
+
+    Parts are compared by how far apart their centroids are (relative to the size of the assembly)
+    and by the ratio of their surface areas, and the pairing with the lowest total cost is chosen.
+
+    :param source_areas: Surface area of each source part.
+    :param source_centroids: Centroid of each source part, an [n, 3] numpy matrix.
+    :param destination_areas: Surface area of each destination part.
+    :param destination_centroids: Centroid of each destination part, an [m, 3] numpy matrix.
+    :return: A list of (source part, destination part) pairs, with min(n, m) entries.
+    """
+    if len(source_areas) == 0 or len(destination_areas) == 0:
+        return []
+    everything = np.concatenate([source_centroids, destination_centroids])
+    scale = max(np.linalg.norm(np.ptp(everything, axis=0)), 1e-9)
+
+    distance_cost = np.linalg.norm(source_centroids[:, None] - destination_centroids[None], axis=2) / scale
+    size_cost = np.abs(np.log(
+        np.maximum(source_areas, 1e-30)[:, None] / np.maximum(destination_areas, 1e-30)[None]
+    ))
+    rows, columns = linear_sum_assignment(distance_cost + size_cost)
+    return list(zip(rows.tolist(), columns.tolist()))
+
+
+@profiled("registration.assembly")
+def assembly_registration(
+    source_vertices: np.ndarray,
+    source_triangles: np.ndarray,
+    source_labels: np.ndarray,
+    destination_vertices: np.ndarray,
+    destination_triangles: np.ndarray,
+    destination_labels: np.ndarray,
+    num_points: int = 1000,
+    iterations: int = 30,
+    epsilon: float = 1e-6,
+    workers: int = None,
+    **kwargs,
+) -> tuple[np.ndarray, list[tuple[int, int]]]:
+    """
+    Registers each part of a multi-part source to the matching part of the destination, independently.
+
+    Parts are paired with `pair_components()`, and the pairs are registered in parallel.
+
+    :param source_vertices: Source vertex positions, an [n, 3] numpy matrix.
+    :param source_triangles: Source triangles, a [t, 3] matrix of vertex indices.
+    :param source_labels: The part each source vertex belongs to, numbered from 0.
+    :param destination_vertices: Destination vertex positions, an [m, 3] numpy matrix.
+    :param destination_triangles: Destination triangles, a [u, 3] matrix of vertex indices.
+    :param destination_labels: The part each destination vertex belongs to, numbered from 0.
+    :param num_points: The number of points sampled from each source part.
+    :param iterations: The maximum number of ICP iterations for each part.
+    :param epsilon: Registration of a part stops once a step is this close to the identity.
+    :param workers: (optional) The number of parts registered at once, defaults to the number of cores.
+    :param sampling: (optional) How points are drawn from the parts, see `SAMPLING_STRATEGIES`.
+    :param seed: (optional) Seed for the random sampling, for reproducible results.
+    :param rng: (optional) A numpy random number generator to sample with, takes precedence over `seed`.
+    :param correspondence_backend: (optional) Nearest-neighbour search used within each part,
+                                   see `CORRESPONDENCE_BACKENDS`, defaults to "CKDTREE".
+    :param source_mask: (optional) Boolean array with one entry per source vertex, restricting registration to them.
+    :param destination_mask: (optional) Boolean array with one entry per destination vertex, likewise.
+    :param global_initialization: (optional) Whether each part starts from a coarse global registration
+                                  (see `global_registration_transformation()`) rather than from where it is.
+    :param kwargs: Additional options passed to `point_cloud_registration()`, e.g. `max_distance`.
+    :return: A pair ([number of source parts, 4, 4] stack of transformations, one for each source part,
+             list of (source part, destination part) pairs).
+             Source parts without a partner, or with no vertices in either region of interest,
+             are left with the identity.
+    """
+    source_triangles = np.asarray(source_triangles, dtype=np.int64).reshape([-1, 3])
+    destination_triangles = np.asarray(destination_triangles, dtype=np.int64).reshape([-1, 3])
+    num_source, num_destination = source_labels.max(initial=-1) + 1, destination_labels.max(initial=-1) + 1
+
+    pairs = pair_components(
+        *component_properties(source_vertices, source_triangles, source_labels, num_source),
+        *component_properties(destination_vertices, destination_triangles, destination_labels, num_destination),
+    )
+
+    # Each part's vertices and triangles are slices of the meshes grouped by part
+    vertex_order, vertex_bounds = _group_by_label(source_labels, num_source)
+    local = _local_indices(vertex_order, vertex_bounds)
+    triangle_order, triangle_bounds = _group_by_label(source_labels[source_triangles[:, 0]], num_source)
+    destination_order, destination_bounds = _group_by_label(destination_labels, num_destination)
+    destination_local = _local_indices(destination_order, destination_bounds)
+    destination_triangle_order, destination_triangle_bounds = _group_by_label(
+        destination_labels[destination_triangles[:, 0]], num_destination
+    )
+
+    # Parts outside the region of interest are paired as usual, but only registered if both sides are in it
+    source_mask, destination_mask = kwargs.get("source_mask"), kwargs.get("destination_mask")
+    for mask, vertices in ((source_mask, source_vertices), (destination_mask, destination_vertices)):
+        if mask is not None and len(mask) != len(vertices):
+            raise Exception(f"The region of interest covers {len(mask)} vertices, but the mesh has {len(vertices)}")
+
+    # Samples are drawn up front (on this thread), so the parallel part only uses prebuilt arrays
+    rng = kwargs.get("rng") or np.random.default_rng(kwargs.get("seed"))
+    global_initialization = kwargs.get("global_initialization", False)
+    jobs = []
+    for s, d in pairs:
+        vertices = vertex_order[vertex_bounds[s]:vertex_bounds[s + 1]]
+        destination_part = destination_order[destination_bounds[d]:destination_bounds[d + 1]]
+        part_mask = None if source_mask is None else source_mask[vertices]
+        destination_part_mask = None if destination_mask is None else destination_mask[destination_part]
+        if (part_mask is not None and not np.any(part_mask)) or \
+                (destination_part_mask is not None and not np.any(destination_part_mask)):
+            continue
+
+        sampler = SurfaceSampler(
+            source_vertices[vertices],
+            local[source_triangles[triangle_order[triangle_bounds[s]:triangle_bounds[s + 1]]]],
+            part_mask,
+        )
+        samples, _ = sampler.sample(num_points, kwargs.get("sampling", "VERTICES"), rng)
+        destination_points = destination_vertices[
+            destination_part if destination_part_mask is None else destination_part[destination_part_mask]
+        ]
+
+        # Global initialization matches surface features, so it also needs the destination part's normals.
+        # Each part gets its own generator, so results don't depend on which thread runs first
+        initial = None
+        if global_initialization:
+            destination_sampler = SurfaceSampler(
+                destination_vertices[destination_part],
+                destination_local[destination_triangles[
+                    destination_triangle_order[destination_triangle_bounds[d]:destination_triangle_bounds[d + 1]]
+                ]],
+                destination_part_mask,
+            )
+            initial = (sampler, destination_sampler, np.random.default_rng(rng.integers(2 ** 63)))
+        jobs.append((s, samples, destination_points, initial))
+
+    backend = kwargs.get("correspondence_backend", "CKDTREE")
+
+    def register(job):
+        _, samples, destination_points, initial = job
+        index = build_index(destination_points, backend, workers=1)
+        if initial is not None:
+            source_sampler, destination_sampler, generator = initial
+            initial = global_registration_transformation(
+                source_sampler.vertices[source_sampler.vertex_indices],
+                source_sampler.vertex_normals[source_sampler.vertex_indices],
+                destination_sampler.vertices[destination_sampler.vertex_indices],
+                destination_sampler.vertex_normals[destination_sampler.vertex_indices],
+                kwargs.get("voxel_size"), generator
+            )
+        transformation, _ = point_cloud_registration(
+            samples, destination_points, index, initial, iterations=iterations, epsilon=epsilon, **kwargs
+        )
+        return transformation
+
+    transformations = np.tile(np.eye(4), (num_source, 1, 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (s, *_), transformation in zip(jobs, executor.map(register, jobs)):
+            transformations[s] = transformation
+    return transformations, pairs
+
+
+def _object_parts(obj: bpy.types.Object) -> tuple[SurfaceSampler, MeshSnapshot, np.ndarray]:
+    if obj.mode == 'EDIT':
+        obj.update_from_editmode()
+    snapshot = MeshSnapshot.from_mesh(obj.data)
+    labels, _ = component_labels(snapshot)
+    return SurfaceSampler.from_mesh(obj.data, obj.matrix_world), snapshot, labels
+
+
+def _apply_offsets(obj: bpy.types.Object, world_vertices: np.ndarray, labels: np.ndarray, transformations: np.ndarray):
+    # Each vertex is moved by its part's world-space transformation, then brought back into object space
+    moved = np.einsum('nij,nj->ni', transformations[labels, :3, :3], world_vertices) + transformations[labels, :3, 3]
+    inverse = np.linalg.inv(np.asarray(obj.matrix_world, dtype=np.float64))
+    local = moved @ inverse[:3, :3].T + inverse[:3, 3]
+
+    # In Edit Mode the mesh is overwritten by the edit BMesh when leaving it, so that's what has to be moved
+    if obj.mode == 'EDIT':
+        mesh = bmesh.from_edit_mesh(obj.data)
+        for vertex, co in zip(mesh.verts, local.tolist()):
+            vertex.co = co
+        bmesh.update_edit_mesh(obj.data)
+        return
+    obj.data.vertices.foreach_set("co", local.astype(np.float32).ravel())
+    obj.data.update()
+
+
+def _separate_parts(
+    obj: bpy.types.Object, snapshot: MeshSnapshot, labels: np.ndarray, transformations: np.ndarray
+) -> list:
+    # Like Blender's "Separate by Loose Parts", the original object keeps the first part.
+    # Each part is built from its own slice of the mesh, the same way `Mesh.from_pydata()` fills a mesh in bulk
+    world, source = obj.matrix_world.copy(), obj.data
+    num_parts = len(transformations)
+    vertex_order, vertex_bounds = _group_by_label(labels, num_parts)
+    local = _local_indices(vertex_order, vertex_bounds)
+    edge_order, edge_bounds = _group_by_label(labels[snapshot.edges[:, 0]], num_parts)
+    face_order, face_bounds = _group_by_label(labels[snapshot.loop_vertices[snapshot.loop_starts]], num_parts)
+
+    # Per-face and per-corner data carried over to the parts
+    material_indices = np.zeros(snapshot.num_faces, dtype=np.int32)
+    source.polygons.foreach_get("material_index", material_indices)
+    smooth = np.zeros(snapshot.num_faces, dtype=bool)
+    source.polygons.foreach_get("use_smooth", smooth)
+    uv_maps = {}
+    for layer in source.uv_layers:
+        uv_maps[layer.name] = np.zeros(len(snapshot.loop_vertices) * 2, dtype=np.float32)
+        layer.data.foreach_get("uv", uv_maps[layer.name])
+
+    parts = []
+    for label, transformation in enumerate(transformations):
+        vertices = vertex_order[vertex_bounds[label]:vertex_bounds[label + 1]]
+        edges = edge_order[edge_bounds[label]:edge_bounds[label + 1]]
+        faces = face_order[face_bounds[label]:face_bounds[label + 1]]
+        totals = snapshot.loop_totals[faces]
+        starts = np.cumsum(totals) - totals
+        corners = np.repeat(snapshot.loop_starts[faces] - starts, totals) + np.arange(int(totals.sum()))
+
+        data = bpy.data.meshes.new(f"{source.name}.part{label}")
+        data.vertices.add(len(vertices))
+        data.vertices.foreach_set("co", snapshot.vertices[vertices].astype(np.float32).ravel())
+        data.edges.add(len(edges))
+        data.edges.foreach_set("vertices", local[snapshot.edges[edges]].astype(np.int32).ravel())
+        data.loops.add(len(corners))
+        data.loops.foreach_set("vertex_index", local[snapshot.loop_vertices[corners]].astype(np.int32))
+        data.polygons.add(len(faces))
+        data.polygons.foreach_set("loop_start", starts.astype(np.int32))
+        data.polygons.foreach_set("material_index", material_indices[faces])
+        data.polygons.foreach_set("use_smooth", smooth[faces])
+        for name, uvs in uv_maps.items():
+            data.uv_layers.new(name=name).data.foreach_set("uv", uvs.reshape([-1, 2])[corners].ravel())
+        for material in source.materials:
+            data.materials.append(material)
+        data.update(calc_edges=True)
+
+        part = obj if label == 0 else obj.copy()
+        if label > 0:
+            part.name = f"{obj.name}.part{label}"
+            for collection in obj.users_collection:
+                collection.objects.link(part)
+        part.data = data
+        part.matrix_world = mathutils.Matrix(transformation.tolist()) @ world
+        parts.append(part)
+    return parts
+
+
+def register_assembly(
+    source_object: bpy.types.Object, destination_object: bpy.types.Object, output: str = "OFFSETS", **kwargs
+) -> list[tuple[int, int]]:
+    """
+    Registers each connected component of the source object to the matching component of the destination object.
+
+    :param source_object: A mesh object made up of several parts.
+    :param destination_object: The mesh object to register it to.
+    :param output: How the transformations are applied, one of the identifiers in `ASSEMBLY_OUTPUTS`:
+                   "OFFSETS" moves each part's vertices within the source mesh,
+                   "SEPARATE" splits the source into one object per part, each with its own world matrix
+                   (leaving Edit Mode first, since the source's mesh is replaced).
+    :param kwargs: Options passed to `assembly_registration()`.
+    :return: The list of (source part, destination part) pairs which were registered.
+    """
+    if output == "SEPARATE" and source_object.mode == 'EDIT':
+        # Edit mode keeps its own copy of the mesh, which would be written over the first part
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    source, source_snapshot, source_labels = _object_parts(source_object)
+    destination, _, destination_labels = _object_parts(destination_object)
+    transformations, pairs = assembly_registration(
+        source.vertices, source.triangles, source_labels,
+        destination.vertices, destination.triangles, destination_labels,
+        **kwargs
+    )
+
+    if output == "OFFSETS":
+        _apply_offsets(source_object, source.vertices, source_labels, transformations)
+    elif output == "SEPARATE":
+        _separate_parts(source_object, source_snapshot, source_labels, transformations)
+    else:
+        raise Exception(f"Unrecognized assembly output '{output}'")
+    return pairs
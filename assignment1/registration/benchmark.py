@@ -0,0 +1,198 @@
+import itertools
+import math
+import time
+
+import bmesh
+import mathutils
+import numpy as np
+
+from .iterative_closest_point import iterative_closest_point_registration, net_transformation
+
+
+def benchmark_mesh(subdivisions: int = 0) -> bmesh.types.BMesh:
+    """
+    Produces a test mesh for benchmarking, without adding anything to the scene.
+
+    Suzanne is used rather than one of the primitives, because the symmetries of spheres, cubes and tori
+    make several different transformations equally "correct", which would make the rotation error meaningless.
+
+    :param subdivisions: Number of edge cuts used to densify the mesh, larger values produce larger point clouds.
+    :return: A new BMesh.
+    """
+    mesh = bmesh.new()
+    bmesh.ops.create_monkey(mesh)
+    if subdivisions > 0:
+        bmesh.ops.subdivide_edges(mesh, edges=mesh.edges[:], cuts=subdivisions, use_grid_fill=True)
+    return mesh
+
+
+def random_rigid_transformation(magnitude: float, rng: np.random.Generator) -> mathutils.Matrix:
+    """
+    Generates a ground-truth rigid transformation of a known size.
+
+    :param magnitude: Rotation angle (in radians) about a random axis, and length of a random translation.
+    :param rng: Random number generator to draw the axis and direction from.
+    :return: A 4x4 transformation matrix containing only rotation and translation.
+    """
+    axis = mathutils.Vector(rng.normal(size=3)).normalized()
+    direction = mathutils.Vector(rng.normal(size=3)).normalized()
+    return mathutils.Matrix.Translation(direction * magnitude) @ mathutils.Matrix.Rotation(magnitude, 4, axis)
+
+
+def transformation_error(expected: mathutils.Matrix, estimated: mathutils.Matrix) -> tuple[float, float]:
+    """
+    Compares an estimated transformation with the ground truth.
+
+    :param expected: The ground-truth transformation.
+    :param estimated: The transformation found by registration.
+    :return: A pair (rotation error in degrees, translation error in mesh units).
+    """
+    rotation_error = expected.to_quaternion().rotation_difference(estimated.to_quaternion()).angle
+    translation_error = (expected.to_translation() - estimated.to_translation()).length
+    return math.degrees(rotation_error), translation_error
+
+
+def run_case(
+    mesh: bmesh.types.BMesh,
+    transformation: mathutils.Matrix,
+    noise: float,
+    rng: np.random.Generator,
+    **icp_kwargs,
+) -> dict:
+    """
+    Runs a single registration against a known transformation and measures the result.
+
+    The destination is a transformed (and optionally noisy) copy of the mesh, so the registration should recover
+    the ground-truth transformation exactly.
+
+    :param mesh: The mesh to register, it is copied and left unchanged.
+    :param transformation: The ground-truth transformation applied to the destination.
+    :param noise: Standard deviation of gaussian noise added to the destination vertices.
+    :param rng: Random number generator used for the noise.
+    :param icp_kwargs: Arguments passed on to `iterative_closest_point_registration`.
+    :return: A dictionary with the wall time, ICP iteration count and final errors.
+             When `global_initialization` is used, its step isn't counted as an iteration (as in the operator),
+             and the errors left after it are reported separately (`global_rotation_error`
+             and `global_translation_error`, otherwise NaN).
+    """
+    global_step = bool(icp_kwargs.get("global_initialization", False))
+    source, destination = mesh.copy(), mesh.copy()
+    destination.transform(transformation)
+    if noise > 0:
+        for v in destination.verts:
+            v.co += mathutils.Vector(rng.normal(scale=noise, size=3))
+
+    start = time.perf_counter()
+    try:
+        transformations = iterative_closest_point_registration(source, destination, **icp_kwargs)
+    except Exception as error:
+        return {
+            "time": time.perf_counter() - start, "iterations": 0, "global_initialization": global_step,
+            "global_rotation_error": math.nan, "global_translation_error": math.nan,
+            "rotation_error": math.nan, "translation_error": math.nan, "error": str(error),
+        }
+    elapsed = time.perf_counter() - start
+
+    # The first transformation is the global step's, when there is one
+    global_rotation_error, global_translation_error = math.nan, math.nan
+    if global_step and transformations:
+        global_rotation_error, global_translation_error = transformation_error(transformation, transformations[0])
+    rotation_error, translation_error = transformation_error(transformation, net_transformation(transformations))
+    return {
+        "time": elapsed, "iterations": len(transformations) - int(global_step), "global_initialization": global_step,
+        "global_rotation_error": global_rotation_error, "global_translation_error": global_translation_error,
+        "rotation_error": rotation_error, "translation_error": translation_error, "error": None,
+    }
+
+
+def run_benchmark(
+    subdivisions=(0, 1, 2),
+    num_points=(250, 500, 1000),
+    k=(1.5, 2.0, 2.5),
+    perturbations=(0.01, 0.05, 0.1),
+    noise_levels=(0.0, 0.005),
+    distance_metrics=("POINT_TO_POINT",),
+    sampling_strategies=("VERTICES", "AREA"),
+    repeats: int = 3,
+    iterations: int = 100,
+    epsilon: float = 0.0005,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Sweeps ICP hyperparameters against generated ground-truth transformations.
+
+    Every combination of the given parameters is run `repeats` times, each with a new random transformation.
+    The results can be used to find a good trade-off between accuracy and run-time (see `pareto_front()`),
+    and to measure the effect of changes to the registration code.
+
+    :param subdivisions: Mesh densities to test (see `benchmark_mesh()`).
+    :param num_points: Values of `num_points` to test.
+    :param k: Values of the rejection coefficient `k` to test.
+    :param perturbations: Magnitudes of the ground-truth transformations (see `random_rigid_transformation()`).
+    :param noise_levels: Standard deviations of the noise added to the destination.
+    :param distance_metrics: Distance metrics to test. Only "POINT_TO_POINT" by default, since "POINT_TO_PLANE"
+                             estimation isn't implemented yet (every run with it would only record the error).
+    :param sampling_strategies: Sampling strategies to test (see `SAMPLING_STRATEGIES`).
+    :param repeats: Number of random transformations to test for each combination of parameters.
+    :param iterations: Maximum number of ICP iterations.
+    :param epsilon: ICP convergence threshold.
+    :param seed: Seed for the ground-truth transformations, noise and point sampling.
+    :return: A list of results, one per run, containing the parameters used and the measurements.
+    """
+    rng = np.random.default_rng(seed)
+
+    results = []
+    for s in subdivisions:
+        mesh = benchmark_mesh(s)
+        for n, k_, magnitude, noise, metric, sampling in itertools.product(
+            num_points, k, perturbations, noise_levels, distance_metrics, sampling_strategies
+        ):
+            for _ in range(repeats):
+                result = run_case(
+                    mesh, random_rigid_transformation(magnitude, rng), noise, rng,
+                    k=k_, num_points=n, iterations=iterations, epsilon=epsilon, distance_metric=metric,
+                    sampling=sampling, rng=rng,
+                )
+                results.append({
+                    "vertices": len(mesh.verts), "num_points": n, "k": k_,
+                    "perturbation": magnitude, "noise": noise, "distance_metric": metric, "sampling": sampling,
+                    **result
+                })
+        mesh.free()
+    return results
+
+
+def pareto_front(results: list[dict], cost: str = "time", error: str = "rotation_error") -> list[dict]:
+    """
+    Finds the runs which are not beaten on both cost and error by any other run.
+
+    :param results: Results produced by `run_benchmark()`.
+    :param cost: The measurement to minimize along the first axis.
+    :param error: The measurement to minimize along the second axis.
+    :return: The Pareto-optimal results, sorted by increasing cost.
+    """
+    front = []
+    for result in sorted((r for r in results if r["error"] is None), key=lambda r: (r[cost], r[error])):
+        if not front or result[error] < front[-1][error]:
+            front.append(result)
+    return front
+
+
+def format_results(results: list[dict]) -> str:
+    """
+    Formats benchmark results as a plain-text table.
+
+    :param results: Results produced by `run_benchmark()`.
+    :return: One line per result, preceded by a header.
+    """
+    header = (f"{'verts':>7} {'points':>6} {'k':>4} {'perturb':>7} {'noise':>6} {'metric':>14} {'sampling':>12} "
+              f"{'time (s)':>9} {'iters':>5} {'global (deg)':>12} {'rot (deg)':>9} {'trans':>9}")
+    lines = [header]
+    for r in results:
+        lines.append(
+            f"{r['vertices']:>7} {r['num_points']:>6} {r['k']:>4.1f} {r['perturbation']:>7.3f} {r['noise']:>6.3f} "
+            f"{r['distance_metric']:>14} {r['sampling']:>12} {r['time']:>9.4f} {r['iterations']:>5} "
+            f"{r['global_rotation_error']:>12.4f} {r['rotation_error']:>9.4f} {r['translation_error']:>9.5f}"
+            + (f"  ({r['error']})" if r["error"] else "")
+        )
+    return "\n".join(lines)
@@ -0,0 +1,147 @@
+import numpy as np
+from scipy.spatial import KDTree, cKDTree
+
+from ..performance.profiling import profiled
+
+
+class KDTreeIndex:
+    """
+    Nearest-neighbour search using `scipy.spatial.KDTree` with its default settings.
+
+    All indices share the same query interface:
+    `query(points, max_distance)` returns a pair of arrays `(distances, indices)`, one entry per query point.
+    Query points with no neighbour within `max_distance` have an infinite distance and an index of `len(index)`.
+    """
+
+    def __init__(self, points: np.ndarray, **kwargs):
+        self.tree = KDTree(points)
+
+    def __len__(self):
+        return self.tree.n
+
+    def query(self, points: np.ndarray, max_distance: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        return self.tree.query(points, distance_upper_bound=max_distance)
+
+
+class CKDTreeIndex:
+    """
+    Nearest-neighbour search using `scipy.spatial.cKDTree`, queried in parallel.
+
+    A larger leaf size than the default gives shallower trees, which are faster to build and query for
+    the point counts used in registration.
+    Building without median balancing is faster and produces trees which are just as good for surface samples.
+
+    NOTE: SciPy always stores KD-tree points in double precision, so `dtype` has no effect here.
+    """
+
+    def __init__(self, points: np.ndarray, leafsize: int = 32, workers: int = -1, **kwargs):
+        self.tree = cKDTree(points, leafsize=leafsize, balanced_tree=False, compact_nodes=False)
+        self.workers = workers
+
+    def __len__(self):
+        return self.tree.n
+
+    def query(self, points: np.ndarray, max_distance: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        return self.tree.query(points, distance_upper_bound=max_distance, workers=self.workers)
+
+
+class VoxelHashIndex:
+    """
+    Nearest-neighbour search using a uniform grid of cubic cells.
+
+    Points are bucketed by cell, and only the 27 cells around each query point are searched.
+    This makes queries much cheaper than a tree when the expected displacement is small,
+    but neighbours further than one cell away are never found:
+    any match further than `cell_size` is treated as missing, so that all reported matches are exact.
+
+    Cells are stored as a sorted array of cell keys (a hash table without collisions), with points grouped by cell.
+    Points are stored in single precision by default, halving memory use.
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float = None, dtype=np.float32, **kwargs):
+        points = np.asarray(points)
+        if cell_size is None:
+            # With this size, a surface sample has roughly cbrt(n) points in each occupied cell
+            extent = np.ptp(points, axis=0).max() if len(points) else 1.0
+            cell_size = max(extent, 1e-9) / max(len(points), 1) ** (1 / 3)
+        self.cell_size = float(cell_size)
+        self.origin = points.min(axis=0) if len(points) else np.zeros(3)
+
+        # Pad by one cell on each side, so that all neighbours of a stored point have valid coordinates
+        coordinates = self._coordinates(points)
+        self.shape = coordinates.max(axis=0) + 2 if len(points) else np.ones(3, dtype=np.int64)
+
+        keys = self._keys(coordinates)
+        order = np.argsort(keys, kind='stable')
+        self.cells, self.starts, self.counts = np.unique(keys[order], return_index=True, return_counts=True)
+        self.order = order
+        self.points = points[order].astype(dtype)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _coordinates(self, points: np.ndarray) -> np.ndarray:
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64) + 1
+
+    def _keys(self, coordinates: np.ndarray) -> np.ndarray:
+        return (coordinates[:, 0] * self.shape[1] + coordinates[:, 1]) * self.shape[2] + coordinates[:, 2]
+
+    def query(self, points: np.ndarray, max_distance: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        points = np.asarray(points, dtype=self.points.dtype)
+        coordinates = self._coordinates(points)
+
+        # Find every non-empty cell around each query point
+        query_indices, starts, counts = [], [], []
+        for offset in np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1]), axis=-1).reshape(-1, 3):
+            neighbours = coordinates + offset
+            in_grid = np.all((neighbours >= 0) & (neighbours < self.shape), axis=1)
+            keys = self._keys(neighbours)
+            slots = np.minimum(np.searchsorted(self.cells, keys), len(self.cells) - 1)
+            found = in_grid & (self.cells[slots] == keys) if len(self.cells) else np.zeros(len(points), dtype=bool)
+            query_indices.append(np.flatnonzero(found))
+            starts.append(self.starts[slots[found]])
+            counts.append(self.counts[slots[found]])
+        query_indices, starts, counts = map(np.concatenate, (query_indices, starts, counts))
+
+        # Expand each cell into the indices of the points it contains
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = np.repeat(starts, counts) + offsets
+        query_indices = np.repeat(query_indices, counts)
+        squared_distances = np.sum((self.points[candidates] - points[query_indices]) ** 2, axis=1)
+
+        # Keep the closest candidate for each query point
+        order = np.lexsort((squared_distances, query_indices))
+        query_indices, candidates = query_indices[order], candidates[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = query_indices[1:] != query_indices[:-1]
+
+        distances = np.full(len(points), np.inf)
+        indices = np.full(len(points), len(self.points))
+        distances[query_indices[first]] = np.sqrt(squared_distances[order][first])
+        indices[query_indices[first]] = self.order[candidates[first]]
+
+        # Matches beyond the searched cells (or the cutoff) can't be trusted to be the nearest neighbour
+        missing = distances > min(max_distance, self.cell_size)
+        distances[missing], indices[missing] = np.inf, len(self.points)
+        return distances, indices
+
+
+@profiled("index")
+def build_index(points: np.ndarray, backend: str = "KDTREE", **kwargs):
+    """
+    Builds a nearest-neighbour index over a set of points.
+
+    :param points: Collection of n points to search, represented by an [n, 3] numpy matrix.
+    :param backend: One of the identifiers in `CORRESPONDENCE_BACKENDS`.
+    :param kwargs: Backend-specific settings, e.g. `workers` and `leafsize` for "CKDTREE",
+                   or `cell_size` and `dtype` for "VOXEL_HASH". Settings a backend doesn't use are ignored.
+    :return: An index with a `query(points, max_distance)` method.
+    """
+    if backend == "KDTREE":
+        return KDTreeIndex(points, **kwargs)
+    elif backend == "CKDTREE":
+        return CKDTreeIndex(points, **kwargs)
+    elif backend == "VOXEL_HASH":
+        return VoxelHashIndex(points, **kwargs)
+    else:
+        raise Exception(f"Unrecognized correspondence backend '{backend}'")
@@ -0,0 +1,184 @@
+import hashlib
+
+import bpy
+import numpy as np
+
+from .correspondence import build_index
+from ..performance.profiling import profiled
+
+# Names of the mesh attributes written by `write_deviation_attributes()`
+DEVIATION_ATTRIBUTE = "registration_deviation"
+DEVIATION_COLOR_ATTRIBUTE = "registration_deviation_color"
+
+# Percentiles reported by `deviation_summary()`
+DEVIATION_PERCENTILES = (50, 90, 99)
+
+# Destination indices are reused for as long as the destination doesn't move or change shape
+_index_cache = {}
+_INDEX_CACHE_SIZE = 4
+
+
+@profiled("extract")
+def world_vertices(obj: bpy.types.Object) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reads the world-space vertex positions and normals of a mesh object in bulk.
+
+    :param obj: A mesh object.
+    :return: A pair of [n, 3] numpy matrices (positions, unit normals).
+    """
+    if obj.mode == 'EDIT':
+        obj.update_from_editmode()
+    mesh = obj.data
+    vertices = np.zeros(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", vertices)
+    normals = np.zeros(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("normal", normals)
+
+    # Normals are transformed by the inverse transpose, so that they stay perpendicular under non-uniform scaling
+    matrix = np.asarray(obj.matrix_world, dtype=np.float64)
+    vertices = vertices.reshape([-1, 3]) @ matrix[:3, :3].T + matrix[:3, 3]
+    normals = normals.reshape([-1, 3]) @ np.linalg.inv(matrix[:3, :3])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-30)[:, None]
+    return vertices, normals
+
+
+def cached_index(points: np.ndarray, backend: str = "CKDTREE", **kwargs):
+    """
+    Builds a nearest-neighbour index over a set of points, or reuses the one built last time for the same points.
+
+    Indices are keyed by a hash of the raw point data, so any change to the points builds a new index.
+    Only the most recently used indices are kept.
+
+    :param points: Collection of n points to search, represented by an [n, 3] numpy matrix.
+    :param backend: One of the identifiers in `CORRESPONDENCE_BACKENDS`.
+    :param kwargs: Backend-specific settings, see `build_index()`.
+    :return: An index with a `query(points, max_distance)` method.
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    digest = hashlib.blake2b(points.view(np.uint8), digest_size=16).hexdigest()
+    key = (digest, len(points), backend, tuple(sorted(kwargs.items())))
+
+    index = _index_cache.pop(key, None)
+    if index is None:
+        index = build_index(points, backend, **kwargs)
+    _index_cache[key] = index
+    while len(_index_cache) > _INDEX_CACHE_SIZE:
+        del _index_cache[next(iter(_index_cache))]
+    return index
+
+
+@profiled("registration.deviation")
+def deviation_distances(
+    source_points: np.ndarray,
+    destination_points: np.ndarray,
+    destination_normals: np.ndarray = None,
+    distance_metric: str = "POINT_TO_POINT",
+    backend: str = "CKDTREE",
+) -> np.ndarray:
+    """
+    Finds how far each source point is from the destination.
+
+    Distances are measured to the nearest destination point, or to the plane through it for "POINT_TO_PLANE"
+    (which doesn't penalize points that have slid along a flat surface).
+
+    :param source_points: Collection of n points to measure, represented by an [n, 3] numpy matrix.
+    :param destination_points: Collection of m points to measure against, represented by an [m, 3] numpy matrix.
+    :param destination_normals: Unit normals of the destination points, needed for "POINT_TO_PLANE".
+    :param distance_metric: "POINT_TO_POINT" or "POINT_TO_PLANE".
+    :param backend: Nearest-neighbour search to use, see `CORRESPONDENCE_BACKENDS`.
+    :return: An array of n non-negative distances.
+    """
+    if len(destination_points) == 0:
+        raise Exception("Can't measure deviation from a mesh with no vertices")
+    distances, indices = cached_index(destination_points, backend).query(source_points)
+
+    if distance_metric == "POINT_TO_POINT":
+        return distances
+    elif distance_metric == "POINT_TO_PLANE":
+        offsets = source_points - destination_points[indices]
+        return np.abs(np.einsum('ij,ij->i', offsets, destination_normals[indices]))
+    else:
+        raise Exception(f"Unrecognized distance metric '{distance_metric}'")
+
+
+def deviation_summary(distances: np.ndarray) -> dict:
+    """
+    :param distances: Per-vertex deviations, as returned by `deviation_distances()`.
+    :return: A dictionary with the percentiles in `DEVIATION_PERCENTILES` (as "p50", ...) and the maximum ("max").
+    """
+    if len(distances) == 0:
+        return {**{f"p{p}": 0.0 for p in DEVIATION_PERCENTILES}, "max": 0.0}
+    values = np.percentile(distances, [*DEVIATION_PERCENTILES, 100])
+    return {**{f"p{p}": float(v) for p, v in zip(DEVIATION_PERCENTILES, values)}, "max": float(values[-1])}
+
+
+def deviation_colors(distances: np.ndarray, scale: float) -> np.ndarray:
+    """
+    Maps deviations to a blue (no deviation) to red (`scale` or more) ramp, passing through green and yellow.
+
+    :param distances: Per-vertex deviations.
+    :param scale: The deviation shown in red.
+    :return: An [n, 4] numpy matrix of linear RGBA colours.
+    """
+    t = np.clip(distances / max(scale, 1e-12), 0, 1)
+    colors = np.ones([len(t), 4])
+    colors[:, 0] = np.clip(2 * t - 0.5, 0, 1)
+    colors[:, 1] = np.clip(1.5 - np.abs(4 * t - 2), 0, 1)
+    colors[:, 2] = np.clip(1.5 - 2 * t, 0, 1)
+    return colors
+
+
+def _point_attribute(mesh: bpy.types.Mesh, name: str, data_type: str):
+    attribute = mesh.attributes.get(name)
+    if attribute is not None and (attribute.data_type != data_type or attribute.domain != 'POINT'):
+        mesh.attributes.remove(attribute)
+        attribute = None
+    if attribute is None:
+        attribute = mesh.attributes.new(name, data_type, 'POINT')
+    return attribute
+
+
+def write_deviation_attributes(mesh: bpy.types.Mesh, distances: np.ndarray, scale: float = None) -> None:
+    """
+    Stores per-vertex deviations on a mesh, replacing any from a previous registration.
+
+    The raw distances are written to the float attribute `DEVIATION_ATTRIBUTE`,
+    and a colour ramp of them to the colour attribute `DEVIATION_COLOR_ATTRIBUTE`,
+    which is made active so it can be shown in the viewport (Solid shading, Color: Attribute).
+
+    :param mesh: The mesh datablock the distances were measured for, with one distance per vertex.
+    :param distances: Per-vertex deviations.
+    :param scale: (optional) The deviation shown in red, defaults to the 99th percentile.
+    """
+    if len(distances) != len(mesh.vertices):
+        raise Exception(f"Expected {len(mesh.vertices)} deviations for '{mesh.name}', got {len(distances)}")
+    if scale is None:
+        scale = deviation_summary(distances)["p99"]
+
+    _point_attribute(mesh, DEVIATION_ATTRIBUTE, 'FLOAT').data.foreach_set(
+        "value", np.asarray(distances, dtype=np.float32)
+    )
+    color_attribute = _point_attribute(mesh, DEVIATION_COLOR_ATTRIBUTE, 'FLOAT_COLOR')
+    color_attribute.data.foreach_set("color", deviation_colors(distances, scale).astype(np.float32).ravel())
+    mesh.color_attributes.active_color = color_attribute
+    mesh.update()
+
+
+def object_deviation(
+    source_object: bpy.types.Object,
+    destination_object: bpy.types.Object,
+    distance_metric: str = "POINT_TO_POINT",
+    backend: str = "CKDTREE",
+) -> np.ndarray:
+    """
+    Finds how far each vertex of the source object is from the destination object, in world space.
+
+    :param source_object: A mesh object, usually after registration.
+    :param destination_object: The mesh object it was registered to.
+    :param distance_metric: "POINT_TO_POINT" or "POINT_TO_PLANE", see `deviation_distances()`.
+    :param backend: Nearest-neighbour search to use, see `CORRESPONDENCE_BACKENDS`.
+    :return: An array with one distance per source vertex.
+    """
+    source_points, _ = world_vertices(source_object)
+    destination_points, destination_normals = world_vertices(destination_object)
+    return deviation_distances(source_points, destination_points, destination_normals, distance_metric, backend)
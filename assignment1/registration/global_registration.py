@@ -0,0 +1,227 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from ..performance.profiling import profiled
+
+# Number of bins in each of the three angular histograms making up a descriptor
+HISTOGRAM_BINS = 11
+
+# Maximum number of neighbours used to describe each point
+DESCRIPTOR_NEIGHBOURS = 24
+
+# Hypotheses tested by RANSAC, and how many are generated and scored at once
+RANSAC_HYPOTHESES = 4096
+RANSAC_BATCH = 128
+
+
+def voxel_downsample(points: np.ndarray, normals: np.ndarray, voxel_size: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Replaces the points in each cell of a uniform grid with their average.
+
+    This evens out the density of the points, so that descriptors computed from neighbourhoods are comparable
+    between meshes which were tessellated differently.
+
+    :param points: Collection of n points, represented by an [n, 3] numpy matrix.
+    :param normals: Unit normals of the points, represented by an [n, 3] numpy matrix.
+    :param voxel_size: Width of each grid cell.
+    :return: A pair of [m, 3] matrices (averaged points, averaged unit normals), with one row per occupied cell.
+    """
+    cells = np.floor((points - points.min(axis=0)) / voxel_size).astype(np.int64)
+    _, inverse, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+
+    sums = np.stack([np.bincount(inverse, weights=points[:, i], minlength=len(counts)) for i in range(3)], axis=1)
+    normal_sums = np.stack([np.bincount(inverse, weights=normals[:, i], minlength=len(counts)) for i in range(3)], axis=1)
+    normal_sums /= np.maximum(np.linalg.norm(normal_sums, axis=1), 1e-30)[:, None]
+    return sums / counts[:, None], normal_sums
+
+
+def _point_feature_histograms(
+    points: np.ndarray, normals: np.ndarray, neighbours: np.ndarray, valid: np.ndarray
+) -> np.ndarray:
+    # Angles between each point's normal and each neighbour's normal, in the point's Darboux frame
+    offsets = points[neighbours] - points[:, None, :]
+    offsets /= np.maximum(np.linalg.norm(offsets, axis=2), 1e-30)[..., None]
+    u = np.broadcast_to(normals[:, None, :], offsets.shape)
+    v = np.cross(u, offsets)
+    v /= np.maximum(np.linalg.norm(v, axis=2), 1e-30)[..., None]
+    w = np.cross(u, v)
+    neighbour_normals = normals[neighbours]
+
+    features = [
+        np.einsum('nki,nki->nk', v, neighbour_normals),
+        np.einsum('nki,nki->nk', u, offsets),
+        np.arctan2(np.einsum('nki,nki->nk', w, neighbour_normals), np.einsum('nki,nki->nk', u, neighbour_normals)),
+    ]
+    ranges = [(-1, 1), (-1, 1), (-np.pi, np.pi)]
+
+    # All three histograms of every point are filled with one call to bincount
+    rows = np.repeat(np.arange(len(points)) * 3 * HISTOGRAM_BINS, neighbours.shape[1]).reshape(neighbours.shape)
+    bins = []
+    for i, (feature, (low, high)) in enumerate(zip(features, ranges)):
+        b = np.clip(((feature - low) / (high - low) * HISTOGRAM_BINS).astype(np.int64), 0, HISTOGRAM_BINS - 1)
+        bins.append(rows + i * HISTOGRAM_BINS + b)
+    histograms = np.bincount(
+        np.concatenate([b[valid] for b in bins]), minlength=len(points) * 3 * HISTOGRAM_BINS
+    ).reshape([len(points), 3 * HISTOGRAM_BINS]).astype(np.float64)
+    return histograms / np.maximum(valid.sum(axis=1), 1)[:, None]
+
+
+def feature_descriptors(points: np.ndarray, normals: np.ndarray, radius: float) -> np.ndarray:
+    """
+    Describes the shape of the surface around each point with a Fast Point Feature Histogram (FPFH).
+
+    Each point gets histograms of the angles between its normal and the normals of its neighbours,
+    which are then blended with the histograms of its neighbours (weighted by inverse distance).
+    The descriptors don't change when the points are rotated or translated, so they can be matched between scans
+    whatever their relative orientation.
+
+    :param points: Collection of n points, represented by an [n, 3] numpy matrix.
+    :param normals: Unit normals of the points, represented by an [n, 3] numpy matrix.
+    :param radius: Neighbours further than this from a point are ignored.
+    :return: An [n, 3 * HISTOGRAM_BINS] matrix of unit-length descriptors.
+    """
+    tree = cKDTree(points)
+    distances, neighbours = tree.query(
+        points, k=DESCRIPTOR_NEIGHBOURS + 1, distance_upper_bound=radius, workers=-1
+    )
+
+    # The closest point found is the point itself
+    distances, neighbours = distances[:, 1:], neighbours[:, 1:]
+    valid = np.isfinite(distances) & (distances > 0)
+    neighbours = np.where(valid, neighbours, 0)
+
+    histograms = _point_feature_histograms(points, normals, neighbours, valid)
+    weights = np.where(valid, 1 / np.where(valid, distances, 1), 0)
+    blended = np.einsum('nk,nkf->nf', weights, histograms[neighbours]) / np.maximum(weights.sum(axis=1), 1e-30)[:, None]
+
+    descriptors = histograms + blended
+    return descriptors / np.maximum(np.linalg.norm(descriptors, axis=1), 1e-30)[:, None]
+
+
+def match_descriptors(
+    source_descriptors: np.ndarray, destination_descriptors: np.ndarray, mutual: bool = True
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs each source descriptor with the most similar destination descriptor.
+
+    :param source_descriptors: An [n, d] matrix of descriptors.
+    :param destination_descriptors: An [m, d] matrix of descriptors.
+    :param mutual: Whether to keep only pairs which are each other's best match.
+                   If fewer than three pairs remain, every source descriptor is paired instead.
+    :return: A pair of index arrays (source indices, destination indices).
+    """
+    _, forward = cKDTree(destination_descriptors).query(source_descriptors, workers=-1)
+    source_indices = np.arange(len(source_descriptors))
+    if mutual:
+        _, backward = cKDTree(source_descriptors).query(destination_descriptors, workers=-1)
+        consistent = backward[forward] == source_indices
+        if np.count_nonzero(consistent) >= 3:
+            return source_indices[consistent], forward[consistent]
+    return source_indices, forward
+
+
+def ransac_transformation(
+    source_points: np.ndarray,
+    destination_points: np.ndarray,
+    threshold: float,
+    hypotheses: int = RANSAC_HYPOTHESES,
+    rng: np.random.Generator = None,
+    edge_similarity: float = 0.9,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the rigid transformation agreed with by the most point-pairs, when many of the pairs are wrong.
+
+    Hypotheses are made from random triples of point-pairs, in batches:
+    each batch is solved with one call to `rigid_transformations()`,
+    and scored against every point-pair at once.
+
+    :param source_points: Collection of n points, represented by an [n, 3] numpy matrix.
+    :param destination_points: The n points they may correspond to, represented by an [n, 3] numpy matrix.
+    :param threshold: Point-pairs closer than this after transformation are counted as inliers.
+    :param hypotheses: The number of random triples to try.
+    :param rng: (optional) A numpy random number generator.
+    :param edge_similarity: Triples whose side lengths differ by more than this ratio between source and destination
+                            can't be related by a rigid transformation, and are discarded before solving.
+    :return: A pair ([4, 4] transformation, indices of the inlier point-pairs),
+             where the transformation is refined using every inlier.
+    """
+    from .iterative_closest_point import rigid_transformations
+
+    rng = rng or np.random.default_rng()
+    if len(source_points) < 3:
+        return np.eye(4), np.arange(0)
+
+    best, best_inliers = np.eye(4), -1
+    for start in range(0, hypotheses, RANSAC_BATCH):
+        samples = rng.integers(len(source_points), size=[min(RANSAC_BATCH, hypotheses - start), 3])
+        src, dst = source_points[samples], destination_points[samples]
+
+        # Rigid transformations preserve distances, so the triangles' side lengths must match
+        src_lengths = np.linalg.norm(src - np.roll(src, 1, axis=1), axis=2)
+        dst_lengths = np.linalg.norm(dst - np.roll(dst, 1, axis=1), axis=2)
+        similar = np.all(
+            np.minimum(src_lengths, dst_lengths) >= edge_similarity * np.maximum(src_lengths, dst_lengths), axis=1
+        )
+        if not np.any(similar):
+            continue
+
+        # Score every hypothesis in the batch by its number of inliers
+        transformations = rigid_transformations(src[similar], dst[similar])
+        moved = np.einsum('bij,nj->bni', transformations[:, :3, :3], source_points) + transformations[:, None, :3, 3]
+        inliers = np.count_nonzero(np.sum((moved - destination_points) ** 2, axis=2) < threshold ** 2, axis=1)
+        i = np.argmax(inliers)
+        if inliers[i] > best_inliers:
+            best, best_inliers = transformations[i], inliers[i]
+
+    moved = source_points @ best[:3, :3].T + best[:3, 3]
+    inliers = np.flatnonzero(np.sum((moved - destination_points) ** 2, axis=1) < threshold ** 2)
+    if len(inliers) >= 3:
+        best = rigid_transformations(source_points[inliers], destination_points[inliers])
+    return best, inliers
+
+
+@profiled("registration.global")
+def global_registration_transformation(
+    source_points: np.ndarray,
+    source_normals: np.ndarray,
+    destination_points: np.ndarray,
+    destination_normals: np.ndarray,
+    voxel_size: float = None,
+    rng: np.random.Generator = None,
+    hypotheses: int = RANSAC_HYPOTHESES,
+) -> np.ndarray:
+    """
+    Finds a coarse rigid transformation registering the source to the destination, whatever their initial poses.
+
+    Both point sets are downsampled, described with `feature_descriptors()` and matched in descriptor space,
+    then `ransac_transformation()` picks the transformation most of the matches agree with.
+    The result is only as precise as the downsampling, and is meant as a starting point for ICP.
+
+    :param source_points: Collection of n points to move, represented by an [n, 3] numpy matrix.
+    :param source_normals: Unit normals of the source points.
+    :param destination_points: Collection of m points to move toward, represented by an [m, 3] numpy matrix.
+    :param destination_normals: Unit normals of the destination points.
+    :param voxel_size: (optional) Width of the downsampling grid, defaults to 1/40 of the destination's diagonal.
+                       Descriptors use neighbours within 5 voxels.
+    :param rng: (optional) A numpy random number generator.
+    :param hypotheses: The number of RANSAC hypotheses to try.
+    :return: A [4, 4] numpy transformation matrix.
+    """
+    if len(source_points) < 3 or len(destination_points) < 3:
+        return np.eye(4)
+    if voxel_size is None:
+        voxel_size = max(np.linalg.norm(np.ptp(destination_points, axis=0)), 1e-9) / 40
+
+    source_points, source_normals = voxel_downsample(source_points, source_normals, voxel_size)
+    destination_points, destination_normals = voxel_downsample(destination_points, destination_normals, voxel_size)
+
+    source_descriptors = feature_descriptors(source_points, source_normals, 5 * voxel_size)
+    destination_descriptors = feature_descriptors(destination_points, destination_normals, 5 * voxel_size)
+    source_indices, destination_indices = match_descriptors(source_descriptors, destination_descriptors)
+
+    transformation, _ = ransac_transformation(
+        source_points[source_indices], destination_points[destination_indices],
+        1.5 * voxel_size, hypotheses, rng
+    )
+    return transformation
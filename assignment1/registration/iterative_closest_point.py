@@ -8,6 +8,11 @@ import numpy.random
 import scipy
 from scipy.spatial import KDTree
 
+from .correspondence import build_index
+from .sampling import cached_sampler
+from .robust import reject_outliers
+from ..performance.profiling import profiled, timed
+
 
 def numpy_verts(mesh: bmesh.types.BMesh) -> np.ndarray:
     """
@@ -39,6 +44,116 @@ def numpy_normals(mesh: bmesh.types.BMesh) -> np.ndarray:
     return normals.reshape([len(mesh.verts), 3])
 
 
+def rigid_transformations(
+    source_points: np.ndarray, destination_points: np.ndarray, weights: np.ndarray = None
+) -> np.ndarray:
+    """
+    Finds the rigid transformation which best registers source points to destination points, entirely in numpy.
+
+    Batches of point-pairs can be stacked along a leading axis, in which case every batch is solved at once
+    (with a single call to `np.linalg.svd`), which is much faster than solving them one at a time.
+
+    :param source_points: Collection of n points to move, an [n, 3] matrix or a [B, n, 3] stack of matrices.
+    :param destination_points: Collection of n points to move toward, with the same shape as source_points.
+    :param weights: (optional) Non-negative weight of each point-pair, an [n] or [B, n] matrix.
+    :return: A [4, 4] transformation matrix, or a [B, 4, 4] stack of matrices for batched input.
+             Batches with no (weighted) point-pairs produce the identity.
+    """
+    source_points = np.asarray(source_points, dtype=np.float64)
+    destination_points = np.asarray(destination_points, dtype=np.float64)
+    batched = source_points.ndim == 3
+    if not batched:
+        source_points, destination_points = source_points[None], destination_points[None]
+    if weights is None:
+        weights = np.ones(source_points.shape[:2])
+    weights = np.asarray(weights, dtype=np.float64).reshape(source_points.shape[:2])
+
+    # Normalized weights, batches without any weight are left as the identity
+    total = weights.sum(axis=1, keepdims=True)
+    valid = total[:, 0] > 0
+    weights = weights / np.where(total > 0, total, 1)
+
+    # Move both point clouds to the origin by finding their (weighted) centroids
+    src_centroids = np.einsum('bn,bni->bi', weights, source_points)
+    dst_centroids = np.einsum('bn,bni->bi', weights, destination_points)
+
+    # Find the covariance between the source and destination coordinates
+    H = np.einsum(
+        'bn,bni,bnj->bij', weights,
+        source_points - src_centroids[:, None, :], destination_points - dst_centroids[:, None, :]
+    )
+
+    # Find rotation matrices using SVD, flipping the last axis wherever that would produce a reflection
+    U, S, Vt = np.linalg.svd(H)
+    V, Ut = np.swapaxes(Vt, 1, 2), np.swapaxes(U, 1, 2)
+    V[:, :, 2] *= np.where(np.linalg.det(V @ Ut) < 0, -1, 1)[:, None]
+    R = V @ Ut
+
+    # Find a translation based on the rotated centroid (and not the original)
+    t = dst_centroids - np.einsum('bij,bj->bi', R, src_centroids)
+
+    # Combine into homogeneous matrices
+    T = np.tile(np.eye(4), (len(R), 1, 1))
+    T[valid, :3, :3], T[valid, :3, 3] = R[valid], t[valid]
+    return T if batched else T[0]
+
+
+def point_cloud_registration(
+    source_points: np.ndarray,
+    destination_points: np.ndarray,
+    index,
+    initial: np.ndarray = None,
+    iterations: int = 30,
+    epsilon: float = 1e-6,
+    **kwargs,
+) -> tuple[np.ndarray, float]:
+    """
+    Registers a set of points to another with ICP, using only arrays and a prebuilt index.
+
+    Unlike `iterative_closest_point_registration()`, nothing is sampled or rebuilt here,
+    which makes this suitable for registering against the same destination many times.
+
+    :param source_points: Collection of n points to move, represented by an [n, 3] numpy matrix.
+    :param destination_points: Collection of m points to move toward, represented by an [m, 3] numpy matrix.
+    :param index: A nearest-neighbour index over the destination points (see `build_index()`).
+    :param initial: (optional) A [4, 4] transformation to start from, e.g. the result of a previous registration.
+    :param iterations: The maximum number of iterations.
+    :param epsilon: Registration stops once a step is this close to the identity.
+    :param kwargs: `rejection`, `k`, `overlap`, `kernel_width` (see `reject_outliers()`) and `max_distance`.
+    :return: A pair ([4, 4] transformation moving the source onto the destination,
+             fraction of the source points paired with the destination in the final iteration).
+    """
+    transformation = np.eye(4) if initial is None else np.asarray(initial, dtype=np.float64)
+    kept = np.arange(0)
+    for i in range(iterations):
+        moved = source_points @ transformation[:3, :3].T + transformation[:3, 3]
+        distances, indices = index.query(moved, max_distance=kwargs.get("max_distance", np.inf))
+        matched = np.flatnonzero(np.isfinite(distances))
+        kept, weights = reject_outliers(
+            distances[matched], kwargs.get("rejection", "MEDIAN"), kwargs.get("k", 2.0),
+            kwargs.get("overlap", 0.9), kwargs.get("kernel_width", 1.0)
+        )
+        kept = matched[kept]
+
+        step = rigid_transformations(moved[kept], destination_points[indices[kept]], weights)
+        transformation = step @ transformation
+        deviation = step - np.eye(4)
+        if np.linalg.norm(deviation) < epsilon and np.max(deviation) < epsilon:
+            break
+
+    return transformation, len(kept) / max(len(source_points), 1)
+
+
+def to_matrix(transformation: np.ndarray) -> mathutils.Matrix:
+    """
+    Converts a numpy transformation into a `mathutils.Matrix`, for use outside of the registration code.
+
+    :param transformation: A [4, 4] numpy matrix.
+    :return: The equivalent 4x4 `mathutils.Matrix`.
+    """
+    return mathutils.Matrix(transformation.tolist())
+
+
 # !!! This function will be used for automatic grading, don't edit the signature !!!
 def point_to_point_transformation(
     source_points: np.ndarray, destination_points: np.ndarray, **kwargs
@@ -59,35 +174,8 @@ def point_to_point_transformation(
     if len(source_points) == 0 or source_points.shape != destination_points.shape:
         return mathutils.Matrix.Identity(4)
 
-    # TODO: Move both point clouds to the origin by finding their centroids
-    src_centroid = np.mean(source_points, axis=0)
-    dst_centroid = np.mean(destination_points, axis=0)
-
-    src_centered = source_points - src_centroid
-    dst_centered = destination_points - dst_centroid
-
-    # TODO: Find the covariance between the source and destination coordinates
-    H = np.dot(src_centered.T, dst_centered)
-
-    # TODO: Find a rotation matrix using SVD
-    U, S, Vt = np.linalg.svd(H)
-    R = np.dot(Vt.T, U.T)
-    if np.linalg.det(R) < 0:
-        Vt[2, :] *= -1
-        R = np.dot(Vt.T, U.T)
-
-    # TODO: Find a translation based on the rotated centroid (and not the original)
-    t = dst_centroid - np.dot(R, src_centroid)
-
-    # TODO: Return the combined matrix
-    T = mathutils.Matrix.Identity(4)
-    R_mat = mathutils.Matrix(R.tolist())
-    for i in range(3):
-        for j in range(3):
-            T[i][j] = R_mat[i][j]
-    T[0][3], T[1][3], T[2][3] = t
-
-    return T
+    # The solution is found in numpy, and only converted at the end
+    return to_matrix(rigid_transformations(source_points, destination_points))
 
 
 # !!! This function will be used for automatic grading, don't edit the signature !!!
@@ -133,6 +221,26 @@ def closest_point_registration(
     Given a pair of meshes, finds an approximate transformation to register the source mesh to the destination.
     (This is one iteration of the rigid registration process)
 
+    See `closest_point_transformation()`, which does the work and describes the available options.
+
+    :return: A transformation matrix which, applied to the source mesh,
+             would bring it closer to being registered with the destination mesh.
+    """
+    return to_matrix(closest_point_transformation(source, destination, k, num_points, distance_metric, **kwargs))
+
+
+def closest_point_transformation(
+    source: bmesh.types.BMesh,
+    destination: bmesh.types.BMesh,
+    k: float,
+    num_points: int,
+    distance_metric: str = "POINT_TO_POINT",
+    **kwargs,
+) -> np.ndarray:
+    """
+    Given a pair of meshes, finds an approximate transformation to register the source mesh to the destination.
+    (This is one iteration of the rigid registration process)
+
     First, we randomly select some points from both meshes (determined by num_points).
     Next, we find the nearest point in the destination point selection for each point in the source selection.
     From these pairings, we find the median distance between source points and their associated destinations.
@@ -151,7 +259,23 @@ def closest_point_registration(
     :param k: Point rejection coefficient, points further than k * (median distance) apart are not included.
     :param num_points: The maximum number of points to include for registration.
     :param distance_metric: Determines which approach to use for registration, "POINT_TO_POINT" or "POINT_TO_PLANE".
-    :return: A transformation matrix which, applied to the source mesh,
+    :param correspondence_backend: (optional) Nearest-neighbour search to use, see `CORRESPONDENCE_BACKENDS`.
+    :param max_distance: (optional) Point-pairs further apart than this are never matched, which lets searches stop early.
+    :param index_options: (optional) A dictionary of extra settings for the nearest-neighbour index (see `build_index()`).
+    :param sampling: (optional) How to draw points from the meshes, see `SAMPLING_STRATEGIES`.
+    :param seed: (optional) Seed for the random sampling, for reproducible results.
+    :param rng: (optional) A numpy random number generator to sample with, takes precedence over `seed`.
+    :param source_sampler: (optional) A cached `SurfaceSampler` for the source mesh, in sync with its current position.
+    :param destination_sampler: (optional) A cached `SurfaceSampler` for the destination mesh.
+    :param rejection: (optional) How outlier point-pairs are handled, see `REJECTION_STRATEGIES`.
+                      The default, "MEDIAN", rejects pairs as described above.
+    :param overlap: (optional) For "TRIMMED" rejection, the fraction of closest point-pairs to keep.
+    :param kernel_width: (optional) For "HUBER" and "TUKEY" rejection, a multiplier on the kernel width.
+    :param source_mask: (optional) Boolean array with one entry per source vertex,
+                        only these vertices are used for registration.
+    :param destination_mask: (optional) Boolean array with one entry per destination vertex,
+                             only these vertices are used for registration.
+    :return: A [4, 4] numpy transformation matrix which, applied to the source mesh,
              would bring it closer to being registered with the destination mesh.
              The transformation should contain only translation and rotation components;
              this version of rigid registration should not re-scale the source mesh.
@@ -162,39 +286,46 @@ def closest_point_registration(
     # hint Make sure not to select more points than are in the mesh or fewer than one point
     # TODO: Select some points from both meshes
 
-    def bmesh_to_numpy(bmesh):
-        return np.array([v.co[:] for v in bmesh.verts])
-
-    src_points = bmesh_to_numpy(source)
-    dst_points = bmesh_to_numpy(destination)
+    # Samplers cache everything needed to draw points from each mesh,
+    # iterative registration passes them in so they're only built once
+    rng = kwargs.get("rng") or np.random.default_rng(kwargs.get("seed"))
+    sampling = kwargs.get("sampling", "VERTICES")
+    source_sampler = kwargs.get("source_sampler") or cached_sampler(source, kwargs.get("source_mask"))
+    destination_sampler = (kwargs.get("destination_sampler") or
+                           cached_sampler(destination, kwargs.get("destination_mask")))
 
     # Ensure we don't select more points than available or fewer than one point
-    num_points = max(1, min(num_points, len(src_points), len(dst_points)))
-
-    # Randomly sample points if num_points is less than the number of vertices
-    if num_points < len(src_points):
-        src_points = src_points[
-            np.random.choice(src_points.shape[0], num_points, replace=False)
-        ]
-    if num_points < len(dst_points):
-        dst_points = dst_points[
-            np.random.choice(dst_points.shape[0], num_points, replace=False)
-        ]
+    if sampling == "VERTICES":
+        num_points = min(num_points, len(source_sampler.vertex_indices), len(destination_sampler.vertex_indices))
+    num_points = max(1, num_points)
+
+    # Randomly sample points (all vertices are used if num_points is at least the number of vertices)
+    with timed("registration.sampling"):
+        src_points, _ = source_sampler.sample(num_points, sampling, rng)
+        dst_points, dst_normals = destination_sampler.sample(num_points, sampling, rng)
 
     # TODO: Get the nearest destination point for each source point
     # HINT: scipy.spatial.KDTree makes this much faster!
 
-    # Find the nearest destination point for each source point using KDTree
-    tree = KDTree(dst_points)
-    distances, indices = tree.query(src_points)
+    # Find the nearest destination point for each source point using the chosen backend
+    index = build_index(
+        dst_points, kwargs.get("correspondence_backend", "KDTREE"), **kwargs.get("index_options", {})
+    )
+    with timed("registration.correspondence"):
+        distances, indices = index.query(src_points, max_distance=kwargs.get("max_distance", np.inf))
 
     # TODO: Reject outlier point-pairs
 
-    # Calculate the median distance
-    median_distance = np.median(distances)
+    # Points with no destination within the maximum distance can't be paired
+    matched = np.isfinite(distances)
+    src_points, distances, indices = src_points[matched], distances[matched], indices[matched]
 
-    # Reject outlier point-pairs
-    valid_pairs = distances < k * median_distance
+    # Reject outlier point-pairs (by default, those further than k * the median distance apart)
+    with timed("registration.rejection"):
+        valid_pairs, weights = reject_outliers(
+            distances, kwargs.get("rejection", "MEDIAN"), k,
+            kwargs.get("overlap", 0.9), kwargs.get("kernel_width", 1.0)
+        )
     src_valid = src_points[valid_pairs]
     dst_valid = dst_points[indices[valid_pairs]]
 
@@ -208,7 +339,8 @@ def closest_point_registration(
         #     ).to_quaternion(),
         #     mathutils.Vector([1, 1, 1]),
         # )
-        return point_to_point_transformation(src_valid, dst_valid)
+        with timed("registration.solve"):
+            return rigid_transformations(src_valid, dst_valid, weights)
     elif distance_metric == "POINT_TO_PLANE":
         raise NotImplementedError("Implement point-to-plant estimation")
     else:
@@ -216,6 +348,7 @@ def closest_point_registration(
 
 
 # !!! This function will be used for automatic grading, don't edit the signature !!!
+@profiled("registration")
 def iterative_closest_point_registration(
     source: bmesh.types.BMesh,
     destination: bmesh.types.BMesh,
@@ -242,6 +375,12 @@ def iterative_closest_point_registration(
     :param iterations: The maximum number of iterations to use for registration.
     :param epsilon: Magnitude of allowable error in the final result.
     :param distance_metric: Determines which approach to use for registration, "POINT_TO_POINT" or "POINT_TO_PLANE".
+    :param global_initialization: (optional) Whether to start with a coarse global registration
+                                  (see `global_registration_transformation()`), so that meshes in any initial pose
+                                  can be registered. Its result is the first of the returned transformations.
+    :param voxel_size: (optional) Downsampling resolution for global initialization.
+    :param kwargs: Additional options passed to `closest_point_transformation()`,
+                   e.g. `source_mask` and `destination_mask` to register using only a region of each mesh.
     :return: A sequence of transformations which, applied to the source mesh in sequence,
              would move it so that it matches the destination mesh (registered).
              The transformation should contain only translation and rotation components;
@@ -249,26 +388,66 @@ def iterative_closest_point_registration(
              For some cases (such as non-identical meshes, or meshes with very different orientations)
              ICP may fail to converge, the transformations representing an attempted registration are still returned.
     """
+    # Sampling state is built once (or reused from an earlier run on the same meshes),
+    # and a copy of the source sampler is moved along with the source mesh
+    kwargs["rng"] = kwargs.get("rng") or np.random.default_rng(kwargs.get("seed"))
+    kwargs["source_sampler"] = (kwargs.get("source_sampler") or
+                                cached_sampler(source, kwargs.get("source_mask")).copy())
+    kwargs["destination_sampler"] = (kwargs.get("destination_sampler") or
+                                     cached_sampler(destination, kwargs.get("destination_mask")))
+
     transformations = []
+
+    # Replace manual pre-alignment with a global registration based on matching the shape of both surfaces
+    if kwargs.get("global_initialization", False):
+        from .global_registration import global_registration_transformation
+        source_sampler, destination_sampler = kwargs["source_sampler"], kwargs["destination_sampler"]
+        transformation = global_registration_transformation(
+            source_sampler.vertices[source_sampler.vertex_indices],
+            source_sampler.vertex_normals[source_sampler.vertex_indices],
+            destination_sampler.vertices[destination_sampler.vertex_indices],
+            destination_sampler.vertex_normals[destination_sampler.vertex_indices],
+            kwargs.get("voxel_size"), kwargs["rng"]
+        )
+        source_sampler.transform(transformation)
+        transformation = to_matrix(transformation)
+        source.transform(transformation)
+        transformations.append(transformation)
+
     for i in range(iterations):
 
         # Find a transformation which moves the source mesh closer to the target mesh
-        transformation = closest_point_registration(
+        transformation = closest_point_transformation(
             source, destination, k, num_points, distance_metric, **kwargs
         )
 
         # Check for early-stopping (transformation is very similar to identity)
-        deviation = np.asarray(transformation - mathutils.Matrix.Identity(4))
+        deviation = transformation - np.eye(4)
         if np.linalg.norm(deviation) < epsilon and np.max(deviation) < epsilon:
             break
 
-        # Apply the transformation to the source mesh
+        # Apply the transformation to the source mesh (converting to mathutils only at the API boundary)
+        kwargs["source_sampler"].transform(transformation)
+        transformation = to_matrix(transformation)
         source.transform(transformation)
         transformations.append(transformation)
 
     return transformations
 
 
+def net_transformation_array(transformations: list) -> np.ndarray:
+    """
+    Combines a sequence of transformations into a single numpy transformation matrix with equivalent results.
+
+    :param transformations: A list of 4x4 transformation matrices (numpy or mathutils), or a [B, 4, 4] numpy stack.
+    :return: A [4, 4] numpy matrix with equivalent results to applying all in sequence.
+    """
+    m = np.eye(4)
+    for t in np.asarray(transformations, dtype=np.float64).reshape([-1, 4, 4]):
+        m = t @ m
+    return m
+
+
 def net_transformation(transformations: list[mathutils.Matrix]) -> mathutils.Matrix:
     """
     Combines a sequence of transformations into a single transformation matrix with equivalent results.
@@ -276,7 +455,4 @@ def net_transformation(transformations: list[mathutils.Matrix]) -> mathutils.Mat
     :param transformations: A list of transformation matrices.
     :return: A transformation matrix with equivalent results to applying all in sequence.
     """
-    m = mathutils.Matrix.Identity(4)
-    for t in transformations:
-        m = t @ m
-    return m
+    return to_matrix(net_transformation_array(transformations))
@@ -0,0 +1,203 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .correspondence import build_index
+from .iterative_closest_point import point_cloud_registration
+from .sampling import SurfaceSampler
+from ..performance.profiling import profiled, timed
+
+
+class Scan:
+    """
+    One view in a multi-view registration.
+
+    Everything needed to register against the scan is built once, however many of its neighbours use it:
+    its vertices (in world space at the start of registration), a nearest-neighbour index over them,
+    and a fixed set of sample points used when the scan is the one being moved.
+    """
+
+    def __init__(
+        self,
+        sampler: SurfaceSampler,
+        num_points: int,
+        rng: np.random.Generator,
+        sampling: str = "VERTICES",
+        backend: str = "CKDTREE",
+    ):
+        """
+        :param sampler: A sampler over the scan's surface, in world space.
+        :param num_points: The number of points to sample from the scan.
+        :param rng: Random number generator to sample with.
+        :param sampling: One of the identifiers in `SAMPLING_STRATEGIES`.
+        :param backend: Nearest-neighbour search to use, see `CORRESPONDENCE_BACKENDS`.
+        """
+        self.points = sampler.vertices[sampler.vertex_indices]
+        self.samples, _ = sampler.sample(num_points, sampling, rng)
+
+        # Pairs are registered in parallel, so each query uses a single thread
+        self.index = build_index(self.points, backend, workers=1)
+
+
+def neighbour_pairs(num_scans: int, neighbours: int = 1, closed_loop: bool = True) -> list[tuple[int, int]]:
+    """
+    Lists the pairs of scans expected to overlap, for scans captured in sequence (e.g. on a turntable).
+
+    :param num_scans: The number of scans.
+    :param neighbours: Each scan is paired with this many of the scans following it.
+    :param closed_loop: Whether the last scans wrap around to overlap the first (a full turn),
+                        which adds the loop-closure pairs that let drift be corrected.
+    :return: A list of (i, j) index pairs, with no pair listed twice.
+    """
+    pairs, seen = [], set()
+    for i in range(num_scans):
+        for offset in range(1, neighbours + 1):
+            j = i + offset
+            if j >= num_scans:
+                if not closed_loop:
+                    break
+                j %= num_scans
+            if i != j and frozenset((i, j)) not in seen:
+                seen.add(frozenset((i, j)))
+                pairs.append((i, j))
+    return pairs
+
+
+def pairwise_registration(
+    source: Scan,
+    destination: Scan,
+    iterations: int = 30,
+    epsilon: float = 1e-6,
+    **kwargs,
+) -> tuple[np.ndarray, float]:
+    """
+    Registers one scan to another with ICP, using only their prebuilt arrays and indices
+    (see `point_cloud_registration()`).
+
+    :param source: The scan to move.
+    :param destination: The scan to move toward.
+    :param iterations: The maximum number of iterations.
+    :param epsilon: Registration stops once a step is this close to the identity.
+    :param kwargs: `rejection`, `k`, `overlap`, `kernel_width` (see `reject_outliers()`) and `max_distance`.
+    :return: A pair ([4, 4] transformation moving the source onto the destination,
+             fraction of the source's samples paired with the destination in the final iteration).
+    """
+    return point_cloud_registration(
+        source.samples, destination.points, destination.index, iterations=iterations, epsilon=epsilon, **kwargs
+    )
+
+
+def _project_to_rotation(matrix: np.ndarray) -> np.ndarray:
+    U, _, Vt = np.linalg.svd(matrix)
+    U[:, 2] *= np.where(np.linalg.det(U @ Vt) < 0, -1, 1)
+    return U @ Vt
+
+
+@profiled("registration.pose_graph")
+def pose_graph_optimization(
+    num_poses: int,
+    pairs: list[tuple[int, int]],
+    relative: np.ndarray,
+    weights: np.ndarray = None,
+    anchor: int = 0,
+) -> np.ndarray:
+    """
+    Finds one rigid correction per scan which best agrees with every pairwise registration.
+
+    A pairwise registration of scans i and j gives a transformation T_ij moving scan i onto scan j,
+    so the corrections should satisfy C_i = C_j T_ij for every pair.
+    Around a loop these constraints disagree (drift), and solving them together spreads the disagreement
+    over every pair instead of leaving it all at the end of the loop.
+
+    Rotations are solved first, as a linear least-squares problem projected back onto rotation matrices
+    (chordal rotation averaging), then translations are solved given the rotations.
+
+    :param num_poses: The number of scans.
+    :param pairs: The (i, j) index pairs which were registered.
+    :param relative: A [len(pairs), 4, 4] stack of the transformations T_ij.
+    :param weights: (optional) Confidence in each pairwise registration, e.g. the overlap between the scans.
+    :param anchor: The scan whose correction is fixed to the identity.
+    :return: A [num_poses, 4, 4] stack of world-space corrections, to be applied before each scan's world matrix.
+             Scans which aren't connected to the anchor through any pairs are left unchanged.
+    """
+    relative = np.asarray(relative, dtype=np.float64).reshape([-1, 4, 4])
+    weights = np.sqrt(np.ones(len(pairs)) if weights is None else np.asarray(weights, dtype=np.float64))
+    rows = 3 * len(pairs) + 3
+
+    # Each pair gives R_i^T - R_ij^T R_j^T = 0, which is linear in the transposed rotations
+    A = np.zeros([rows, 3 * num_poses])
+    b = np.zeros([rows, 3])
+    for e, ((i, j), w) in enumerate(zip(pairs, weights)):
+        A[3 * e:3 * e + 3, 3 * i:3 * i + 3] = w * np.eye(3)
+        A[3 * e:3 * e + 3, 3 * j:3 * j + 3] = -w * relative[e, :3, :3].T
+    A[-3:, 3 * anchor:3 * anchor + 3] = np.eye(3)
+    b[-3:] = np.eye(3)
+    transposed = np.linalg.lstsq(A, b, rcond=None)[0].reshape([num_poses, 3, 3])
+    rotations = np.stack([
+        _project_to_rotation(x.T) if np.any(x) else np.eye(3) for x in transposed
+    ])
+
+    # Given the rotations, each pair gives t_i - t_j = R_j t_ij
+    A = np.zeros([rows, 3 * num_poses])
+    b = np.zeros(rows)
+    for e, ((i, j), w) in enumerate(zip(pairs, weights)):
+        A[3 * e:3 * e + 3, 3 * i:3 * i + 3] = w * np.eye(3)
+        A[3 * e:3 * e + 3, 3 * j:3 * j + 3] = -w * np.eye(3)
+        b[3 * e:3 * e + 3] = w * rotations[j] @ relative[e, :3, 3]
+    A[-3:, 3 * anchor:3 * anchor + 3] = np.eye(3)
+    translations = np.linalg.lstsq(A, b, rcond=None)[0].reshape([num_poses, 3])
+
+    corrections = np.tile(np.eye(4), (num_poses, 1, 1))
+    corrections[:, :3, :3], corrections[:, :3, 3] = rotations, translations
+    return corrections
+
+
+@profiled("registration.multiview")
+def multiview_registration(
+    samplers: list[SurfaceSampler],
+    pairs: list[tuple[int, int]] = None,
+    num_points: int = 1000,
+    iterations: int = 30,
+    epsilon: float = 1e-6,
+    anchor: int = 0,
+    workers: int = None,
+    **kwargs,
+) -> np.ndarray:
+    """
+    Registers several overlapping scans to each other at once.
+
+    Each scan's arrays and index are built once. The overlapping pairs are registered in parallel,
+    and the results are combined with `pose_graph_optimization()` to find one transformation per scan.
+
+    :param samplers: One sampler per scan, each in world space.
+    :param pairs: (optional) The (i, j) index pairs of scans which overlap,
+                  defaults to each scan and the next in a closed loop (see `neighbour_pairs()`).
+    :param num_points: The number of points sampled from each scan.
+    :param iterations: The maximum number of ICP iterations for each pair.
+    :param epsilon: Pairwise registration stops once a step is this close to the identity.
+    :param anchor: The scan which stays in place.
+    :param workers: (optional) The number of pairs registered at once, defaults to the number of cores.
+    :param sampling: (optional) How points are drawn from the scans, see `SAMPLING_STRATEGIES`.
+    :param seed: (optional) Seed for the random sampling, for reproducible results.
+    :param rng: (optional) A numpy random number generator to sample with, takes precedence over `seed`.
+    :param correspondence_backend: (optional) Nearest-neighbour search to use, defaults to "CKDTREE".
+    :param kwargs: Additional options passed to `pairwise_registration()`.
+    :return: A [len(samplers), 4, 4] stack of world-space transformations, one to apply to each scan.
+    """
+    if pairs is None:
+        pairs = neighbour_pairs(len(samplers))
+    rng = kwargs.get("rng") or np.random.default_rng(kwargs.get("seed"))
+    scans = [
+        Scan(sampler, num_points, rng, kwargs.get("sampling", "VERTICES"), kwargs.get("correspondence_backend", "CKDTREE"))
+        for sampler in samplers
+    ]
+
+    with timed("registration.pairwise"), ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda pair: pairwise_registration(scans[pair[0]], scans[pair[1]], iterations, epsilon, **kwargs), pairs
+        ))
+
+    if not results:
+        return np.tile(np.eye(4), (len(samplers), 1, 1))
+    relative, overlaps = zip(*results)
+    return pose_graph_optimization(len(samplers), pairs, np.stack(relative), np.array(overlaps), anchor)
@@ -0,0 +1,42 @@
+# Options for the registration settings, used by both the operator and the registration functions.
+# These are kept apart from the implementations, so the UI can be built without importing numpy or scipy.
+
+# Options for the `correspondence_backend` argument of `closest_point_registration()`
+CORRESPONDENCE_BACKENDS = [
+    ('KDTREE', "KD-Tree", "SciPy KD-tree with default settings"),
+    ('CKDTREE', "Parallel KD-Tree", "Compiled KD-tree with a tuned leaf size, queried using every available core"),
+    ('VOXEL_HASH', "Voxel Hash", "Uniform grid, fast for dense scans where the expected displacement is small"),
+]
+
+
+# Options for the `sampling` argument of `closest_point_registration()`
+SAMPLING_STRATEGIES = [
+    ('VERTICES', "Vertices", "Random vertices, densely tessellated regions receive more samples"),
+    ('AREA', "Surface Area", "Random points spread uniformly over the surface area"),
+    ('NORMAL_SPACE', "Normal Space", "Random surface points spread evenly over the directions the surface faces"),
+    ('STRATIFIED', "Stratified", "Surface points spread uniformly over the surface area, with less clumping"),
+]
+
+
+# Options for choosing a region of interest in `vertex_mask()`
+REGIONS = [
+    ('ALL', "Whole Mesh", "Register using every vertex"),
+    ('SELECTED', "Selected Vertices", "Register using only the vertices selected in edit mode"),
+    ('VERTEX_GROUP', "Vertex Group", "Register using only the vertices in a named vertex group"),
+]
+
+
+# Options for the `rejection` argument of `closest_point_registration()`
+REJECTION_STRATEGIES = [
+    ('MEDIAN', "Median", "Reject point-pairs further than k times the median distance apart"),
+    ('TRIMMED', "Trimmed", "Keep only the closest fraction of point-pairs, given by the overlap ratio"),
+    ('HUBER', "Huber", "Keep every point-pair, down-weighting distant pairs with the Huber kernel"),
+    ('TUKEY', "Tukey", "Keep every point-pair, ignoring very distant pairs with Tukey's biweight kernel"),
+]
+
+
+# Options for the `output` argument of `register_assembly()`
+ASSEMBLY_OUTPUTS = [
+    ('OFFSETS', "Move Vertices", "Move each part's vertices within the source mesh"),
+    ('SEPARATE', "Separate Parts", "Split the source into one object per part, each with its own transformation"),
+]
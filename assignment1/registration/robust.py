@@ -0,0 +1,83 @@
+import numpy as np
+
+# Kernel widths (in units of the robust standard deviation) giving 95% efficiency for gaussian noise
+HUBER_WIDTH = 1.345
+TUKEY_WIDTH = 4.685
+
+
+def robust_scale(distances: np.ndarray) -> float:
+    """
+    Estimates the standard deviation of point-pair distances, ignoring outliers.
+
+    Uses the median of the distances, scaled by 1.4826 to match a standard deviation for gaussian noise.
+    Distances are residuals which would ideally be 0, so this is their median absolute deviation from 0
+    rather than from their own median (as a textbook MAD would be), the usual choice for registration residuals.
+    The median is found with `np.partition`, which takes linear time.
+
+    :param distances: Distances between each point-pair.
+    :return: The estimated standard deviation.
+    """
+    if len(distances) == 0:
+        return 0.0
+    middle = (len(distances) - 1) // 2
+    return 1.4826 * float(np.partition(distances, middle)[middle])
+
+
+def huber_weights(distances: np.ndarray, width: float) -> np.ndarray:
+    """
+    :param distances: Distances between each point-pair.
+    :param width: Distances up to this have full weight.
+    :return: The Huber weight of each point-pair, falling off as width / distance beyond the width.
+    """
+    return np.minimum(1.0, width / np.maximum(distances, 1e-30))
+
+
+def tukey_weights(distances: np.ndarray, width: float) -> np.ndarray:
+    """
+    :param distances: Distances between each point-pair.
+    :param width: Distances from this on have no weight.
+    :return: The Tukey biweight of each point-pair, (1 - (distance / width)^2)^2 within the width.
+    """
+    return np.square(np.maximum(0.0, 1 - np.square(distances / max(width, 1e-30))))
+
+
+def reject_outliers(
+    distances: np.ndarray,
+    rejection: str = "MEDIAN",
+    k: float = 2.0,
+    overlap: float = 0.9,
+    kernel_width: float = 1.0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Chooses which point-pairs to use for registration, and how much each should count.
+
+    :param distances: Distances between each point-pair.
+    :param rejection: One of the identifiers in `REJECTION_STRATEGIES`.
+    :param k: For "MEDIAN", pairs further than k * (median distance) apart are rejected.
+    :param overlap: For "TRIMMED", the fraction of pairs expected to overlap (only the closest are kept).
+    :param kernel_width: For "HUBER" and "TUKEY", a multiplier on the standard kernel widths.
+    :return: A pair (indices of the kept point-pairs, weight of each kept pair or None for equal weights).
+    """
+    if len(distances) == 0:
+        return np.zeros(0, dtype=np.int64), None
+
+    if rejection == "MEDIAN":
+        median_distance = np.median(distances)
+        return np.flatnonzero(distances < k * median_distance), None
+    elif rejection == "TRIMMED":
+        # Selecting the closest pairs only needs a partial sort
+        keep = int(np.clip(np.ceil(overlap * len(distances)), 1, len(distances)))
+        return np.argpartition(distances, keep - 1)[:keep], None
+    elif rejection in ("HUBER", "TUKEY"):
+        sigma = robust_scale(distances)
+        if sigma == 0:
+            # More than half the pairs are already exact, the rest can't be trusted
+            return np.flatnonzero(distances == 0), None
+        if rejection == "HUBER":
+            weights = huber_weights(distances, HUBER_WIDTH * kernel_width * sigma)
+        else:
+            weights = tukey_weights(distances, TUKEY_WIDTH * kernel_width * sigma)
+        kept = np.flatnonzero(weights > 0)
+        return kept, weights[kept]
+    else:
+        raise Exception(f"Unrecognized rejection strategy '{rejection}'")
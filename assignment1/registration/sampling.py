@@ -0,0 +1,250 @@
+import copy
+import hashlib
+
+import bpy
+import bmesh
+import numpy as np
+
+from ..performance.profiling import profiled
+
+# Normal-space buckets: equal-area bands of cos(polar angle) x slices of azimuth
+NORMAL_BANDS, NORMAL_SLICES = 6, 12
+
+# Samplers are reused for as long as a mesh (and its region of interest) doesn't move or change shape
+_sampler_cache = {}
+_SAMPLER_CACHE_SIZE = 4
+
+
+class SurfaceSampler:
+    """
+    Draws sample points from a triangulated surface.
+
+    Everything that depends only on the mesh's connectivity and shape is computed once and cached:
+    the triangles, their areas, the cumulative distribution of area used to pick triangles,
+    and the normal-space buckets.
+    Rigid transformations don't change any of these, so a sampler can follow a mesh through registration
+    by calling `transform()` instead of being rebuilt every iteration.
+    """
+
+    def __init__(self, vertices: np.ndarray, triangles: np.ndarray, mask: np.ndarray = None):
+        """
+        :param vertices: Collection of n vertex positions, represented by an [n, 3] numpy matrix.
+        :param triangles: Collection of m triangles, represented by an [m, 3] matrix of vertex indices.
+        :param mask: (optional) Boolean array of length n, only these vertices
+                     (and triangles made entirely from them) are sampled from.
+        """
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.triangles = np.asarray(triangles, dtype=np.int64).reshape([-1, 3])
+
+        # Restrict sampling to a region of interest
+        self.vertex_indices = np.arange(len(self.vertices))
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            if len(mask) != len(self.vertices):
+                raise Exception(
+                    f"The region of interest covers {len(mask)} vertices, but the mesh has {len(self.vertices)} "
+                    f"(was the mesh edited after the region was chosen?)"
+                )
+            if not np.any(mask):
+                raise Exception("The region of interest contains no vertices")
+            self.vertex_indices = np.flatnonzero(mask)
+            self.triangles = self.triangles[np.all(mask[self.triangles], axis=1)]
+
+        v0, v1, v2 = (self.vertices[self.triangles[:, i]] for i in range(3))
+        cross = np.cross(v1 - v0, v2 - v0)
+        double_areas = np.linalg.norm(cross, axis=1)
+        self.areas = double_areas / 2
+        self.face_normals = cross / np.maximum(double_areas, 1e-30)[:, None]
+        self.area_cdf = np.cumsum(self.areas)
+
+        # Faces grouped by the direction they face, with a cumulative area over the grouped order
+        self.buckets = self._normal_buckets(self.face_normals)
+        self.bucket_order = np.argsort(self.buckets, kind='stable')
+        self.bucket_cdf = np.cumsum(self.areas[self.bucket_order])
+        _, first = np.unique(self.buckets[self.bucket_order], return_index=True)
+        self.bucket_starts = np.concatenate([[0.0], self.bucket_cdf])[first]
+        self.bucket_areas = np.diff(np.concatenate([self.bucket_starts, [self.bucket_cdf[-1] if len(first) else 0.0]]))
+        nonempty = self.bucket_areas > 0
+        self.bucket_starts, self.bucket_areas = self.bucket_starts[nonempty], self.bucket_areas[nonempty]
+        self._vertex_normals = None
+
+    @classmethod
+    def from_bmesh(cls, mesh: bmesh.types.BMesh, mask: np.ndarray = None) -> "SurfaceSampler":
+        """
+        Builds a sampler from a BMesh, reading vertices and triangles in bulk.
+
+        :param mesh: The mesh to sample from.
+        :param mask: (optional) Boolean array with one entry per vertex, restricting sampling to those vertices.
+        :return: A new SurfaceSampler.
+        """
+        data = bpy.data.meshes.new("tmp")
+        try:
+            mesh.to_mesh(data)
+            return cls.from_mesh(data, mask=mask)
+        finally:
+            bpy.data.meshes.remove(data)
+
+    @classmethod
+    @profiled("extract")
+    def from_mesh(cls, mesh: bpy.types.Mesh, matrix_world=None, mask: np.ndarray = None) -> "SurfaceSampler":
+        """
+        Builds a sampler from a mesh datablock, reading vertices and triangles in bulk.
+
+        :param mesh: The mesh to sample from.
+        :param matrix_world: (optional) A 4x4 transformation to apply to the vertices, e.g. the object's world matrix.
+        :param mask: (optional) Boolean array with one entry per vertex, restricting sampling to those vertices.
+        :return: A new SurfaceSampler.
+        """
+        return cls(*_mesh_arrays(mesh, matrix_world), mask)
+
+    @staticmethod
+    def _normal_buckets(normals: np.ndarray) -> np.ndarray:
+        band = np.clip(((normals[:, 2] + 1) / 2 * NORMAL_BANDS).astype(np.int64), 0, NORMAL_BANDS - 1)
+        azimuth = np.arctan2(normals[:, 1], normals[:, 0])
+        slice_ = np.clip(((azimuth + np.pi) / (2 * np.pi) * NORMAL_SLICES).astype(np.int64), 0, NORMAL_SLICES - 1)
+        return band * NORMAL_SLICES + slice_
+
+    @property
+    def vertex_normals(self) -> np.ndarray:
+        """Area-weighted vertex normals, computed on first use."""
+        if self._vertex_normals is None:
+            normals = np.zeros_like(self.vertices)
+            for i in range(3):
+                np.add.at(normals, self.triangles[:, i], self.face_normals * self.areas[:, None])
+            self._vertex_normals = normals / np.maximum(np.linalg.norm(normals, axis=1), 1e-30)[:, None]
+        return self._vertex_normals
+
+    def copy(self) -> "SurfaceSampler":
+        """
+        :return: A sampler sharing this one's cached arrays, which can be moved by `transform()` on its own
+                 (transforming replaces the arrays rather than changing them).
+        """
+        return copy.copy(self)
+
+    def transform(self, matrix) -> None:
+        """
+        Applies a rigid transformation to the cached geometry, keeping it in sync with a transformed mesh.
+
+        :param matrix: A 4x4 transformation matrix (numpy or mathutils) containing only rotation and translation.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        rotation, translation = matrix[:3, :3], matrix[:3, 3]
+        self.vertices = self.vertices @ rotation.T + translation
+        self.face_normals = self.face_normals @ rotation.T
+        if self._vertex_normals is not None:
+            self._vertex_normals = self._vertex_normals @ rotation.T
+
+    def sample(self, n: int, strategy: str, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Draws sample points (and their normals) from the surface.
+
+        Meshes without faces can only be sampled by vertex, so every strategy falls back to "VERTICES" for them.
+
+        :param n: The number of points to draw. For "VERTICES", at most every (masked) vertex is returned.
+        :param strategy: One of the identifiers in `SAMPLING_STRATEGIES`.
+        :param rng: Random number generator to draw with.
+        :return: A pair of [n, 3] matrices, the sampled points and the surface normals at those points.
+        """
+        if strategy == "VERTICES" or len(self.triangles) == 0 or self.area_cdf[-1] <= 0:
+            indices = self.vertex_indices
+            if n < len(indices):
+                indices = indices[rng.choice(len(indices), n, replace=False)]
+            return self.vertices[indices], self.vertex_normals[indices]
+
+        total = self.area_cdf[-1]
+        if strategy == "AREA":
+            faces = np.searchsorted(self.area_cdf, rng.random(n) * total, side='right')
+        elif strategy == "STRATIFIED":
+            # One sample from each of n equal slices of the area distribution
+            faces = np.searchsorted(self.area_cdf, (np.arange(n) + rng.random(n)) / n * total, side='right')
+        elif strategy == "NORMAL_SPACE":
+            # Pick a bucket uniformly, then a face from that bucket in proportion to its area
+            buckets = rng.integers(len(self.bucket_starts), size=n)
+            targets = self.bucket_starts[buckets] + rng.random(n) * self.bucket_areas[buckets]
+            slots = np.searchsorted(self.bucket_cdf, targets, side='right')
+            faces = self.bucket_order[np.minimum(slots, len(self.bucket_order) - 1)]
+        else:
+            raise Exception(f"Unrecognized sampling strategy '{strategy}'")
+        faces = np.minimum(faces, len(self.triangles) - 1)
+
+        # Uniform barycentric coordinates within each chosen triangle
+        r1, r2 = np.sqrt(rng.random(n)), rng.random(n)
+        weights = np.stack([1 - r1, r1 * (1 - r2), r1 * r2], axis=1)
+        corners = self.vertices[self.triangles[faces]]
+        return np.einsum('ij,ijk->ik', weights, corners), self.face_normals[faces]
+
+
+def _mesh_arrays(mesh: bpy.types.Mesh, matrix_world=None) -> tuple[np.ndarray, np.ndarray]:
+    mesh.calc_loop_triangles()
+    vertices = np.zeros(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", vertices)
+    triangles = np.zeros(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    vertices = vertices.reshape([-1, 3])
+    if matrix_world is not None:
+        matrix = np.asarray(matrix_world, dtype=np.float64)
+        vertices = vertices @ matrix[:3, :3].T + matrix[:3, 3]
+    return vertices, triangles
+
+
+def cached_sampler(mesh: bmesh.types.BMesh, mask: np.ndarray = None) -> SurfaceSampler:
+    """
+    Builds a sampler for a BMesh, or reuses the one built last time for the same mesh.
+
+    Samplers are keyed by a hash of the raw vertex, triangle and mask data, so any change to the mesh
+    (or to its region of interest) builds a new sampler. Only the most recently used samplers are kept.
+    Cached samplers are shared, so a sampler which is going to be moved should be a `copy()`.
+
+    :param mesh: The mesh to sample from.
+    :param mask: (optional) Boolean array with one entry per vertex, restricting sampling to those vertices.
+    :return: A SurfaceSampler.
+    """
+    data = bpy.data.meshes.new("tmp")
+    try:
+        mesh.to_mesh(data)
+        vertices, triangles = _mesh_arrays(data)
+    finally:
+        bpy.data.meshes.remove(data)
+
+    digest = hashlib.blake2b(digest_size=16)
+    for array in [vertices, triangles] + ([] if mask is None else [np.asarray(mask, dtype=bool)]):
+        digest.update(np.ascontiguousarray(array).view(np.uint8))
+        digest.update(np.int64(len(array)).tobytes())
+    key = (digest.hexdigest(), mask is None)
+
+    sampler = _sampler_cache.pop(key, None)
+    if sampler is None:
+        sampler = SurfaceSampler(vertices, triangles, mask)
+    _sampler_cache[key] = sampler
+    while len(_sampler_cache) > _SAMPLER_CACHE_SIZE:
+        del _sampler_cache[next(iter(_sampler_cache))]
+    return sampler
+
+
+def vertex_mask(obj: bpy.types.Object, region: str = "ALL", group: str = "") -> np.ndarray:
+    """
+    Finds the vertices of an object which belong to a region of interest.
+
+    :param obj: A mesh object.
+    :param region: One of the identifiers in `REGIONS`.
+    :param group: Name of the vertex group to use, for the "VERTEX_GROUP" region.
+    :return: A boolean array with one entry per vertex, or None if the whole mesh should be used.
+    """
+    mesh = obj.data
+    if region == "ALL":
+        return None
+    elif region == "SELECTED":
+        # Edit-mode selection isn't written to the mesh until we ask for it
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()
+        mask = np.zeros(len(mesh.vertices), dtype=bool)
+        mesh.vertices.foreach_get("select", mask)
+        return mask
+    elif region == "VERTEX_GROUP":
+        if group not in obj.vertex_groups:
+            raise Exception(f"'{obj.name}' has no vertex group named '{group}'")
+        index = obj.vertex_groups[group].index
+        # Vertex group membership isn't available through foreach_get
+        return np.array([any(g.group == index and g.weight > 0 for g in v.groups) for v in mesh.vertices], dtype=bool)
+    else:
+        raise Exception(f"Unrecognized region '{region}'")
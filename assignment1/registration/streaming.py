@@ -0,0 +1,241 @@
+import time
+
+import numpy as np
+
+from .iterative_closest_point import point_cloud_registration
+from ..performance.profiling import profiled
+
+# Grid coordinates are packed into one 64-bit key, with 21 bits per axis
+_KEY_BITS = 21
+_KEY_OFFSET = 1 << (_KEY_BITS - 1)
+
+# Recently added cells are merged into the main sorted run of keys once they're more than 1/8 of it
+_RECENT_FRACTION = 8
+
+
+class VoxelMap:
+    """
+    A point set which can grow, stored as one fused point per cell of a uniform grid.
+
+    New points are merged into the map in bulk: points landing in an occupied cell update its running average,
+    and the remaining cells are appended. Cells are stored in the order they were first occupied, in buffers
+    which double in capacity when full, so adding cells doesn't copy the whole model every frame.
+    Cells are looked up through their keys, kept sorted in two runs: a large one, and a small one for recently
+    added cells, which is merged into the large one once it outgrows a fraction of it.
+    Memory therefore grows with the surface area covered, not with the number of points inserted.
+
+    Queries use the same interface as the indices in `correspondence`:
+    `query(points, max_distance)` returns `(distances, indices)`, with an infinite distance and an index of
+    `len(map)` for query points with no fused point within one cell.
+    """
+
+    def __init__(self, voxel_size: float):
+        """
+        :param voxel_size: Width of each grid cell, roughly the resolution of the fused model.
+        """
+        self.voxel_size = float(voxel_size)
+        self._size = 0
+        self._cell_keys = np.zeros(0, dtype=np.int64)
+        self._points = np.zeros([0, 3])
+        self._counts = np.zeros(0, dtype=np.int64)
+
+        # Sorted keys, with the index of each key's cell
+        self._sorted_keys, self._sorted_cells = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        self._recent_keys, self._recent_cells = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def keys(self) -> np.ndarray:
+        """The key of each cell."""
+        return self._cell_keys[:self._size]
+
+    @property
+    def points(self) -> np.ndarray:
+        """The fused point of each cell, an [n, 3] numpy matrix."""
+        return self._points[:self._size]
+
+    @property
+    def counts(self) -> np.ndarray:
+        """The number of points fused into each cell."""
+        return self._counts[:self._size]
+
+    def _keys(self, points: np.ndarray) -> np.ndarray:
+        coordinates = np.floor(points / self.voxel_size).astype(np.int64) + _KEY_OFFSET
+        if np.any((coordinates < 1) | (coordinates >= (1 << _KEY_BITS) - 1)):
+            raise Exception("Points are too far from the origin for the chosen voxel size")
+        return (coordinates[:, 0] << (2 * _KEY_BITS)) | (coordinates[:, 1] << _KEY_BITS) | coordinates[:, 2]
+
+    def _find(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # The cell with each key (0 where there's none), and whether there is one
+        cells, found = np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        for sorted_keys, sorted_cells in [
+            (self._sorted_keys, self._sorted_cells), (self._recent_keys, self._recent_cells)
+        ]:
+            if len(sorted_keys) == 0:
+                continue
+            slots = np.searchsorted(sorted_keys, keys)
+            np.minimum(slots, len(sorted_keys) - 1, out=slots)
+            matches = sorted_keys[slots] == keys
+            np.copyto(cells, sorted_cells[slots], where=matches)
+            found |= matches
+        return cells, found
+
+    def _reserve(self, size: int) -> None:
+        # Buffers grow by doubling, so appending n cells costs O(n) amortised
+        if size <= len(self._points):
+            return
+        capacity = max(size, 2 * len(self._points), 1024)
+        for name in ["_cell_keys", "_points", "_counts"]:
+            old = getattr(self, name)
+            buffer = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            buffer[:self._size] = old[:self._size]
+            setattr(self, name, buffer)
+
+    def insert(self, points: np.ndarray) -> None:
+        """
+        Fuses points into the map.
+
+        :param points: Collection of n points, represented by an [n, 3] numpy matrix.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if len(points) == 0:
+            return
+
+        # Combine the new points cell by cell first
+        keys, inverse, counts = np.unique(self._keys(points), return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        sums = np.stack([np.bincount(inverse, weights=points[:, i], minlength=len(keys)) for i in range(3)], axis=1)
+
+        # Occupied cells keep a running average
+        cells, found = self._find(keys)
+        existing = cells[found]
+        total = self._counts[existing] + counts[found]
+        self._points[existing] = (self._points[existing] * self._counts[existing, None] + sums[found]) / total[:, None]
+        self._counts[existing] = total
+
+        # New cells are appended, and their (already sorted) keys merged into the run of recent keys
+        new = ~found
+        added = self._size + np.arange(np.count_nonzero(new))
+        self._reserve(self._size + len(added))
+        self._cell_keys[added] = keys[new]
+        self._points[added] = sums[new] / counts[new, None]
+        self._counts[added] = counts[new]
+        self._size += len(added)
+
+        slots = np.searchsorted(self._recent_keys, keys[new])
+        self._recent_keys = np.insert(self._recent_keys, slots, keys[new])
+        self._recent_cells = np.insert(self._recent_cells, slots, added)
+        if len(self._recent_keys) * _RECENT_FRACTION > len(self._sorted_keys):
+            slots = np.searchsorted(self._sorted_keys, self._recent_keys)
+            self._sorted_keys = np.insert(self._sorted_keys, slots, self._recent_keys)
+            self._sorted_cells = np.insert(self._sorted_cells, slots, self._recent_cells)
+            self._recent_keys, self._recent_cells = self._recent_keys[:0], self._recent_cells[:0]
+
+    def query(self, points: np.ndarray, max_distance: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        points = np.asarray(points, dtype=np.float64)
+        if len(self) == 0:
+            return np.full(len(points), np.inf), np.full(len(points), len(self))
+
+        # Each cell holds at most one point, so the closest of the (up to) 27 points around a query point is found
+        # by looking up every neighbouring cell at once
+        offsets = np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1]), axis=-1).reshape(-1, 3)
+        offsets = (offsets[:, 0] << (2 * _KEY_BITS)) + (offsets[:, 1] << _KEY_BITS) + offsets[:, 2]
+        candidates, found = self._find((self._keys(points)[:, None] + offsets).ravel())
+        candidates, found = candidates.reshape([-1, 27]), found.reshape([-1, 27])
+
+        squared_distances = np.sum((self.points[candidates] - points[:, None, :]) ** 2, axis=2)
+        squared_distances[~found] = np.inf
+        closest = np.argmin(squared_distances, axis=1)
+        rows = np.arange(len(points))
+        distances = np.sqrt(squared_distances[rows, closest])
+        indices = np.where(np.isfinite(distances), candidates[rows, closest], len(self))
+
+        # Points further than one cell away may have been missed, so only closer matches are reported
+        missing = distances > min(max_distance, self.voxel_size)
+        distances[missing], indices[missing] = np.inf, len(self)
+        return distances, indices
+
+
+class StreamingRegistration:
+    """
+    Registers a sequence of scan frames, each against a model fused from all of the frames before it.
+
+    Consecutive frames are expected to be close, so each registration starts from the previous frame's pose,
+    and the model is kept in a `VoxelMap` which new frames are fused into rather than rebuilt from.
+    Poses are relative to the first frame, which defines the model's coordinate space.
+    """
+
+    def __init__(
+        self,
+        voxel_size: float,
+        num_points: int = 1000,
+        iterations: int = 20,
+        epsilon: float = 1e-6,
+        **kwargs,
+    ):
+        """
+        :param voxel_size: Resolution of the fused model. Frames must move less than this between frames.
+        :param num_points: The number of points sampled from each frame for registration.
+        :param iterations: The maximum number of ICP iterations for each frame.
+        :param epsilon: Registration of a frame stops once a step is this close to the identity.
+        :param seed: (optional) Seed for the random sampling, for reproducible results.
+        :param rng: (optional) A numpy random number generator to sample with, takes precedence over `seed`.
+        :param kwargs: Additional options passed to `point_cloud_registration()`.
+        """
+        self.model = VoxelMap(voxel_size)
+        self.num_points = num_points
+        self.iterations = iterations
+        self.epsilon = epsilon
+        self.rng = kwargs.pop("rng", None) or np.random.default_rng(kwargs.pop("seed", None))
+        self.options = kwargs
+
+        self.pose = np.eye(4)
+        self.poses = []
+        self.elapsed = 0.0
+
+    @property
+    def frames_per_second(self) -> float:
+        """The number of frames registered (and fused) per second so far."""
+        return len(self.poses) / self.elapsed if self.elapsed > 0 else 0.0
+
+    @profiled("registration.frame")
+    def add_frame(self, points: np.ndarray) -> np.ndarray:
+        """
+        Registers a frame against the model, then fuses it into the model.
+
+        :param points: The frame's points in its own coordinate space, represented by an [n, 3] numpy matrix.
+        :return: The [4, 4] pose of the frame, which moves its points into the model's coordinate space.
+        """
+        start = time.perf_counter()
+        points = np.asarray(points, dtype=np.float64)
+
+        if len(self.model) > 0:
+            samples = points
+            if self.num_points < len(points):
+                samples = points[self.rng.choice(len(points), self.num_points, replace=False)]
+            self.pose, _ = point_cloud_registration(
+                samples, self.model.points, self.model,
+                self.pose, self.iterations, self.epsilon, **self.options
+            )
+
+        self.model.insert(points @ self.pose[:3, :3].T + self.pose[:3, 3])
+        self.poses.append(self.pose)
+        self.elapsed += time.perf_counter() - start
+        return self.pose
+
+
+def register_stream(frames, voxel_size: float, **kwargs) -> tuple[np.ndarray, float]:
+    """
+    Registers every frame of a sequence, see `StreamingRegistration`.
+
+    :param frames: An iterable of [n, 3] point matrices, in the order they were captured.
+    :param voxel_size: Resolution of the fused model.
+    :param kwargs: Additional options passed to `StreamingRegistration`.
+    :return: A pair ([len(frames), 4, 4] stack of frame poses, throughput in frames per second).
+    """
+    registration = StreamingRegistration(voxel_size, **kwargs)
+    for frame in frames:
+        registration.add_frame(frame)
+    return np.stack(registration.poses), registration.frames_per_second
@@ -1,6 +1,16 @@
 import random
 import unittest
+import numpy as np
 from .iterative_closest_point import *
+from .correspondence import build_index
+from .sampling import SurfaceSampler, cached_sampler
+from .animation import cumulative_transformations, matrix_to_quaternions
+from .robust import reject_outliers
+from .deviation import deviation_distances, deviation_summary, deviation_colors
+from .multiview import multiview_registration, neighbour_pairs, pose_graph_optimization
+from .streaming import VoxelMap, register_stream
+from .assembly import assembly_registration
+from .benchmark import benchmark_mesh, random_rigid_transformation, run_case
 from data import primitives, meshes
 import mathutils
 
@@ -58,6 +68,296 @@ class TestRegistration(unittest.TestCase):
         estimated_transformation = net_transformation(registration_transformations)
         self.assertSimilarTransformations(transformation, estimated_transformation)
 
+    def test_benchmark_case(self):
+        rng = np.random.default_rng(0)
+        transformation = random_rigid_transformation(0.01, rng)
+        result = run_case(
+            benchmark_mesh(), transformation, noise=0.0, rng=rng,
+            k=2.5, num_points=4096, iterations=100, epsilon=0.0005, distance_metric="POINT_TO_POINT",
+        )
+
+        self.assertIsNone(result["error"])
+        self.assertLess(result["iterations"], 100)
+        self.assertAlmostEqual(result["rotation_error"], 0, 1, "Rotation error should be low")
+        self.assertAlmostEqual(result["translation_error"], 0, 3, "Translation error should be low")
+
+    def test_global_initialization(self):
+        # Far too large a rotation for ICP to recover from on its own
+        rng = np.random.default_rng(0)
+        transformation = random_rigid_transformation(2.0, rng)
+        result = run_case(
+            benchmark_mesh(1), transformation, noise=0.0, rng=rng,
+            k=2.5, num_points=4096, iterations=100, epsilon=0.0005, distance_metric="POINT_TO_POINT",
+            global_initialization=True,
+        )
+
+        self.assertIsNone(result["error"])
+        self.assertTrue(result["global_initialization"])
+        self.assertLess(result["iterations"], 100, "The global step shouldn't count as an ICP iteration")
+        self.assertTrue(np.isfinite(result["global_rotation_error"]), "The global step should be reported separately")
+        self.assertLess(result["rotation_error"], 1.0, "Global initialization should find the right orientation")
+        self.assertAlmostEqual(result["translation_error"], 0, 2, "Translation error should be low")
+
+    def test_correspondence_backends(self):
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-1, 1, size=[2000, 3])
+        queries = points[:500] + rng.normal(scale=0.01, size=[500, 3])
+        expected_distances, expected_indices = build_index(points, "KDTREE").query(queries)
+
+        for backend in ["CKDTREE", "VOXEL_HASH"]:
+            distances, indices = build_index(points, backend).query(queries)
+            found = np.isfinite(distances)
+            self.assertGreater(np.count_nonzero(found), 0, f"{backend} should find some neighbours")
+            self.assertTrue(np.all(indices[found] == expected_indices[found]), f"{backend} should find the nearest point")
+            self.assertTrue(np.all(indices[~found] == len(points)), f"{backend} should mark missing neighbours")
+
+    def test_area_sampling(self):
+        # A unit square split along its diagonal, so samples should fall evenly either side of it
+        vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=float)
+        sampler = SurfaceSampler(vertices, np.array([[0, 1, 2], [0, 2, 3]]))
+        rng = np.random.default_rng(0)
+
+        for strategy in ["AREA", "STRATIFIED", "NORMAL_SPACE"]:
+            points, normals = sampler.sample(4000, strategy, rng)
+            self.assertEqual(points.shape, (4000, 3))
+            self.assertTrue(np.all((points >= 0) & (points <= 1)), f"{strategy} samples should lie on the surface")
+            self.assertAlmostEqual(np.mean(points[:, 0] > points[:, 1]), 0.5, 1, "Samples should be spread by area")
+            self.assertTrue(np.allclose(np.abs(normals[:, 2]), 1), "Normals should be those of the sampled faces")
+
+        # Sampling with the same seed should produce the same points
+        a, _ = sampler.sample(10, "AREA", np.random.default_rng(1))
+        b, _ = sampler.sample(10, "AREA", np.random.default_rng(1))
+        self.assertTrue(np.array_equal(a, b))
+
+    def test_batched_rigid_transformations(self):
+        rng = np.random.default_rng(0)
+        expected = np.stack([
+            np.asarray(mathutils.Matrix.Translation(rng.uniform(-1, 1, size=3)) @
+                       mathutils.Matrix.Rotation(rng.uniform(-1, 1), 4, mathutils.Vector(rng.normal(size=3))))
+            for _ in range(NUM_TESTS)
+        ])
+        source_points = rng.normal(size=[NUM_TESTS, 100, 3])
+        destination_points = source_points @ np.swapaxes(expected[:, :3, :3], 1, 2) + expected[:, None, :3, 3]
+
+        estimated = rigid_transformations(source_points, destination_points)
+        self.assertEqual(estimated.shape, (NUM_TESTS, 4, 4))
+        self.assertTrue(np.allclose(estimated, expected), "Every transformation in the batch should be recovered")
+
+        # The batched solution should match the one-at-a-time solution
+        for i in range(NUM_TESTS):
+            self.assertSimilarTransformations(
+                point_to_point_transformation(source_points[i], destination_points[i]), mathutils.Matrix(expected[i])
+            )
+
+    def test_masked_sampling(self):
+        # Two separate unit squares, only the second is in the region of interest
+        square = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=float)
+        vertices = np.concatenate([square, square + [5, 0, 0]])
+        triangles = np.array([[0, 1, 2], [0, 2, 3], [4, 5, 6], [4, 6, 7]])
+        mask = np.arange(8) >= 4
+        sampler = SurfaceSampler(vertices, triangles, mask)
+        rng = np.random.default_rng(0)
+
+        for strategy in ["VERTICES", "AREA"]:
+            points, _ = sampler.sample(100, strategy, rng)
+            self.assertTrue(np.all(points[:, 0] >= 5), f"{strategy} samples should lie within the region")
+
+        with self.assertRaises(Exception):
+            SurfaceSampler(vertices, triangles, np.zeros(8, dtype=bool))
+
+        # A mask read before the mesh was edited no longer lines up with its vertices
+        with self.assertRaises(Exception):
+            SurfaceSampler(vertices, triangles, mask[:6])
+
+    def test_cached_sampler(self):
+        sampler = cached_sampler(primitives.CUBE)
+        self.assertIs(cached_sampler(primitives.CUBE), sampler, "An unchanged mesh should reuse its sampler")
+        self.assertIsNot(cached_sampler(primitives.CUBE, np.arange(8) < 4), sampler)
+
+        # Moving a copy leaves the cached sampler where it was
+        moved = sampler.copy()
+        moved.transform(np.array(mathutils.Matrix.Translation((1, 0, 0))))
+        self.assertTrue(np.allclose(moved.vertices, sampler.vertices + [1, 0, 0]))
+
+    def test_animation_poses(self):
+        rng = np.random.default_rng(0)
+        steps = [
+            mathutils.Matrix.Rotation(rng.uniform(-1, 1), 4, mathutils.Vector(rng.normal(size=3)))
+            for _ in range(NUM_TESTS)
+        ]
+        initial = mathutils.Matrix.Translation([1, 2, 3])
+
+        poses = cumulative_transformations(steps, initial)
+        self.assertEqual(poses.shape, (NUM_TESTS + 1, 4, 4))
+        self.assertTrue(np.allclose(poses[-1], np.asarray(net_transformation(steps) @ initial)))
+
+        quaternions = matrix_to_quaternions(poses[:, :3, :3])
+        for pose, q in zip(poses, quaternions):
+            difference = mathutils.Matrix(pose).to_quaternion().rotation_difference(mathutils.Quaternion(q))
+            self.assertAlmostEqual(difference.angle, 0, 5, "Quaternions should match the rotations")
+        self.assertTrue(np.all(np.sum(quaternions[1:] * quaternions[:-1], axis=1) >= 0), "Keys should not flip sign")
+
+    def test_quaternions_near_half_turns(self):
+        # Half turns about random axes (2aa^T - I), with the rounding noise left behind by an SVD
+        rng = np.random.default_rng(0)
+        axes = rng.normal(size=[1000, 3])
+        axes /= np.linalg.norm(axes, axis=1, keepdims=True)
+        rotations = 2 * axes[:, :, None] * axes[:, None, :] - np.eye(3) + rng.normal(scale=1e-12, size=[1000, 3, 3])
+        u, _, vt = np.linalg.svd(rotations)
+        rotations = u @ vt
+
+        for rotation, q in zip(rotations, matrix_to_quaternions(rotations)):
+            rebuilt = np.array(mathutils.Quaternion(q).to_matrix())
+            self.assertTrue(np.allclose(rebuilt, rotation, atol=1e-6), "Quaternions should match half turns")
+
+    def test_robust_rejection(self):
+        rng = np.random.default_rng(0)
+        distances = np.concatenate([rng.uniform(0, 0.01, size=900), rng.uniform(1, 2, size=100)])
+
+        kept, weights = reject_outliers(distances, "TRIMMED", overlap=0.9)
+        self.assertEqual(len(kept), 900)
+        self.assertIsNone(weights)
+        self.assertTrue(np.all(kept < 900), "Trimming should keep only the closest point-pairs")
+
+        kept, weights = reject_outliers(distances, "TUKEY")
+        self.assertTrue(np.all(kept < 900), "Tukey weights should ignore distant point-pairs")
+
+        kept, weights = reject_outliers(distances, "HUBER")
+        self.assertEqual(len(kept), len(distances))
+        self.assertTrue(np.all(weights[900:] < weights[:900].min()), "Huber weights should favour close pairs")
+
+    def test_deviation(self):
+        rng = np.random.default_rng(0)
+        destination = rng.uniform(-1, 1, size=[500, 3])
+        normals = np.tile([0.0, 0.0, 1.0], (500, 1))
+
+        # Points offset from the destination only along the normal deviate by that offset under either metric
+        offsets = rng.uniform(0, 0.001, size=500)
+        source = destination + offsets[:, None] * normals
+        for metric in ["POINT_TO_POINT", "POINT_TO_PLANE"]:
+            distances = deviation_distances(source, destination, normals, metric)
+            np.testing.assert_allclose(distances, offsets, atol=1e-9)
+
+        # Sliding within the tangent plane isn't counted by the point-to-plane metric
+        distances = deviation_distances(destination + [0.0005, 0, 0], destination, normals, "POINT_TO_PLANE")
+        np.testing.assert_allclose(distances, 0, atol=1e-9)
+
+        summary = deviation_summary(offsets)
+        self.assertAlmostEqual(summary["p50"], np.median(offsets))
+        self.assertAlmostEqual(summary["max"], offsets.max())
+        self.assertLessEqual(summary["p90"], summary["p99"])
+        self.assertEqual(deviation_colors(offsets, summary["p99"]).shape, (500, 4))
+
+    def test_multiview_registration(self):
+        # Copies of the same surface, each slightly misplaced (except the anchor)
+        rng = np.random.default_rng(0)
+        surface = SurfaceSampler.from_bmesh(benchmark_mesh(1))
+        poses = [np.eye(4)] + [
+            np.asarray(random_rigid_transformation(0.02, rng)) for _ in range(NUM_TESTS // 2)
+        ]
+        samplers = [SurfaceSampler(surface.vertices @ p[:3, :3].T + p[:3, 3], surface.triangles) for p in poses]
+
+        corrections = multiview_registration(samplers, num_points=2000, iterations=100, seed=0)
+        for correction, pose in zip(corrections, poses):
+            self.assertTrue(np.allclose(correction @ pose, np.eye(4), atol=1e-3), "Every scan should be registered")
+
+    def test_pose_graph_loop_closure(self):
+        rng = np.random.default_rng(0)
+        poses = np.stack([np.eye(4)] + [
+            np.asarray(random_rigid_transformation(0.5, rng)) for _ in range(NUM_TESTS - 1)
+        ])
+        pairs = neighbour_pairs(NUM_TESTS, neighbours=2)
+        self.assertEqual(len(pairs), 2 * NUM_TESTS)
+
+        # Consistent pairwise transformations should give back the original poses exactly
+        relative = np.stack([poses[j] @ np.linalg.inv(poses[i]) for i, j in pairs])
+        corrections = pose_graph_optimization(NUM_TESTS, pairs, relative)
+        self.assertTrue(np.allclose(corrections, np.linalg.inv(poses)))
+
+        # An error in one pair should be spread around the loop rather than kept in one place
+        relative[0, :3, 3] += 0.1
+        corrections = pose_graph_optimization(NUM_TESTS, pairs, relative)
+        errors = np.linalg.norm(corrections[:, :3, 3] - np.linalg.inv(poses)[:, :3, 3], axis=1)
+        self.assertLess(errors.max(), 0.1)
+
+    def test_voxel_map(self):
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-1, 1, size=[3000, 3])
+        voxel_map = VoxelMap(0.1)
+        voxel_map.insert(points[:1500])
+        voxel_map.insert(points[1500:])
+        self.assertEqual(voxel_map.counts.sum(), len(points), "Every point should be fused into some cell")
+        self.assertEqual(len(np.unique(voxel_map.keys)), len(voxel_map), "Each cell should be fused into once")
+
+        # Matches within one cell should be the true nearest fused point
+        queries = rng.uniform(-1, 1, size=[500, 3])
+        distances, indices = voxel_map.query(queries)
+        expected_distances, expected_indices = build_index(voxel_map.points, "CKDTREE").query(queries)
+        found = np.isfinite(distances)
+        self.assertTrue(np.all(indices[found] == expected_indices[found]))
+        self.assertTrue(np.all(expected_distances[~found] >= 0.1 - 1e-9))
+
+    def test_streaming_registration(self):
+        # A camera slowly circling the mesh, each frame seeing a fresh set of surface samples
+        rng = np.random.default_rng(0)
+        surface = SurfaceSampler.from_bmesh(benchmark_mesh(1))
+        poses = [np.eye(4)]
+        for _ in range(2 * NUM_TESTS):
+            step = np.asarray(mathutils.Matrix.Rotation(0.02, 4, 'Z') @ random_rigid_transformation(0.005, rng))
+            poses.append(step @ poses[-1])
+        frames = []
+        for pose in poses:
+            points, _ = surface.sample(5000, "AREA", rng)
+            frames.append((points - pose[:3, 3]) @ pose[:3, :3])
+
+        estimated, frames_per_second = register_stream(frames, voxel_size=0.05, seed=0)
+        self.assertEqual(estimated.shape, (len(poses), 4, 4))
+        self.assertGreater(frames_per_second, 0)
+        self.assertTrue(np.allclose(estimated, poses, atol=0.05), "Every frame's pose should be recovered")
+
+    def test_assembly_registration(self):
+        # Two separate copies of a mesh, each misplaced differently, with the destination's parts listed in reverse
+        rng = np.random.default_rng(0)
+        surface = SurfaceSampler.from_bmesh(benchmark_mesh(1))
+        n = len(surface.vertices)
+        vertices = np.concatenate([surface.vertices, surface.vertices * 0.5 + [4, 0, 0]])
+        triangles = np.concatenate([surface.triangles, surface.triangles + n])
+        labels = np.repeat([0, 1], n)
+
+        moves = [np.asarray(random_rigid_transformation(0.02, rng)) for _ in range(2)]
+        moved = np.concatenate([
+            vertices[labels == part] @ moves[part][:3, :3].T + moves[part][:3, 3] for part in [1, 0]
+        ])
+        order = np.concatenate([np.flatnonzero(labels == 1), np.flatnonzero(labels == 0)])
+        moved_triangles = np.argsort(order)[triangles]
+
+        transformations, pairs = assembly_registration(
+            vertices, triangles, labels, moved, moved_triangles, 1 - labels[order],
+            num_points=2000, iterations=100, seed=0
+        )
+        self.assertEqual(sorted(pairs), [(0, 1), (1, 0)], "Parts should be paired by position and size")
+        for part in [0, 1]:
+            self.assertTrue(np.allclose(transformations[part], moves[part], atol=1e-3))
+
+    def test_assembly_region_of_interest(self):
+        # Only the first part is in the source's region of interest, so the second shouldn't move
+        rng = np.random.default_rng(0)
+        surface = SurfaceSampler.from_bmesh(benchmark_mesh(1))
+        n = len(surface.vertices)
+        vertices = np.concatenate([surface.vertices, surface.vertices * 0.5 + [4, 0, 0]])
+        triangles = np.concatenate([surface.triangles, surface.triangles + n])
+        labels = np.repeat([0, 1], n)
+
+        move = np.asarray(random_rigid_transformation(0.02, rng))
+        moved = vertices @ move[:3, :3].T + move[:3, 3]
+        transformations, _ = assembly_registration(
+            vertices, triangles, labels, moved, triangles, labels,
+            num_points=2000, iterations=100, seed=0, correspondence_backend="VOXEL_HASH",
+            source_mask=labels == 0
+        )
+        self.assertTrue(np.allclose(transformations[0], move, atol=1e-3))
+        self.assertTrue(np.allclose(transformations[1], np.eye(4)), "Parts outside the region should be left alone")
+
     # TODO: Add unit tests for ICP
 
     # HINT: You can generate test-cases by applying a random transformation to a mesh
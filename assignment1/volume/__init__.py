@@ -1,5 +1,4 @@
 from .volume import *
-from .test import *
 
 import bpy
 import bmesh
@@ -28,6 +27,15 @@ class MeshVolume(bpy.types.Panel):
         bmesh.ops.transform(bm, matrix=context.active_object.matrix_world, verts=bm.verts)
         
         # TODO: Show the computed volume using a label
-        self.layout.label(text=f'Volume: {mesh_volume(bm):.2f} cubic units')
+        volume = mesh_volume(bm)
+        self.layout.label(text=f'Volume: {volume:.2f} cubic units')
+
+        # -1 on its own doesn't say what's wrong with the mesh
+        if volume == -1:
+            from ..analysis.snapshot import MeshSnapshot
+            from ..analysis.topology import analyse_snapshot
+            reason = analyse_snapshot(MeshSnapshot.from_mesh(context.active_object.data))["volume_reason"]
+            if reason:
+                self.layout.label(text=reason, icon='INFO')
 
 
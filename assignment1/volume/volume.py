@@ -1,5 +1,7 @@
 import bmesh
 
+from ..performance.profiling import profiled
+
 
 def is_mesh_closed(mesh):
     edge_face_count = {}
@@ -10,6 +12,7 @@ def is_mesh_closed(mesh):
     # If any edge is linked to fewer than or more than 2 faces, the mesh is open
     return all(count == 2 for count in edge_face_count.values())
 
+@profiled("volume")
 def mesh_volume(mesh: bmesh.types.BMesh) -> float:
     """
     Finds the volume of the mesh.
@@ -0,0 +1,19 @@
+# This should be invoked with the following command line (or equivalent)
+# blender --background --python benchmark.py
+import os
+import sys
+
+# Blender will actually run this in another directory, so we need to make sure everything is available to import
+sys.path.append(os.path.dirname(__file__))
+
+# Make sure we have the packages we need
+from dependencies import install_missing_requirements
+install_missing_requirements()
+
+from assignment1.registration.benchmark import run_benchmark, pareto_front, format_results
+
+results = run_benchmark()
+print(format_results(results))
+
+print("\nPareto front (time vs. rotation error):")
+print(format_results(pareto_front(results, cost="time", error="rotation_error")))
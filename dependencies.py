@@ -0,0 +1,43 @@
+# Shared by run.py, test.py and benchmark.py
+# Blender comes with its own copy of Python, so it needs to install the requirements itself.
+# Running pip on every launch is slow, so only missing (or outdated) packages are installed.
+import os
+import subprocess
+import sys
+from importlib import metadata
+
+try:
+    from packaging.requirements import Requirement
+except ImportError:
+    # Blender's Python doesn't always come with packaging, but pip carries its own copy
+    from pip._vendor.packaging.requirements import Requirement
+
+
+def missing_requirements(path: str = f"{os.path.dirname(__file__)}/requirements.txt") -> list[str]:
+    """
+    :param path: A pip requirements file.
+    :return: The requirements which aren't installed, or are installed at a version they don't allow.
+    """
+    missing = []
+    with open(path) as file:
+        for line in file:
+            requirement = line.split("#")[0].strip()
+            if not requirement:
+                continue
+            parsed = Requirement(requirement)
+            if parsed.marker is not None and not parsed.marker.evaluate():
+                continue
+            try:
+                version = metadata.version(parsed.name)
+            except metadata.PackageNotFoundError:
+                missing.append(requirement)
+                continue
+            if not parsed.specifier.contains(version, prereleases=True):
+                missing.append(requirement)
+    return missing
+
+
+def install_missing_requirements():
+    missing = missing_requirements()
+    if missing:
+        subprocess.check_call([sys.executable, "-m", "pip", "install", *missing])
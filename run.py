@@ -10,9 +10,9 @@ sys.path.append(os.path.dirname(__file__))
 # This is necessary because Blender comes with its own copy of Python
 # running `pip install -r requirements.txt` should enable code-completion in your IDE,
 # but Blender needs to install the requirements itself.
-import pip
+from dependencies import install_missing_requirements
 
-pip.main(["install", "-r", f"{os.path.dirname(__file__)}/requirements.txt"])
+install_missing_requirements()
 
 # Add your plugins to the Blender UI
 import assignment1
@@ -7,8 +7,8 @@ import sys
 sys.path.append(os.path.dirname(__file__))
 
 # Make sure we have the packages we need
-import pip
-pip.main(['install', '-r', f'{os.path.dirname(__file__)}/requirements.txt'])
+from dependencies import install_missing_requirements
+install_missing_requirements()
 
 # Dealing with contested command line parameters
 # see: https://blender.stackexchange.com/questions/267812/blender-doesnt-recognize-python-as-a-command-line-argument
@@ -16,6 +16,13 @@ argv = [__file__]
 if "--" in sys.argv:
     argv += sys.argv[sys.argv.index("--") + 1:]
 
-# Import your package & run its unit tests
-from assignment1 import *
+# Import your package's unit tests & run them
+import unittest
+from assignment1.genus.test import *
+from assignment1.boundaries.test import *
+from assignment1.volume.test import *
+from assignment1.components.test import *
+from assignment1.registration.test import *
+from assignment1.analysis.test import *
+from assignment1.performance.test import *
 unittest.main(argv=argv)